@@ -1,25 +1,53 @@
 # app.py
+import os
+import json
 import random
 import streamlit as st
-from pathlib import Path
-from utils.auth_utils import login_user, register_user, get_user_by_username
-from utils.vocab_utils import search_vocab_for_user, get_vocab_by_id, mark_word_confirmation, schedule_next_repetition, get_due_for_user, add_user_vocab
-from utils.llm_utils import generate_passage_with_blanks, correct_sentence_with_llm, generate_passage_with_chunks, save_chunks_for_user
-from utils.tts_utils import tts_button, tts_chunk_button, tts_passage_button
+import streamlit.components.v1 as components
+from utils.auth_utils import hash_password, create_user, get_user_by_username, get_password_hash, check_password, issue_session_token, resume_session, get_session_version, revoke_sessions, SESSION_COOKIE, SESSION_TTL
+from utils.vocab_utils import search_vocab_for_user, mark_word_confirmation, mark_words_learned, record_review_session, get_due_for_user, add_user_vocab, get_user_words
+from utils.llm_utils import stream_passage_with_blanks, correct_sentences_with_llm, stream_passage_with_chunks, extract_chunks, save_chunks_for_user, get_chunk_topics, search_chunks_for_user, create_fill_in_blank
+from utils.passage_pool import passage_pool
+from utils.write_behind import get_write_behind
+from utils.tts_utils import tts_buttons, tts_passage_button, tts_player
 # from utils.state_utils import get_state
-from database import get_pg_conn
+from database import pg_conn, pool_stats
+from utils.tracing import span, tagged, start_exporters
+from utils.warmup import start_warmup
 
 
 def main():
+    start_exporters()   # /metrics (METRICS_PORT) and periodic span summaries, once per process
+    start_warmup()      # WARMUP=1: pool, vocab index and LLM client load while the login screen shows
     st.set_page_config(page_title="Personal English Vocab App")
     st.title("Personalized English Vocab App")
 
     # Simple session
     if "username" not in st.session_state:
-        st.session_state["username"] = None
+        # a signed token in a cookie resumes the session after a refresh without bcrypt;
+        # ?session= links from before the cookie are accepted once and moved into it
+        url_token = st.query_params.get("session")
+        token = url_token or st.context.cookies.get(SESSION_COOKIE)
+        st.query_params.pop("session", None)             # never leave a token in the URL
+        username = None
+        if token:
+            with pg_conn() as conn:
+                username = resume_session(conn, token)   # expired / revoked / deleted user -> None
+            if username is None:
+                st.session_state["session_cookie"] = ("", 0)
+            elif url_token:
+                st.session_state["session_cookie"] = (token, SESSION_TTL)
+        st.session_state["username"] = username
+
+    # cookie changes queued by the previous run (login / logout end with st.rerun)
+    cookie = st.session_state.pop("session_cookie", None)
+    if cookie is not None:
+        set_session_cookie(*cookie)
 
     # --- Auth ---
     if not st.session_state["username"]:
+        if st.session_state.pop("signed_out_everywhere", False):
+            st.sidebar.info("Signed out on all your devices.")
         st.sidebar.header("Login / Register")
         action = st.sidebar.selectbox("Action", ["Login", "Register"])
         with st.sidebar.form("auth_form"):
@@ -27,32 +55,105 @@ def main():
             password = st.text_input("Password", type="password")
             submitted = st.form_submit_button("Submit")
             if submitted:
-                conn = get_pg_conn()
+                if action == "Register":
+                    new_hash = hash_password(password)   # bcrypt before borrowing a conn
+                with pg_conn() as conn:
+                    if action == "Login":
+                        pw_hash = get_password_hash(conn, username)
+                        version = get_session_version(conn, username)
+                    else:
+                        created = create_user(conn, username, new_hash)
+                # conn is back in the pool before st.rerun() interrupts the script
                 if action == "Login":
-                    ok = login_user(conn, username, password)
+                    ok = pw_hash is not None and check_password(password, pw_hash)   # bcrypt without holding a conn
                     if ok:
                         st.session_state["username"] = username
+                        st.session_state["session_cookie"] = (issue_session_token(username, version), SESSION_TTL)
                         st.success("Logged in as " + username)
                         st.rerun() # force to enter the menu board
                     else:
                         st.error("Invalid credentials")
                 else:
-                    created = register_user(conn, username, password)
                     if created:
                         st.success("User created. Please login.")
                     else:
                         st.error("Could not create user (maybe exists)")
-                conn.close()
         st.stop()
 
     username = st.session_state["username"]
     st.sidebar.success(f"Signed in: {username}")
-    conn = get_pg_conn()
-    user = get_user_by_username(conn, username)
-    user_id = user['id']
-
+    if st.sidebar.button("Log out", help="Signs you out on every device and browser"):
+        with pg_conn() as conn:
+            revoke_sessions(conn, username)   # every token of the user stops working
+        st.session_state["signed_out_everywhere"] = True
+        log_out()
+    if os.environ.get("DB_POOL_STATS"):
+        with st.sidebar.expander("DB pool"):
+            st.json(pool_stats())
+        if get_write_behind() is not None:
+            with st.sidebar.expander("Write-behind queue"):
+                st.json(get_write_behind().metrics())
+
+    # Pages borrow a pooled connection per query block (`with pg_conn() as conn:`)
+    # and never hold one across LLM or TTS calls; a connection goes back to the
+    # pool even when Streamlit interrupts the script (st.rerun / st.stop).
+    with span("rerun"):
+        with pg_conn() as conn:
+            user = get_user_by_username(conn, username)
+        if user is None:   # account deleted since login
+            log_out()
+        render_pages(user['id'])
+
+
+def log_out():
+    st.session_state["username"] = None
+    st.session_state["session_cookie"] = ("", 0)
+    st.query_params.pop("session", None)
+    st.rerun()
+
+
+def set_session_cookie(token: str, max_age: int):
+    """Store the session token in the browser's cookie (max_age=0 deletes it); read back via st.context.cookies."""
+    cookie = f"{SESSION_COOKIE}={token}; path=/; max-age={max_age}; SameSite=Strict"
+    components.html(
+        f"<script>parent.document.cookie = {json.dumps(cookie)}"
+        " + (parent.location.protocol === 'https:' ? '; Secure' : '');</script>",
+        height=0,
+    )
+
+
+def paged(rows, key: str, page_size: int = 100):
+    """Slice of `rows` for the page picked in a small page selector."""
+    pages = max(1, -(-len(rows) // page_size))
+    if pages == 1:
+        st.caption(f"{len(rows)} words")
+        return rows
+    page = st.number_input(f"Page (of {pages}, {len(rows)} words)", 1, pages, 1, key=f"{key}-page")
+    return rows[(page - 1) * page_size: page * page_size]
+
+
+def chunk_page(user_id: int, key: str, page_size: int = 20, **filters):
+    """One page of search_chunks_for_user(), with a page selector when there is more than one."""
+    page_key = f"{key}-{sorted(filters.items())}-page"   # a new query or topic starts at page 1
+    page = st.session_state.get(page_key, 1)
+    with pg_conn() as conn:
+        rows, total = search_chunks_for_user(conn, user_id, limit=page_size, offset=(page - 1) * page_size, **filters)
+    pages = max(1, -(-total // page_size))
+    if pages > 1:
+        st.number_input(f"Page (of {pages}, {total} chunks)", 1, pages, key=page_key)
+    elif rows:
+        st.caption(f"{total} chunks")
+    return rows
+
+
+def render_pages(user_id: int):
     menu = st.sidebar.radio("Menu", [ "Search / Browse", "Study", "Spaced Review", "My Words", "LLM Passage", "LLM Chunks"])
+    # every span inside (queries, LLM calls) is tagged with the page and user
+    with tagged(page=menu, user=user_id), span("page"):
+        render_menu(user_id, menu)
 
+
+def render_menu(user_id: int, menu: str):
     if menu == "Search / Browse":
         st.header("Browse Vocabulary")
         
@@ -63,48 +164,48 @@ def main():
         with st.expander("Filter options"):
             min_rank, max_rank = st.slider("Rank range", 1, 5000, (1, 100))   # adjust max as needed
             syll_filter = st.number_input("Syllables (leave 0 for any)", min_value=0, step=1, value=0)
-            limit = st.slider("Max results", 10, 200, 30)
+            limit = st.slider("Results per page", 10, 200, 30)
         
         filter_key = (q.strip(), min_rank, max_rank, syll_filter, limit)
 
-        if "last_filter" not in st.session_state or st.session_state.last_filter != filter_key:
-            st.session_state.rows = search_vocab_for_user(
-                conn, 
-                user_id,
-                query=q if q.strip() else None,
-                limit=limit,
-                min_rank=None if q.strip() else min_rank,
-                max_rank=None if q.strip() else max_rank,
-                syll_filter=syll_filter if syll_filter > 0 else None
-            )
+        # Keyset paging: ("after" | "before", cursor) or None for the first page
+        if st.session_state.get("last_filter") != filter_key:
             st.session_state.last_filter = filter_key
+            st.session_state.browse_cursor = None
+            st.session_state.pop("page_key", None)
+        cursor = st.session_state.get("browse_cursor")
+        page_key = (filter_key, cursor)
+
+        if st.session_state.get("page_key") != page_key:
+            with pg_conn() as conn:
+                st.session_state.page = search_vocab_for_user(
+                    conn,
+                    user_id,
+                    query=q if q.strip() else None,
+                    limit=limit,
+                    min_rank=None if q.strip() else min_rank,
+                    max_rank=None if q.strip() else max_rank,
+                    syll_filter=syll_filter if syll_filter > 0 else None,
+                    after=cursor[1] if cursor and cursor[0] == "after" else None,
+                    before=cursor[1] if cursor and cursor[0] == "before" else None,
+                )
+            st.session_state.page_key = page_key
 
-        rows = st.session_state.rows
-        
-        # 🔍 Apply extra filtering in Python (simpler than rewriting SQL for now)
-        filtered_rows = []
-        for r in rows:
-            wid, word, phon, ex, rank, syll = r
-            
-            # only apply Python-side rank filter if query is empty
-            if not q.strip():
-                if rank is None or not (min_rank <= rank <= max_rank):
-                    continue
-            
-            # syllable filter applies in both cases
-            if syll_filter != 0 and (not syll or int(syll) != syll_filter):
-                continue
-            
-            filtered_rows.append(r)
+        page = st.session_state.page
+        rows = page.rows
+        st.caption(f"≈ {page.total_estimate} matching words")
         
         # Track which words are already added
         if "added_words" not in st.session_state:
             st.session_state.added_words = set()
 
+        # 🔊 One pronunciation widget for the whole page of results
+        tts_buttons([r[1] for r in rows])
+
         # 📊 Display results
-        for r in filtered_rows:
+        for r in rows:
             wid, word, phon, ex, rank, syll = r
-            cols = st.columns([1.2, .5, 1.5, 2.5, 1, .5])
+            cols = st.columns([1.2, .5, 1.5, 2.5, 1])
             cols[0].write(f"**{word}**")
             cols[1].write(f"**{rank}**")
             cols[2].write(f"`{phon}`" if phon else "")
@@ -114,14 +215,20 @@ def main():
             disabled = wid in st.session_state.added_words
 
             if cols[4].button("Add to my list", key=f"add-{wid}", disabled=disabled):
-                add_user_vocab(conn, user_id, wid)
+                with pg_conn() as conn:
+                    add_user_vocab(conn, user_id, wid)
                 st.session_state.added_words.add(wid)  # mark as added
                 st.toast(f"✅ {word} added to your list")
                 # st.success(f"Added {word} to your learning list")
-            # with cols[5]:
-            #     tts_button(word, key=f"tts-{wid}")
-            with cols[5]:
-                tts_button(word, wid)
+
+        # ◀ ▶ page navigation
+        nav = st.columns([1, 1, 4])
+        if nav[0].button("◀ Previous", disabled=page.prev_cursor is None):
+            st.session_state.browse_cursor = ("before", page.prev_cursor)
+            st.rerun()
+        if nav[1].button("Next ▶", disabled=page.next_cursor is None):
+            st.session_state.browse_cursor = ("after", page.next_cursor)
+            st.rerun()
 
 
     elif menu == "LLM Passage":
@@ -135,12 +242,28 @@ def main():
             "Select level",
             ["B1 (Easy)", "B2 (Medium)", "C1-C2 (Hard)"]
         )
+        words_length = length * 20
+        targets = [t.strip() for t in target_words.split(",") if t.strip()]
+        if not targets and not st.session_state.get("passage_pool_primed"):
+            # first visit this session: get passages for the settings on screen ready before the first click
+            passage_pool.refill(user_id, level, words_length, num_blanks)
+            st.session_state["passage_pool_primed"] = True
+        streamed = False
         if st.button("Generate passage"):
-            targets = [t.strip() for t in target_words.split(",") if t.strip()]
-            words_length = length * 20
-            passage, answers = generate_passage_with_blanks(
-                conn, user_id, targets, length=words_length, blanks=num_blanks, level=level
-            )
+            ready = None if targets else passage_pool.pop(user_id, level, words_length, num_blanks)
+            if ready:
+                passage, answers = create_fill_in_blank(ready[0], ready[1], blanks=num_blanks)
+            else:
+                # stream the passage in as Gemini writes it (blanks are applied on the fly)
+                st.write("### Passage")
+                answers = []
+                passage = st.write_stream(stream_passage_with_blanks(
+                    None, user_id, targets, length=words_length, blanks=num_blanks, level=level, answers=answers
+                ))
+                streamed = True
+            if not targets:
+                # after a pool hit or miss, get the next passage for these settings ready in the background
+                passage_pool.refill(user_id, level, words_length, num_blanks)
 
             # Save to session_state
             st.session_state["passage"] = passage
@@ -151,8 +274,9 @@ def main():
 
         # If passage exists, show it
         if "passage" in st.session_state:
-            st.write("### Passage")
-            st.write(st.session_state["passage"])
+            if not streamed:
+                st.write("### Passage")
+                st.write(st.session_state["passage"])
 
             st.write("### Options (shuffled)")
             st.write(", ".join(st.session_state["options"]))
@@ -174,77 +298,98 @@ def main():
 
     elif menu == "Study":
         st.header("Study - practice words")
-        due = get_due_for_user(conn, user_id, limit=10)
+        with pg_conn() as conn:
+            due = get_due_for_user(conn, user_id, limit=10)
         st.write("Words due for practice:")
         if not due:
             st.info("No words due now. Add words in Browse or My Words.")
+        # One LLM request for every written sentence instead of one per word
+        if due and st.button("Ask LLM to correct all written sentences"):
+            written = [(row[1], row[2], st.session_state.get(f"sent-{row[1]}", "")) for row in due]
+            written = [(v_id, word, sent) for v_id, word, sent in written if sent.strip()]
+            if not written:
+                st.warning("Write a sentence first")
+            else:
+                results = correct_sentences_with_llm([(word, sent) for _, word, sent in written])
+                corrections = st.session_state.setdefault("corrections", {})
+                for (v_id, _, _), res in zip(written, results):
+                    corrections[v_id] = res
+        corrections = st.session_state.get("corrections", {})
+        tts_player([row[2] for row in due], key="study-audio")
         for row in due:
             uid, v_id, word, phon, example, rep_count, appearances = row
             st.subheader(word)
-            # tts_player(word)
             st.write(f"Phonetic: `{phon}`")
             st.write("Example:", example)
             st.write(f"Repetition count: {rep_count}, appearances: {appearances}")
             sentence = st.text_area(f"Write a sentence using '{word}'", key=f"sent-{v_id}")
-            if st.button("Ask LLM to correct", key=f"corr-{v_id}"):
-                if sentence.strip() == "":
-                    st.warning("Write a sentence first")
-                else:
-                    corrected = correct_sentence_with_llm(sentence)
-                    st.write("**Corrected sentence:**")
-                    st.write(corrected)
-            if st.button("Mark as seen (increase repetition)", key=f"seen-{v_id}"):
-                schedule_next_repetition(conn, user_id, v_id, success=True)
-                st.success("Marked. Will appear again according to schedule.")
+            corrected = corrections.get(v_id)
+            if corrected and corrected["original"] == sentence:
+                st.write("**Corrected sentence:**")
+                st.write(corrected)
+            st.checkbox("Seen (increase repetition)", key=f"seen-{v_id}")
             if st.button("Mark as known", key=f"known-{v_id}"):
-                mark_word_confirmation(conn, user_id, v_id)
+                with pg_conn() as conn:
+                    mark_word_confirmation(conn, user_id, v_id)
                 st.success("Great — saved as learned.")
 
+        # Submit every "seen" word of this session in one transaction
+        seen = [row[1] for row in due if st.session_state.get(f"seen-{row[1]}")]
+        if due and st.button(f"Save review ({len(seen)} seen)", disabled=not seen):
+            with pg_conn() as conn:
+                record_review_session(conn, user_id, [(v_id, True) for v_id in seen])
+            st.success("Saved. Words will appear again according to schedule.")
+
     elif menu == "Spaced Review":
         st.header("Spaced Repetition Settings / Status")
         st.write("This shows your learning list and schedule.")
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT uv.id, v.word, uv.repetition_count, uv.next_due, uv.learned, uv.appearances
-            FROM user_vocab uv JOIN words v ON uv.word_id = v.id
-            WHERE uv.user_id = %s
-            ORDER BY uv.next_due IS NOT NULL, uv.next_due
-        """, (user_id,))
-        res = cur.fetchall()
-        for r in res:
-            uid, w, rep, next_due, confirmed, app = r
-            st.write(f"- **{w}** — reps: {rep}, next: {next_due}, appearances: {app}, learned: {bool(confirmed)}")
+        with pg_conn() as conn:
+            words = get_user_words(conn, user_id, order="next_due")
+        rows = paged(words, key="review")
+        st.dataframe(
+            {
+                "word": [r[1] for r in rows],
+                "reps": [r[4] for r in rows],
+                "next due": [r[5] for r in rows],
+                "appearances": [r[6] for r in rows],
+                "learned": [bool(r[7]) for r in rows],
+            },
+            hide_index=True,
+            width="stretch",
+        )
     
     
     elif menu == "My Words":
         st.header("My Words (your personal list)")
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT v.id, v.word, v.phonetic, v.example, uv.repetition_count, uv.learned
-            FROM user_vocab uv JOIN words v ON uv.word_id = v.id
-            WHERE uv.user_id = %s
-            ORDER BY uv.appearances DESC
-        """, (user_id,))
-        res = cur.fetchall()
-        for i, r in enumerate(res):
-            vid, w, p, ex, rep, learned = r
-            cols = st.columns([2,1,1,1])
-            cols[0].write(f"**{w}** — `{p}`")
-            cols[0].write(ex or "")
-            
-            if cols[1].button("Practice now", key=f"p-{vid}-{i}"):
-                add_user_vocab(conn, user_id, vid)  # ensure exists
-                schedule_next_repetition(conn, user_id, vid, success=False)
-                st.info("Scheduled for practice soon.")
-                
-            if cols[2].button("Mark learned", key=f"ml-{vid}-{i}"):
-                mark_word_confirmation(conn, user_id, vid)
-                st.success("Marked as learned.")
-                
-            if learned:
-                cols[3].write("✅ Learned")
-            else:
-                cols[3].write("")
+        with pg_conn() as conn:
+            words = get_user_words(conn, user_id, order="appearances")
+        rows = paged(words, key="mywords")
+        event = st.dataframe(
+            {
+                "word": [r[1] for r in rows],
+                "phonetic": [r[2] for r in rows],
+                "example": [r[3] or "" for r in rows],
+                "reps": [r[4] for r in rows],
+                "learned": ["✅" if r[7] else "" for r in rows],
+            },
+            hide_index=True,
+            width="stretch",
+            on_select="rerun",
+            selection_mode="multi-row",
+            key="mywords-grid",
+        )
+        selected = [rows[i][0] for i in event.selection.rows]
+        cols = st.columns([1, 1, 3])
+        if cols[0].button(f"Practice now ({len(selected)})", disabled=not selected):
+            with pg_conn() as conn:
+                record_review_session(conn, user_id, [(vid, False) for vid in selected])  # upserts, so the words always exist
+            st.toast("Scheduled for practice soon.")
+            st.rerun()
+        if cols[1].button(f"Mark learned ({len(selected)})", disabled=not selected):
+            with pg_conn() as conn:
+                mark_words_learned(conn, user_id, selected)
+            st.toast("Marked as learned.")
+            st.rerun()
 
 
     # elif menu == "LLM Chunks":
@@ -328,8 +473,6 @@ def main():
     elif menu == "LLM Chunks":
         st.header("Generate Passage with English Chunks")
         st.write("Use LLM to create a natural passage with highlighted English chunks.")
-        cursor = conn.cursor()
-
         # Form để nhập topic và length
         with st.form("chunk_form"):
             topic = st.text_input("Enter a topic (e.g., Travel, Work, Daily Life):", "Daily life")
@@ -337,43 +480,51 @@ def main():
             submitted = st.form_submit_button("Generate passage with chunks")
 
         # Nếu generate → gọi LLM và lưu vào session_state
+        streamed = False
         if submitted:
-            passage, chunks = generate_passage_with_chunks(topic, length)
+            st.write("### Passage")
+            passage = st.write_stream(stream_passage_with_chunks(topic, length)).strip()
+            streamed = True
             st.session_state["chunk_passage"] = passage
             st.session_state["chunk_topic"] = topic
-            st.session_state["chunks"] = chunks
+            st.session_state["chunks"] = extract_chunks(passage)
 
         # Hiển thị passage nếu đã có
         if "chunk_passage" in st.session_state:
-            st.write("### Passage")
-            st.markdown(st.session_state["chunk_passage"])
+            if not streamed:
+                st.write("### Passage")
+                st.markdown(st.session_state["chunk_passage"])
             tts_passage_button(st.session_state["chunk_passage"], key="Passage")
 
         # Hiển thị chunks nếu đã có
         if "chunks" in st.session_state:
             st.write("### Extracted Chunks")
-            for i, c in enumerate(st.session_state["chunks"]):
-                col1, col2 = st.columns([4, 1])
-                col1.write(f"- **{c}**")
-                with col2:
-                    tts_chunk_button(c, key=f"chunk{i}")
+            tts_buttons(st.session_state["chunks"], rows=True)
 
         # Save to DB
         if "chunk_passage" in st.session_state and st.button("Save Chunks"):
-            save_chunks_for_user(
-                conn,
-                user_id,
-                st.session_state["chunk_topic"],
-                st.session_state["chunks"]
-            )
-            st.success("Chunks saved to database!")
-
-        # Show topics from DB
-        cursor.execute(
-            "SELECT DISTINCT topic FROM chunks WHERE user_id=%s ORDER BY topic",
-            (user_id,)
-        )
-        topics = [row[0] for row in cursor.fetchall()]
+            with pg_conn() as conn:
+                added = save_chunks_for_user(
+                    conn,
+                    user_id,
+                    st.session_state["chunk_topic"],
+                    st.session_state["chunks"]
+                )
+            st.success(f"Chunks saved to database! ({added} new)" if added else "These chunks were already saved.")
+
+        # Search saved chunks and topics
+        q = st.text_input("Search saved chunks and topics")
+        if q.strip():
+            rows = chunk_page(user_id, "chunk-search", query=q.strip())
+            for chunk, chunk_topic in rows:
+                st.write(f"**{chunk}** · {chunk_topic}")
+            tts_player([chunk for chunk, _ in rows], key="chunk-search-audio")
+            if not rows:
+                st.info("No saved chunks match.")
+
+        # Show topics from DB (cached until the next save adds chunks)
+        with pg_conn() as conn:
+            topics = get_chunk_topics(conn, user_id)
 
         selected_topic = st.selectbox(
             "### Select or type a topic for search",
@@ -382,20 +533,14 @@ def main():
 
         if st.checkbox("Show saved chunks for selected topic"):
             if topics:
-                cursor.execute(
-                    "SELECT chunk FROM chunks WHERE user_id=%s AND topic=%s ORDER BY created_at DESC",
-                    (user_id, selected_topic)
-                )
-                rows = cursor.fetchall()
+                rows = chunk_page(user_id, "chunk-topic", topic=selected_topic)
                 if rows:
-                    for row in rows:
-                        st.write(f"**{row[0]}**")
+                    for chunk, _ in rows:
+                        st.write(f"**{chunk}**")
+                    tts_player([chunk for chunk, _ in rows], key="chunk-topic-audio")
                 else:
                     st.info("No chunks found for this topic.")
 
-
-    conn.close()
-
 if __name__ == "__main__":
     main()
 
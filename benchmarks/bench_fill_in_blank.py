@@ -0,0 +1,80 @@
+"""
+Benchmark: create_fill_in_blank (single compiled alternation, one pass)
+against the previous per-word regex + per-character `occupied` list.
+
+    python -m benchmarks.bench_fill_in_blank
+"""
+import argparse
+import random
+import re
+import statistics
+import time
+
+from benchmarks.seed import fake_word
+from utils.llm_utils import create_fill_in_blank
+
+
+def old_create_fill_in_blank(passage, target_words, blanks=3):
+    candidates = []
+    for w in set(target_words):
+        pattern = re.compile(r"\b" + re.escape(w) + r"\b", flags=re.IGNORECASE)
+        for m in pattern.finditer(passage):
+            candidates.append((m.start(), m.end(), passage[m.start():m.end()], w))
+    if not candidates:
+        return passage, []
+    chosen, occupied = [], [False] * len(passage)
+    for start, end, found, canonical in sorted(candidates, key=lambda x: x[0]):
+        if len(chosen) >= blanks:
+            break
+        if any(occupied[start:end]):
+            continue
+        chosen.append((start, end, found, canonical))
+        for i in range(start, end):
+            occupied[i] = True
+    masked_chars, answers = list(passage), []
+    for start, end, found, canonical in reversed(chosen):
+        masked_chars[start:end] = list("____")
+        answers.append(found)
+    answers.reverse()
+    return ''.join(masked_chars), answers
+
+
+def make_passage(rng, n_words, targets):
+    vocab = [fake_word(rng) for _ in range(500)]
+    words = [rng.choice(vocab) for _ in range(n_words)]
+    for i in range(0, n_words, 10):
+        words[i] = rng.choice(targets)
+    return " ".join(words) + "."
+
+
+def ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+    rng = random.Random(0)
+    print(f"{'words':>6} {'targets':>7} {'blanks':>6} | {'old ms':>8} | {'new ms':>8} {'(inflect)':>9} | same")
+    for n_words in (200, 2000, 10000):
+        for n_targets in (3, 50, 200):
+            targets = [fake_word(rng) for _ in range(n_targets)]
+            passage = make_passage(rng, n_words, targets)
+            blanks = max(3, n_targets // 2)
+            create_fill_in_blank(passage, targets, blanks)          # warm the pattern cache
+            old = ms(lambda: old_create_fill_in_blank(passage, targets, blanks), args.repeat)
+            new = ms(lambda: create_fill_in_blank(passage, targets, blanks, inflect=False), args.repeat)
+            inf = ms(lambda: create_fill_in_blank(passage, targets, blanks), args.repeat)
+            same = old_create_fill_in_blank(passage, targets, blanks) == \
+                create_fill_in_blank(passage, targets, blanks, inflect=False)
+            print(f"{n_words:>6} {n_targets:>7} {blanks:>6} | {old:>8.3f} | {new:>8.3f} {inf:>9.3f} | {same}")
+
+
+if __name__ == "__main__":
+    main()
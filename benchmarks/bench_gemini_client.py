@@ -0,0 +1,63 @@
+"""
+Exercise GeminiWrapper against the local fake Gemini server: concurrency
+bound, retries on injected 429/503, per-call deadlines, latency histogram.
+
+    python -m benchmarks.bench_gemini_client
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_gemini import FakeGemini
+from utils.llm_utils import GeminiTimeout, GeminiWrapper, config_for_chunk
+
+
+def run(client, sessions, calls_per_session):
+    failures = {"timeout": 0, "error": 0}
+
+    def session(i):
+        for j in range(calls_per_session):
+            try:
+                client.generate(f"session {i} call {j}", config_for_chunk)
+            except GeminiTimeout:
+                failures["timeout"] += 1
+            except Exception:
+                failures["error"] += 1
+
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session, range(sessions)))
+    return time.perf_counter() - t, failures
+
+
+def scenario(title, fake, **client_kwargs):
+    sessions = client_kwargs.pop("sessions", 32)
+    calls = client_kwargs.pop("calls", 2)
+    client = GeminiWrapper("fake-key", endpoint=fake.endpoint, backoff_base=0.05, **client_kwargs)
+    before = fake.requests
+    wall, failures = run(client, sessions, calls)
+    snap = client.latency.snapshot()
+    print(f"--- {title}")
+    print(f"    wall {wall:.2f}s, {sessions * calls} calls, {fake.requests - before} HTTP requests, "
+          f"stats={client.stats}, failures={failures}")
+    print(f"    mean {snap['sum'] / max(snap['count'], 1) * 1000:.0f} ms, buckets(le s)={snap['buckets']}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency", type=float, default=0.2)
+    args = ap.parse_args()
+
+    fake = FakeGemini(latency=args.latency).start()
+    scenario("concurrency bound 4 (expect ~sessions*calls/4 * latency wall time)", fake, max_concurrency=4)
+    scenario("concurrency bound 16", fake, max_concurrency=16)
+    fake.fail_rate = 0.3
+    scenario("30% injected 429/503, 3 retries", fake, max_concurrency=16)
+    fake.fail_rate = 0.0
+    fake.latency = 1.0
+    scenario("deadline 0.5s vs 1s server latency", fake, max_concurrency=16, timeout=0.5, sessions=8, calls=1)
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark: sampling unlearned words for "LLM Passage".
+
+Compares the old approach (anti-join every word, fetch all rows, random.sample
+in Python) with get_random_words_from_db's random-id probing, across words
+table sizes and deck sizes.
+
+    DB_SSLMODE=disable DB_HOST=... python -m benchmarks.bench_random_words
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks.seed import connect, seed_deck, seed_words
+from utils.llm_utils import get_random_words_from_db
+
+USER_ID = 1
+
+
+def old_sample(conn, user_id, n):
+    cur = conn.cursor()
+    cur.execute("SELECT word FROM words w LEFT JOIN user_vocab uv ON w.id = uv.word_id AND uv.user_id =%s WHERE uv.word_id IS NULL", (user_id,))
+    words = [row[0] for row in cur.fetchall()]
+    return random.sample(words, min(n, len(words)))
+
+
+def timeit(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--words", type=int, nargs="+", default=[5000, 50000])
+    ap.add_argument("--decks", type=int, nargs="+", default=[0, 500, 5000])
+    ap.add_argument("-n", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=30)
+    args = ap.parse_args()
+
+    conn = connect()
+    print(f"{'words':>8} {'deck':>6} | {'old p50 ms':>10} {'old max':>8} | {'new p50 ms':>10} {'new max':>8}")
+    for n_words in args.words:
+        seed_words(conn, n_words)
+        for deck in args.decks:
+            if deck > n_words:
+                continue
+            seed_deck(conn, USER_ID, deck)
+            old = timeit(lambda: old_sample(conn, USER_ID, args.n), args.repeat)
+            new = timeit(lambda: get_random_words_from_db(conn, USER_ID, args.n), args.repeat)
+            conn.rollback()
+            print(f"{n_words:>8} {deck:>6} | {old[0]:>10.2f} {old[1]:>8.2f} | {new[0]:>10.2f} {new[1]:>8.2f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
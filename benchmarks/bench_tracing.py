@@ -0,0 +1,53 @@
+"""
+Benchmark: cost of the tracing layer (utils/tracing.py).
+
+Measures an empty span, and `SELECT 1` through a plain psycopg2 cursor vs
+TracedCursor on the same connection.
+
+    python -m benchmarks.bench_tracing [--n 20000]
+"""
+import argparse
+import time
+
+import psycopg2.extensions
+
+from benchmarks.seed import connect
+from utils.tracing import TracedCursor, span, tagged
+
+
+def per_call_us(fn, n):
+    t = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t) / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    args = ap.parse_args()
+
+    def empty():
+        pass
+
+    def traced_empty():
+        with span("bench"):
+            pass
+
+    with tagged(page="bench", user=0):
+        base = per_call_us(empty, args.n)
+        traced = per_call_us(traced_empty, args.n)
+        print(f"empty span:        {traced - base:.2f} us overhead per span")
+
+        conn = connect(fresh=False)
+        plain = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        tc = conn.cursor(cursor_factory=TracedCursor)
+        plain_us = per_call_us(lambda: plain.execute("SELECT 1"), args.n)
+        traced_us = per_call_us(lambda: tc.execute("SELECT 1"), args.n)
+        print(f"SELECT 1 plain:    {plain_us:.1f} us")
+        print(f"SELECT 1 traced:   {traced_us:.1f} us  (+{traced_us - plain_us:.1f} us, "
+              f"{(traced_us / plain_us - 1) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark: pronunciation buttons for a page of N results, one component
+iframe per row (the previous tts_button) against one batched component
+(tts_buttons).
+
+Reports what the browser receives: iframe count and HTML bytes, plus the
+server-side script time measured with Streamlit's AppTest. Each iframe is a
+separate document with its own JS context, so the iframe count is the main
+driver of browser memory and time-to-interactive.
+
+    python -m benchmarks.bench_tts_render
+"""
+import argparse
+import statistics
+import time
+
+import streamlit.components.v1 as components
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.seed import fake_word
+
+
+def old_tts_button(word: str, wid: int):
+    components.html(
+        f"""
+        <button onclick="speak{wid}()" style="border:none;background:none;cursor:pointer;font-size:18px;">
+            🔊
+        </button>
+        <script>
+        var bestVoice{wid} = null;
+
+        function pickBestVoice{wid}() {{
+            var voices = speechSynthesis.getVoices();
+            bestVoice{wid} = voices.find(v => v.lang === "en-US")
+                          || voices.find(v => v.lang.startsWith("en"))
+                          || null;
+        }}
+
+        speechSynthesis.onvoiceschanged = pickBestVoice{wid};
+        pickBestVoice{wid}();
+
+        function speak{wid}() {{
+            var utterance = new SpeechSynthesisUtterance("{word}");
+            if (bestVoice{wid}) {{
+                utterance.voice = bestVoice{wid};
+                utterance.lang = bestVoice{wid}.lang;
+            }} else {{
+                utterance.lang = "en-US";
+            }}
+            speechSynthesis.speak(utterance);
+        }}
+        </script>
+        """,
+        height=40,
+    )
+
+
+def count_html(render, words):
+    """Call render with components.html recorded instead of sent."""
+    calls = []
+    original = components.html
+    components.html = lambda html, **kw: calls.append(len(html.encode()))
+    try:
+        render(words)
+    finally:
+        components.html = original
+    return len(calls), sum(calls)
+
+
+def render_old(words):
+    for i, w in enumerate(words):
+        old_tts_button(w, i)
+
+
+def render_new(words):
+    from utils.tts_utils import tts_buttons
+    tts_buttons(words)
+
+
+def _old_page():
+    import streamlit as st
+    from benchmarks.bench_tts_render import old_tts_button
+    for i, w in enumerate(st.session_state["words"]):
+        cols = st.columns([3, 1])
+        cols[0].write(w)
+        with cols[1]:
+            old_tts_button(w, i)
+
+
+def _new_page():
+    import streamlit as st
+    from utils.tts_utils import tts_buttons
+    words = st.session_state["words"]
+    tts_buttons(words)
+    for w in words:
+        cols = st.columns([3, 1])
+        cols[0].write(w)
+
+
+def script_ms(page, words, repeat):
+    samples = []
+    for _ in range(repeat):
+        at = AppTest.from_function(page, default_timeout=60)
+        at.session_state["words"] = words
+        t = time.perf_counter()
+        at.run()
+        samples.append((time.perf_counter() - t) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    import random
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    rng = random.Random(0)
+    print(f"{'rows':>5} | {'old iframes':>11} {'old KiB':>8} {'old ms':>7} | "
+          f"{'new iframes':>11} {'new KiB':>8} {'new ms':>7}")
+    for n in (25, 200, 1000):
+        words = [fake_word(rng) for _ in range(n)]
+        old_n, old_bytes = count_html(render_old, words)
+        new_n, new_bytes = count_html(render_new, words)
+        old_ms = script_ms(_old_page, words, args.repeat)
+        new_ms = script_ms(_new_page, words, args.repeat)
+        print(f"{n:>5} | {old_n:>11} {old_bytes / 1024:>8.1f} {old_ms:>7.1f} | "
+              f"{new_n:>11} {new_bytes / 1024:>8.1f} {new_ms:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark: Browse search via ILIKE '%q%' in Postgres vs the in-memory
+VocabIndex, plus the index's memory footprint.
+
+    DB_SSLMODE=disable DB_HOST=... python -m benchmarks.bench_vocab_index --words 50000
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.seed import connect, seed_deck, seed_words
+from utils.vocab_index import get_user_word_ids, load_vocab_index
+from utils.vocab_utils import _search_vocab_sql
+
+USER_ID = 1
+QUERIES = [None, "a", "ing", "tion", "xq", "abc"]
+
+
+def ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--words", type=int, default=50000)
+    ap.add_argument("--deck", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    conn = connect()
+    seed_words(conn, args.words)
+    seed_deck(conn, USER_ID, args.deck)
+
+    t = time.perf_counter()
+    index = load_vocab_index(conn)
+    print(f"index load: {(time.perf_counter() - t) * 1000:.1f} ms for {len(index)} rows")
+    fp = index.footprint()
+    print("footprint: " + ", ".join(f"{k}={v / 1024:.0f}KiB" for k, v in fp.items() if k != "rows"))
+
+    print(f"{'query':>8} | {'sql ms':>8} | {'index ms':>8} (incl. exclusion-set fetch)")
+    for q in QUERIES:
+        sql = ms(lambda: _search_vocab_sql(conn, USER_ID, q, 30, None if q else 1, None if q else 5000), args.repeat)
+        idx = ms(lambda: index.search(q, 30, None if q else 1, None if q else 5000,
+                                      exclude_ids=get_user_word_ids(conn, USER_ID)), args.repeat)
+        print(f"{q or '(none)':>8} | {sql:>8.2f} | {idx:>8.2f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Local stand-in for the Gemini REST API (generateContent and
+streamGenerateContent), for benchmarks and load tests. Responses are
+deterministic per prompt; latency and 429/503 failures can be injected.
+`latency` is the time to the first byte; streamed pieces are then spaced by
+`chunk_delay`.
+
+    python -m benchmarks.fake_gemini --port 8089 --latency 0.2 --fail-rate 0.1
+    GEMINI_ENDPOINT=http://127.0.0.1:8089 streamlit run app.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the quick learner reads a short passage every day and writes new words "
+         "in a notebook to remember them better over time").split()
+
+
+def fake_text(prompt: str, n_words: int = 80) -> str:
+    """Deterministic pseudo-passage; echoes target words and bolds a few chunks."""
+    rng = random.Random(hashlib.sha256(prompt.encode()).hexdigest())
+    m = re.search(r"target words naturally: ([^.]+)\.", prompt)
+    targets = [w.strip() for w in m.group(1).split(",")] if m else []
+    out = [rng.choice(WORDS) for _ in range(n_words)]
+    for i, w in enumerate(targets):
+        out[(i * 7 + 3) % n_words] = w
+    if "bold" in prompt:
+        for i in range(0, n_words - 3, 15):
+            out[i] = "**" + out[i]
+            out[i + 2] = out[i + 2] + "**"
+    if "JSON array" in prompt and "corrected" in prompt:
+        lines = re.findall(r"^(\d+)\. \[word: [^\]]*\] (.*)$", prompt, flags=re.M)
+        return json.dumps([{"index": int(i), "corrected": s.capitalize().rstrip(".") + ".",
+                            "explanation": "Capitalized and punctuated."} for i, s in lines])
+    if "JSON" in prompt and "corrected" in prompt:
+        sentence = prompt.rsplit("\n", 1)[-1]
+        return json.dumps({"original": sentence, "corrected": sentence.capitalize().rstrip(".") + ".",
+                           "explanation": "Capitalized and punctuated."})
+    return " ".join(out).capitalize() + "."
+
+
+class FakeGemini:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, fail_rate=0.0, seed=0,
+                 chunk_delay=0.02):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                    fail = fake._rng.random() < fake.fail_rate
+                    delay = fake.latency + fake._rng.random() * fake.jitter
+                time.sleep(delay)
+                if fail:
+                    status = 429 if fake._rng.random() < 0.5 else 503
+                    return self._send(status, {"error": {"code": status, "message": "injected failure",
+                                                         "status": "RESOURCE_EXHAUSTED" if status == 429 else "UNAVAILABLE"}})
+                prompt = "".join(p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", []))
+                text = fake_text(prompt)
+                if "streamGenerateContent" in self.path:
+                    return self._stream(text)
+                self._send(200, {
+                    "candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                                    "finishReason": "STOP", "index": 0}],
+                    "usageMetadata": {"promptTokenCount": len(prompt.split()), "totalTokenCount": 100},
+                })
+
+            def _stream(self, text):
+                # REST streaming = one JSON array whose elements arrive over time
+                words = text.split(" ")
+                pieces = [" ".join(words[i:i + 5]) + (" " if i + 5 < len(words) else "")
+                          for i in range(0, len(words), 5)]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b"[")
+                for i, piece in enumerate(pieces):
+                    if i:
+                        time.sleep(fake.chunk_delay)
+                        self.wfile.write(b",")
+                    self.wfile.write(json.dumps({
+                        "candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}, "index": 0}],
+                    }).encode())
+                    self.wfile.flush()
+                self.wfile.write(b"]")
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", type=float, default=0.0)
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    args = ap.parse_args()
+    fake = FakeGemini(port=args.port, latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate)
+    print(f"fake Gemini listening on {fake.endpoint}")
+    fake.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
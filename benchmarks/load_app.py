@@ -0,0 +1,353 @@
+"""
+Concurrent-session load harness: how many learners can one app machine serve
+before reruns stall?
+
+Drives N simulated sessions through the real app.py with Streamlit's AppTest,
+all in this process - like the sessions of one `streamlit run` server
+sharing its pool, caches and CPU. Each session logs in, then loops over
+Browse searches and paging, Study (mark seen + save review), My Words and
+passage generation, with exponential think times between actions. The
+database is a throwaway `loadtest` schema; Gemini is the local fake server
+(benchmarks/fake_gemini.py) with configurable latency; pronunciation audio uses
+the offline tone engine.
+
+    python -m benchmarks.load_app --sessions 1,2,4,8,16,32 --duration 30 --think 2
+
+More sessions generating passages than the pool has connections: pages must
+not hold a connection while the LLM streams, so Browse keeps its latency and
+pool waits stay near zero (the LLM cache's no-wait checkouts of its shared tier
+may still count a few timeouts):
+
+    python -m benchmarks.load_app --sessions 12 --pool-size 4 --mix browse=1,passage=1 --llm-latency 3
+
+Per stage (number of sessions) it reports throughput (reruns/s), rerun
+latency percentiles per action, login time and resident memory per session.
+The saturation point is the first stage whose p95 rerun latency (passage
+generation excluded: it waits on the LLM by design) exceeds --slo-ms, has
+errors, or whose throughput grew by less than half of the added load.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.fake_gemini import FakeGemini
+from benchmarks.run import setup_environment, start_pgserver
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+PASSWORD = "learner-pw"
+ACTIONS = (("browse", 4), ("study", 3), ("my_words", 2), ("passage", 1))   # (action, weight)
+LLM_ACTIONS = ("passage generate",)
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        import resource      # peak, not current, outside Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p * len(samples)))] if samples else 0.0
+
+
+class Recorder:
+    """Rerun latencies per action, shared by the session threads of a stage."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)     # "action: message" -> count
+
+    def add(self, action, seconds, error=None):
+        with self.lock:
+            self.latency[action].append(seconds)
+            if error:
+                self.errors[f"{action}: {error}"] += 1
+
+
+class Session:
+    """One simulated learner: an AppTest instance plus a little behaviour."""
+
+    def __init__(self, username, rng, think, recorder, timeout, actions=ACTIONS):
+        from streamlit.testing.v1 import AppTest
+
+        self.username = username
+        self.actions = actions
+        self.rng = rng
+        self.think = think
+        self.recorder = recorder
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+
+    def rerun(self, action, widget=None):
+        """Run the script once (through `widget` if given) and record the latency."""
+        t = time.perf_counter()
+        try:
+            (widget or self.at).run()
+            error = self.at.exception[0].message if self.at.exception else None
+        except Exception as e:          # e.g. the rerun timed out
+            error = f"{type(e).__name__}: {e}"
+        self.recorder.add(action, time.perf_counter() - t, error)
+
+    def menu(self, name):
+        radio = self.at.sidebar.radio
+        if radio and radio[0].value != name:
+            self.rerun("navigate", radio[0].set_value(name))
+
+    def button(self, label):
+        return next((b for b in self.at.button if b.label.startswith(label) and not b.disabled), None)
+
+    def login(self):
+        self.rerun("open")
+        self.at.sidebar.selectbox[0].set_value("Login")
+        self.at.sidebar.text_input[0].set_value(self.username)
+        self.at.sidebar.text_input[1].set_value(PASSWORD)
+        self.rerun("login", self.at.sidebar.button[0].click())
+        return bool(self.at.sidebar.radio)
+
+    def browse(self):
+        self.menu("Search / Browse")
+        box = next((w for w in self.at.text_input if w.label.startswith("Search word")), None)
+        if box is None:
+            return
+        query = "" if self.rng.random() < 0.3 else "".join(self.rng.choice("aeiourstln") for _ in range(2))
+        self.rerun("browse search", box.set_value(query))
+        for _ in range(self.rng.randint(0, 3)):
+            nxt = self.button("Next")
+            if nxt is None:
+                break
+            self.rerun("browse next", nxt.click())
+        if self.rng.random() < 0.3:
+            add = self.button("Add to my list")
+            if add is not None:
+                self.rerun("browse add", add.click())
+
+    def study(self):
+        self.menu("Study")
+        keys = [c.key for c in self.at.checkbox if (c.key or "").startswith("seen-")]
+        for key in self.rng.sample(keys, min(len(keys), self.rng.randint(1, 3))):
+            # look the widget up again: each rerun replaces the element tree
+            box = next((c for c in self.at.checkbox if c.key == key), None)
+            if box is not None:
+                self.rerun("study seen", box.check())
+        save = self.button("Save review")
+        if save is not None:
+            self.rerun("study save", save.click())
+
+    def my_words(self):
+        self.menu("My Words")
+
+    def passage(self):
+        self.menu("LLM Passage")
+        gen = self.button("Generate passage")
+        if gen is not None:
+            self.rerun("passage generate", gen.click())
+
+    def loop(self, stop_at):
+        while time.monotonic() < stop_at:
+            action = self.rng.choices([a for a, _ in self.actions], [w for _, w in self.actions])[0]
+            getattr(self, action)()
+            time.sleep(min(self.rng.expovariate(1 / self.think) if self.think else 0,
+                           max(0.0, stop_at - time.monotonic())))
+
+
+def share_runtime():
+    """
+    Let AppTest instances run concurrently the way sessions do in one server.
+    AppTest installs a mock Runtime per run and clears it afterwards, builds a
+    new script cache (so it re-parses app.py) per run and toggles a global
+    config flag; concurrent runs trip over each other. Give them one shared
+    Runtime and script cache instead, like a `streamlit run` process has.
+    """
+    from unittest.mock import MagicMock
+
+    import streamlit.testing.v1.app_test as app_test
+    import streamlit.testing.v1.local_script_runner as local_script_runner
+    from streamlit import config
+    from streamlit.runtime import Runtime
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = app_test.MediaFileManager(app_test.MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = app_test.DataframeSourceManager()
+    runtime.cache_storage_manager = app_test.MemoryCacheStorageManager()
+    runtime.bidi_component_registry = app_test.BidiComponentManager()
+    Runtime._instance = runtime
+
+    class PerRunRuntime(Runtime):
+        """What AppTest sets and clears on each run; the real Runtime keeps the shared mock."""
+
+    script_cache = app_test.ScriptCache()
+    app_test.Runtime = PerRunRuntime
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    config.set_option("global.appTest", True)
+
+
+def seed(args, users):
+    """Fresh schema with the words table, `users` learners and a deck each."""
+    import bcrypt
+    from benchmarks.seed import connect, seed_deck, seed_words
+
+    conn = connect(args.schema, fresh=True)
+    seed_words(conn, args.words, seed=args.seed)
+    pw_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds=int(os.environ.get("BCRYPT_ROUNDS", 12))))
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO users (username, password_hash) VALUES (%s, %s)",
+                    [(f"learner{i}", pw_hash.decode()) for i in range(users)])
+    cur.execute("SELECT id FROM users WHERE username LIKE 'learner%%' ORDER BY id")
+    ids = [r[0] for r in cur.fetchall()]
+    conn.commit()
+    for user_id in ids:
+        seed_deck(conn, user_id, args.deck, seed=args.seed)
+    conn.close()
+
+
+def run_stage(n, args):
+    recorder = Recorder()
+    sessions = [Session(f"learner{i}", random.Random(args.seed * 1000 + i), args.think, recorder, args.timeout,
+                        args.actions) for i in range(n)]
+    gc.collect()                       # drop the previous stage's sessions before measuring
+    rss_before = rss_mb()
+    logged_in = []
+    window = []     # [start, stop] of the steady state, set once everyone is logged in
+    ready = threading.Barrier(n + 1, action=lambda: window.extend([time.monotonic(),
+                                                                   time.monotonic() + args.duration]))
+
+    def drive(s):
+        ok = False
+        try:
+            ok = s.login()
+        finally:
+            logged_in.append(ok)
+            ready.wait()
+        if ok:
+            s.loop(window[1])
+
+    threads = [threading.Thread(target=drive, args=(s,), daemon=True) for s in sessions]
+    for t in threads:
+        t.start()
+    ready.wait()                       # everyone is logged in: measure the steady state
+    rss_after = rss_mb()
+    for t in threads:
+        t.join(args.duration + args.timeout * 4)
+    wall = time.monotonic() - window[0]
+
+    logins = recorder.latency.pop("login", [])
+    recorder.latency.pop("open", None)
+    steady = [x for xs in recorder.latency.values() for x in xs]
+    # passage generation waits on the LLM by design; the SLO is about every other rerun
+    interactive = [x for a, xs in recorder.latency.items() if a not in LLM_ACTIONS for x in xs]
+    llm = [x for a in LLM_ACTIONS for x in recorder.latency.get(a, [])]
+    return {
+        "sessions": n,
+        "logged_in": sum(logged_in),
+        "reruns": len(steady),
+        "throughput": round(len(steady) / wall, 2),
+        "p50_ms": round(percentile(interactive, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(interactive, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(interactive, 0.99) * 1000, 1),
+        "llm_p95_ms": round(percentile(llm, 0.95) * 1000, 1),
+        "login_p95_ms": round(percentile(logins, 0.95) * 1000, 1),
+        "errors": sum(recorder.errors.values()),
+        "error_kinds": dict(recorder.errors),
+        "rss_mb": round(rss_after, 1),
+        "mb_per_session": round(max(0.0, rss_after - rss_before) / n, 2),
+        "actions": {a: {"n": len(xs), "p50_ms": round(percentile(xs, 0.5) * 1000, 1),
+                        "p95_ms": round(percentile(xs, 0.95) * 1000, 1)}
+                    for a, xs in sorted(recorder.latency.items())},
+    }
+
+
+def saturated(stage, prev, slo_ms) -> bool:
+    if stage["p95_ms"] > slo_ms or stage["errors"]:
+        return True
+    if prev is None or not prev["throughput"]:
+        return False
+    expected = prev["throughput"] * (1 + 0.5 * (stage["sessions"] / prev["sessions"] - 1))
+    return stage["throughput"] < expected
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", default="1,2,4,8,16", help="comma-separated stages (concurrent sessions)")
+    ap.add_argument("--duration", type=float, default=30, help="seconds of steady state per stage")
+    ap.add_argument("--think", type=float, default=2.0, help="mean think time between actions (s)")
+    ap.add_argument("--slo-ms", type=float, default=1000, help="p95 rerun latency budget")
+    ap.add_argument("--words", type=int, default=20000)
+    ap.add_argument("--deck", type=int, default=300)
+    ap.add_argument("--llm-latency", type=float, default=0.8, help="fake Gemini time to first byte (s)")
+    ap.add_argument("--llm-chunk-delay", type=float, default=0.02, help="fake Gemini delay between streamed pieces")
+    ap.add_argument("--timeout", type=float, default=60, help="AppTest timeout per rerun (s)")
+    ap.add_argument("--schema", default="loadtest")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the stage results to this file")
+    ap.add_argument("--pgserver", action="store_true", help="run against a temporary local Postgres")
+    ap.add_argument("--pool-size", type=int, help="DB_POOL_MAX for the app's pool (default: the app's own)")
+    ap.add_argument("--mix", help="action weights, e.g. browse=1,passage=1 (default: %s)"
+                                  % ",".join(f"{a}={w}" for a, w in ACTIONS))
+    args = ap.parse_args()
+    stages = [int(n) for n in args.sessions.split(",")]
+    args.actions = ACTIONS
+    if args.mix:
+        args.actions = [(a, float(w)) for a, w in (kv.split("=") for kv in args.mix.split(","))]
+        unknown = {a for a, _ in args.actions} - {a for a, _ in ACTIONS}
+        if unknown:
+            ap.error(f"unknown actions in --mix: {', '.join(sorted(unknown))}")
+    if args.pool_size:
+        os.environ["DB_POOL_MAX"] = str(args.pool_size)
+
+    server = start_pgserver() if args.pgserver else None   # noqa: F841 (kept alive until exit)
+    fake = FakeGemini(latency=args.llm_latency, chunk_delay=args.llm_chunk_delay).start()
+    setup_environment(args, fake)
+    os.environ.setdefault("TTS_ENGINE", "tone")            # offline; no network in the loop
+    os.environ.setdefault("TTS_FORMAT", "wav")
+    os.environ.setdefault("TTS_CACHE_DIR", tempfile.mkdtemp(prefix="load-tts-"))
+    os.environ.setdefault("TRACE_SLOW_MS", "5000")
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+    seed(args, max(stages))
+    import app  # noqa: F401  (import the app's modules once, before sessions race to do it)
+    share_runtime()
+
+    results, prev, saturation = [], None, None
+    print(f"{'sessions':>8}{'reruns/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'LLM p95':>9}{'login p95':>11}{'errors':>8}{'MB/sess':>9}{'RSS MB':>8}")
+    for n in stages:
+        r = run_stage(n, args)
+        results.append(r)
+        print(f"{n:>8}{r['throughput']:>10.2f}{r['p50_ms']:>9.0f}{r['p95_ms']:>9.0f}{r['p99_ms']:>9.0f}"
+              f"{r['llm_p95_ms']:>9.0f}{r['login_p95_ms']:>11.0f}{r['errors']:>8}{r['mb_per_session']:>9.2f}{r['rss_mb']:>8.0f}")
+        if saturation is None and saturated(r, prev, args.slo_ms):
+            saturation = n
+        prev = r
+    fake.stop()
+
+    print("\nper action at the last stage:")
+    for action, a in results[-1]["actions"].items():
+        print(f"  {action:<18}{a['n']:>6}  p50 {a['p50_ms']:>7.0f} ms  p95 {a['p95_ms']:>7.0f} ms")
+    for kind, count in sorted(results[-1]["error_kinds"].items()):
+        print(f"  error x{count}: {kind}")
+    from database import pool_stats
+    pool = pool_stats()
+    print(f"\nDB pool (max {pool['maxconn']}): {pool['checkouts']} checkouts, {pool['timeouts']} timeouts, "
+          f"wait avg {pool['wait_seconds_avg'] * 1000:.1f} ms, max {pool['wait_seconds_max'] * 1000:.0f} ms")
+    if saturation is None:
+        print(f"\nno saturation up to {stages[-1]} sessions (p95 <= {args.slo_ms:.0f} ms)")
+    else:
+        ok = [n for n in stages if n < saturation]
+        print(f"\nsaturation at {saturation} sessions; last healthy stage: {ok[-1] if ok else 'none'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "stages": results, "saturation": saturation, "pool": pool}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Micro-benchmark suite for utils/vocab_utils.py, utils/llm_utils.py and
+utils/auth_utils.py.
+
+Runs every public function against a throwaway `bench` schema (seeded with
+--words synthetic words and a --deck word deck per user) and the local fake
+Gemini server (benchmarks/fake_gemini.py, no latency), and reports per case
+the median / p95 latency and the number of SQL statements issued per call.
+Statements are counted on every connection, the pool's included, so a cache
+or pool change that adds round trips shows up even when latency does not.
+
+    python -m benchmarks.run --words 100000 --deck 2000 --save benchmarks/baselines/local.json
+    python -m benchmarks.run --words 100000 --deck 2000 --compare benchmarks/baselines/local.json
+
+With --compare the exit status is 1 when a case's median got slower than the
+baseline by more than --threshold (and more than --min-ms), or when it issues
+more statements than before. --pgserver starts a temporary Postgres (needs
+`pip install pgserver`) instead of using the DB_* env vars.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.fake_gemini import FakeGemini
+
+AUTH_REPEAT = 5     # bcrypt dominates these; more samples only slow the suite down
+
+
+class Case:
+    def __init__(self, name, fn, setup=None, repeat=None, warmup=1):
+        self.name = name
+        self.fn = fn
+        self.setup = setup          # run before every call, not timed or counted
+        self.repeat = repeat
+        self.warmup = warmup
+
+
+def start_pgserver():
+    import pgserver
+
+    server = pgserver.get_server(tempfile.mkdtemp(prefix="bench-pg-"), cleanup_mode="delete")
+    os.environ.update(DB_HOST=str(server.pgdata), DB_PORT="5432", DB_NAME="postgres",
+                      DB_USER="postgres", DB_PASSWORD="", DB_SSLMODE="disable")
+    return server      # keep a reference: the cluster is removed when it is collected
+
+
+def setup_environment(args, fake):
+    """Point the app modules at the bench schema and the fake Gemini; must run before importing them."""
+    os.environ["PGOPTIONS"] = f"-c search_path={args.schema},public"   # pool connections too
+    os.environ["GEMINI_ENDPOINT"] = fake.endpoint
+    os.environ.setdefault("GOOGLE_API_KEY", "fake-key")
+    os.environ["WRITE_BEHIND"] = "0"
+
+
+def install_query_counter():
+    """Count statements on every connection: executemany counts each parameter set."""
+    import database
+    from utils.tracing import TracedCursor
+
+    counter = {"n": 0}
+    lock = threading.Lock()
+
+    class CountingCursor(TracedCursor):
+        def execute(self, query, vars=None):
+            with lock:
+                counter["n"] += 1
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            vars_list = list(vars_list)
+            with lock:
+                counter["n"] += len(vars_list)
+            return super().executemany(query, vars_list)
+
+    def connect():
+        conn = database.get_pg_conn()
+        conn.cursor_factory = CountingCursor
+        return conn
+
+    database._pool = database.PgPool(minconn=0, maxconn=4, connect=connect)
+    return counter, CountingCursor
+
+
+def build_cases(ctx):
+    from utils import auth_utils, llm_utils, vocab_utils
+    from utils.llm_utils import llm_cache
+
+    conn, user, rng = ctx["conn"], ctx["user_id"], ctx["rng"]
+    deck, fresh = ctx["deck"], ctx["fresh_ids"]
+    words = ctx["sample_words"]
+
+    def pick_fresh():
+        return fresh.pop()
+
+    def clear_llm_cache():
+        llm_cache.clear()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM llm_cache")
+        conn.commit()
+
+    def deep_cursor():
+        page = vocab_utils._search_vocab_sql(conn, user, limit=25, min_rank=ctx["words"] // 2)
+        return page.next_cursor
+
+    mid = deep_cursor()
+
+    def reviews():
+        return [(rng.choice(deck), rng.random() < 0.8) for _ in range(20)]
+
+    sentences = [(w, f"i {w} it yesterday") for w in words[:5]]
+    counter = {"n": 0}
+
+    def new_username():
+        counter["n"] += 1
+        return f"bench_{os.getpid()}_{time.time_ns()}_{counter['n']}"
+
+    cases = [
+        # --- vocab_utils ---
+        Case("vocab.normalize_word", lambda: vocab_utils.normalize_word("  Serendipity ")),
+        Case("vocab.search (index, first page)", lambda: vocab_utils.search_vocab_for_user(conn, user, limit=25)),
+        Case("vocab.search (index, query)", lambda: vocab_utils.search_vocab_for_user(conn, user, query="ab", limit=25)),
+        Case("vocab.search (index, deep page)",
+             lambda: vocab_utils.search_vocab_for_user(conn, user, limit=25, after=mid)),
+        Case("vocab.search (sql, first page)", lambda: vocab_utils._search_vocab_sql(conn, user, limit=25)),
+        Case("vocab.search (sql, query)", lambda: vocab_utils._search_vocab_sql(conn, user, query="ab", limit=25)),
+        Case("vocab.search (sql, deep page)", lambda: vocab_utils._search_vocab_sql(conn, user, limit=25, after=mid)),
+        Case("vocab.get_vocab_by_id", lambda: vocab_utils.get_vocab_by_id(conn, rng.choice(deck))),
+        Case("vocab.add_user_vocab", lambda: vocab_utils.add_user_vocab(conn, user, pick_fresh())),
+        Case("vocab.schedule_next_repetition",
+             lambda: vocab_utils.schedule_next_repetition(conn, user, rng.choice(deck), rng.random() < 0.8)),
+        Case("vocab.record_review_session (20)", lambda: vocab_utils.record_review_session(conn, user, reviews())),
+        Case("vocab.mark_word_confirmation", lambda: vocab_utils.mark_word_confirmation(conn, user, rng.choice(deck))),
+        Case("vocab.mark_words_learned (20)",
+             lambda: vocab_utils.mark_words_learned(conn, user, rng.sample(deck, min(20, len(deck))))),
+        Case("vocab.get_user_words (cold)", lambda: vocab_utils.get_user_words(conn, user),
+             setup=vocab_utils._load_user_words.clear),
+        Case("vocab.get_user_words (warm)", lambda: vocab_utils.get_user_words(conn, user)),
+        Case("vocab.get_due_for_user", lambda: vocab_utils.get_due_for_user(conn, user, limit=10)),
+        # --- llm_utils ---
+        Case("llm.get_random_words_from_db", lambda: llm_utils.get_random_words_from_db(conn, user, 5)),
+        Case("llm.create_fill_in_blank", lambda: llm_utils.create_fill_in_blank(ctx["passage"], words[:3], blanks=3)),
+        Case("llm.generate_passage (miss)", lambda: llm_utils.generate_passage(words[:3]), setup=clear_llm_cache),
+        Case("llm.generate_passage (hit)", lambda: llm_utils.generate_passage(words[:3]),
+             warmup=llm_utils.PASSAGE_VARIANTS),
+        Case("llm.generate_passage_with_blanks", lambda: llm_utils.generate_passage_with_blanks(conn, user),
+             setup=clear_llm_cache),
+        Case("llm.stream_passage_with_blanks", lambda: "".join(llm_utils.stream_passage_with_blanks(conn, user)),
+             setup=clear_llm_cache),
+        Case("llm.correct_sentence_with_llm", lambda: llm_utils.correct_sentence_with_llm(sentences[0][1]),
+             setup=clear_llm_cache),
+        Case("llm.correct_sentences_with_llm (5)", lambda: llm_utils.correct_sentences_with_llm(sentences),
+             setup=clear_llm_cache),
+        Case("llm.fallback_correction", lambda: llm_utils.fallback_correction(sentences[0][1])),
+        Case("llm.local_passage", lambda: llm_utils.local_passage(conn, user, ctx["sample_words"][:3])),
+        Case("llm.local_chunk_passage", lambda: llm_utils.local_chunk_passage("travel")),
+        Case("llm.generate_passage_with_chunks", lambda: llm_utils.generate_passage_with_chunks("travel"),
+             setup=clear_llm_cache),
+        Case("llm.stream_passage_with_chunks", lambda: "".join(llm_utils.stream_passage_with_chunks("travel")),
+             setup=clear_llm_cache),
+        Case("llm.extract_chunks", lambda: llm_utils.extract_chunks(ctx["chunk_text"])),
+        Case("llm.save_chunks_for_user (10)",
+             lambda: llm_utils.save_chunks_for_user(conn, user, "travel", ctx["chunks"])),
+        Case("llm.get_chunk_topics", lambda: llm_utils.get_chunk_topics(conn, user)),
+        Case("llm.search_chunks_for_user", lambda: llm_utils.search_chunks_for_user(conn, user, "travel")),
+        # --- auth_utils ---
+        Case("auth.hash_password", lambda: auth_utils.hash_password("correct horse"), repeat=AUTH_REPEAT),
+        Case("auth.check_password", lambda: auth_utils.check_password("correct horse", ctx["pw_hash"]),
+             repeat=AUTH_REPEAT),
+        Case("auth.register_user", lambda: auth_utils.register_user(conn, new_username(), "correct horse"),
+             repeat=AUTH_REPEAT),
+        Case("auth.login_user", lambda: auth_utils.login_user(conn, "bench_user", "correct horse"),
+             repeat=AUTH_REPEAT),
+        Case("auth.get_user_by_username", lambda: auth_utils.get_user_by_username(conn, "bench_user")),
+        Case("auth.get_password_hash", lambda: auth_utils.get_password_hash(conn, "bench_user")),
+        Case("auth.issue_session_token", lambda: auth_utils.issue_session_token("bench_user")),
+        Case("auth.resume_session", lambda: auth_utils.resume_session(conn, ctx["token"])),
+    ]
+    return cases
+
+
+def prepare(args):
+    """Seed the schema and build the shared context of the cases."""
+    from benchmarks.seed import connect, seed_deck, seed_words
+    from utils import auth_utils, llm_utils
+
+    conn = connect(args.schema, fresh=True)
+    t = time.perf_counter()
+    seed_words(conn, args.words, seed=args.seed)
+    deck = []
+    for user_id in range(1, args.users + 1):
+        ids = seed_deck(conn, user_id, args.deck, seed=args.seed)
+        if user_id == 1:
+            deck = ids
+    print(f"seeded {args.words} words, {args.users} decks of {args.deck} in {time.perf_counter() - t:.1f}s")
+
+    cur = conn.cursor()
+    cur.execute("SELECT word FROM words ORDER BY id LIMIT 10")
+    sample_words = [r[0] for r in cur.fetchall()]
+    in_deck = set(deck)
+    fresh_ids = [wid for wid in range(args.words, 0, -1) if wid not in in_deck][:10000]
+    fresh_ids.reverse()
+    auth_utils.register_user(conn, "bench_user", "correct horse")
+    chunk_text, chunks = llm_utils.generate_passage_with_chunks("warm up")
+    return {
+        "conn": conn,
+        "user_id": 1,
+        "words": args.words,
+        "rng": random.Random(args.seed),
+        "deck": deck,
+        "fresh_ids": fresh_ids,
+        "sample_words": sample_words,
+        "passage": llm_utils.generate_passage(sample_words[:3]),
+        "chunk_text": chunk_text,
+        "chunks": (chunks * 10)[:10] or ["a lot of"] * 10,
+        "pw_hash": auth_utils.get_password_hash(conn, "bench_user"),
+        "token": auth_utils.issue_session_token("bench_user"),
+    }
+
+
+def run_case(case, counter, repeat):
+    n = case.repeat or repeat
+    for _ in range(case.warmup):
+        if case.setup:
+            case.setup()
+        case.fn()
+    times, queries = [], 0
+    for _ in range(n):
+        if case.setup:
+            case.setup()
+        before = counter["n"]
+        t = time.perf_counter()
+        case.fn()
+        times.append((time.perf_counter() - t) * 1000)
+        queries += counter["n"] - before
+    times.sort()
+    return {
+        "median_ms": round(statistics.median(times), 4),
+        "p95_ms": round(times[min(len(times) - 1, int(0.95 * len(times)))], 4),
+        "queries": round(queries / n, 2),
+        "n": n,
+    }
+
+
+def compare(results, baseline, threshold, min_ms):
+    """Regressions as printable lines: slower median or more statements than the baseline."""
+    out = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+        slower = r["median_ms"] - b["median_ms"]
+        if r["median_ms"] > b["median_ms"] * (1 + threshold) and slower > min_ms:
+            out.append(f"{name}: median {b['median_ms']:.3f} -> {r['median_ms']:.3f} ms "
+                       f"(+{slower / b['median_ms'] * 100:.0f}%)")
+        if r["queries"] > b["queries"]:
+            out.append(f"{name}: queries {b['queries']} -> {r['queries']}")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--words", type=int, default=10000, help="size of the synthetic words table")
+    ap.add_argument("--deck", type=int, default=500, help="words in each synthetic deck")
+    ap.add_argument("--users", type=int, default=5, help="number of synthetic decks")
+    ap.add_argument("--repeat", type=int, default=30, help="timed calls per case")
+    ap.add_argument("--filter", default="", help="only run cases whose name contains this")
+    ap.add_argument("--schema", default="bench")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--save", help="write the results to this JSON file")
+    ap.add_argument("--compare", help="baseline JSON to check the results against")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed median slowdown (0.25 = 25%%)")
+    ap.add_argument("--min-ms", type=float, default=0.2, help="ignore slowdowns smaller than this")
+    ap.add_argument("--pgserver", action="store_true", help="run against a temporary local Postgres")
+    args = ap.parse_args()
+
+    server = start_pgserver() if args.pgserver else None   # noqa: F841 (kept alive until exit)
+    fake = FakeGemini(chunk_delay=0).start()
+    setup_environment(args, fake)
+    counter, cursor_factory = install_query_counter()
+
+    ctx = prepare(args)
+    ctx["conn"].cursor_factory = cursor_factory
+    results = {}
+    print(f"{'case':<42}{'median ms':>11}{'p95 ms':>10}{'queries':>9}")
+    for case in build_cases(ctx):
+        if args.filter not in case.name:
+            continue
+        r = results[case.name] = run_case(case, counter, args.repeat)
+        print(f"{case.name:<42}{r['median_ms']:>11.3f}{r['p95_ms']:>10.3f}{r['queries']:>9g}")
+    fake.stop()
+
+    meta = {"words": args.words, "deck": args.deck, "users": args.users, "repeat": args.repeat}
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2, sort_keys=True)
+        print(f"saved {len(results)} results to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        if base.get("meta", {}).get("words") != args.words or base.get("meta", {}).get("deck") != args.deck:
+            print(f"warning: baseline was recorded with {base.get('meta')}, this run uses {meta}")
+        regressions = compare(results, base["results"], args.threshold, args.min_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.compare} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Synthetic data for benchmarks.
+Everything lives in a throwaway schema (default `bench`) so it never touches
+the real tables, even when pointed at the same database. Connection settings
+come from the usual DB_* env vars (see database.py), e.g. DB_SSLMODE=disable
+for a local Postgres.
+"""
+import random
+import string
+
+from psycopg2.extras import execute_values
+
+from database import get_pg_conn
+from migrations.migrate import migrate
+
+
+def connect(schema: str = "bench", fresh: bool = True):
+    """Open a connection whose search_path points at the benchmark schema, migrated to head."""
+    conn = get_pg_conn()
+    cur = conn.cursor()
+    if fresh:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+    cur.execute(f"SET search_path TO {schema}, public")
+    conn.commit()
+    migrate(conn)
+    return conn
+
+
+def fake_word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 11)))
+
+
+def seed_words(conn, n: int, seed: int = 0):
+    rng = random.Random(seed)
+    rows = []
+    for rank in range(1, n + 1):
+        w = fake_word(rng)
+        rows.append((w, f"/{w}/", f"This is an example with {w} in it.", rank, rng.randint(1, 5)))
+    cur = conn.cursor()
+    cur.execute("TRUNCATE words RESTART IDENTITY CASCADE")
+    execute_values(cur, "INSERT INTO words (word, phonetic, example, ranking, syllables) VALUES %s",
+                   rows, page_size=5000)
+    cur.execute("ANALYZE words")
+    conn.commit()
+
+
+def seed_deck(conn, user_id: int, size: int, seed: int = 0):
+    cur = conn.cursor()
+    cur.execute("SELECT count(*) FROM words")
+    total = cur.fetchone()[0]
+    rng = random.Random(seed + user_id)
+    ids = rng.sample(range(1, total + 1), min(size, total))
+    cur.execute("DELETE FROM user_vocab WHERE user_id = %s", (user_id,))
+    execute_values(
+        cur,
+        "INSERT INTO user_vocab (user_id, word_id, repetition_count, next_due, appearances, learned) VALUES %s",
+        [(user_id, wid, rng.randint(0, 4), None, rng.randint(0, 10), int(rng.random() < 0.2)) for wid in ids],
+        page_size=5000,
+    )
+    cur.execute("ANALYZE user_vocab")
+    conn.commit()
+    return ids
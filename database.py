@@ -1,7 +1,11 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
 # from supabase import create_client, Client
 # from dotenv import load_dotenv
 import psycopg2
+from utils.tracing import TracedCursor, record, register_stats, span
 # from psycopg2.extras import RealDictCursor
 
 # load_dotenv()
@@ -15,14 +19,224 @@ DB_NAME = os.environ.get("DB_NAME")
 DB_USER = os.environ.get("DB_USER")
 DB_PASSWORD = os.environ.get("DB_PASSWORD")
 DB_PORT = os.environ.get("DB_PORT", 6543)
+DB_SSLMODE = os.environ.get("DB_SSLMODE", "require")
+
+# --- Connection pool config (tune per Fly machine) ---
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))          # seconds to wait for a free conn
+DB_POOL_HEALTH_CHECK = float(os.environ.get("DB_POOL_HEALTH_CHECK", 30))  # ping conns idle longer than this
+DB_POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", 1800))  # recycle conns older than this
+
 
 def get_pg_conn():
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        port=DB_PORT,
-        sslmode="require",
-    )
-    return conn
\ No newline at end of file
+    """Open a brand-new connection. Prefer `pg_conn()` which borrows from the pool."""
+    with span("db connect"):
+        conn = psycopg2.connect(
+            host=DB_HOST,
+            dbname=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            port=DB_PORT,
+            sslmode=DB_SSLMODE,
+            cursor_factory=TracedCursor,   # per-query spans (utils/tracing.py)
+        )
+    return conn
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the pool timeout."""
+
+
+class PgPool:
+    """
+    Small thread-safe, bounded Postgres pool.
+    - at most `maxconn` connections are open (idle + checked out)
+    - callers wait up to `timeout` seconds for a free connection
+    - idle connections are pinged before reuse, broken or old ones are replaced
+    """
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 health_check_after=DB_POOL_HEALTH_CHECK, max_lifetime=DB_POOL_MAX_LIFETIME,
+                 connect=get_pg_conn):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("pool size must satisfy 0 <= minconn <= maxconn, maxconn >= 1")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self.max_lifetime = max_lifetime
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle = []          # [(conn, created_at, last_used)] — LIFO so hot conns stay hot
+        self._born = {}          # id(conn) -> created_at for checked-out conns
+        self._size = 0           # idle + checked out
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "health_check_failures": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+        for _ in range(minconn):
+            self._idle.append(self._new_conn())
+
+    def _new_conn(self):
+        conn = self._connect()
+        now = time.monotonic()
+        with self._cond:
+            self._size += 1
+            self._stats["connections_created"] += 1
+        return conn, now, now
+
+    def _is_healthy(self, conn, created_at, last_used):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if now - last_used < self.health_check_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def _drop(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["connections_discarded"] += 1
+            self._cond.notify()
+
+    def getconn(self, timeout: float = None):
+        """A connection, waiting up to `timeout` (default: the pool's) for a free slot."""
+        start = time.monotonic()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = start + timeout
+        while True:
+            entry = None
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("pool is closed")
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"no free connection after {timeout}s "
+                                          f"(maxconn={self.maxconn})")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1   # reserve a slot, connect outside the lock
+            if entry is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+                with self._cond:
+                    self._stats["connections_created"] += 1
+            else:
+                conn, created_at, last_used = entry
+                if not self._is_healthy(conn, created_at, last_used):
+                    self._drop(conn)
+                    continue
+            waited = time.monotonic() - start
+            record("db pool wait", waited)
+            with self._cond:
+                self._born[id(conn)] = created_at
+                self._stats["checkouts"] += 1
+                self._stats["wait_seconds_total"] += waited
+                self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        with self._cond:
+            created_at = self._born.pop(id(conn), time.monotonic())
+        if not discard and not conn.closed:
+            try:
+                # never hand the next borrower a half-finished transaction
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed or self._closed:
+            self._drop(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # lost/broken connection -> recycle it; plain SQL errors are cleared by rollback
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s["size"] = self._size
+            s["idle"] = len(self._idle)
+            s["in_use"] = self._size - len(self._idle)
+            s["maxconn"] = self.maxconn
+        s["wait_seconds_avg"] = s["wait_seconds_total"] / s["checkouts"] if s["checkouts"] else 0.0
+        return s
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._drop(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide pool, shared by every Streamlit session/rerun."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PgPool()
+    return _pool
+
+
+@contextmanager
+def pg_conn(timeout: float = None):
+    """Borrow a pooled connection:  `with pg_conn() as conn: ...` (timeout=0: don't wait for one)"""
+    with get_pool().connection(timeout) as conn:
+        yield conn
+
+
+def pool_stats():
+    return get_pool().stats() if _pool is not None else {}
+
+
+register_stats("db_pool", pool_stats)
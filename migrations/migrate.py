@@ -0,0 +1,99 @@
+"""
+Versioned schema migrations.
+
+Each file in migrations/versions/ named NNNN_description.sql is one version.
+Applied versions are recorded in `schema_migrations`; running `migrate` again
+only applies what is missing, so it is safe on every deploy:
+
+    python -m migrations.migrate            # apply pending versions
+    python -m migrations.migrate --status   # list applied / pending
+"""
+import argparse
+import re
+from pathlib import Path
+
+VERSIONS_DIR = Path(__file__).parent / "versions"
+LOCK_KEY = 7_411_202   # pg_advisory_xact_lock id: one migrator at a time across Fly machines
+
+_FILE_RE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+
+def available_migrations():
+    """[(version, name, path)] sorted by version."""
+    found = []
+    for path in VERSIONS_DIR.iterdir():
+        m = _FILE_RE.match(path.name)
+        if m:
+            found.append((m.group(1), m.group(2), path))
+    return sorted(found)
+
+
+def _ensure_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def applied_versions(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_KEY,))   # CREATE TABLE IF NOT EXISTS can race
+    _ensure_table(cur)
+    conn.commit()
+    cur.execute("SELECT version FROM schema_migrations")
+    return {r[0] for r in cur.fetchall()}
+
+
+def migrate(conn, verbose: bool = False):
+    """Apply every pending migration, each in its own transaction. Returns applied versions.
+
+    The lock is transaction-scoped (released at COMMIT/ROLLBACK), so this also
+    works through the pgbouncer transaction pooler, where a session-level
+    lock and its unlock could land on different server connections.
+    """
+    cur = conn.cursor()
+    done = applied_versions(conn)
+    conn.commit()
+    applied = []
+    for version, name, path in available_migrations():
+        if version in done:
+            continue
+        try:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_KEY,))
+            # another machine may have applied it while we waited for the lock
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cur.fetchone() is None:
+                cur.execute(path.read_text())
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                applied.append(version)
+                if verbose:
+                    print(f"applied {version}_{name}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+
+def main():
+    from database import pg_conn
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--status", action="store_true", help="show applied/pending versions and exit")
+    args = ap.parse_args()
+    with pg_conn() as conn:
+        if args.status:
+            done = applied_versions(conn)
+            for version, name, _ in available_migrations():
+                print(f"{'applied' if version in done else 'pending'}  {version}_{name}")
+            return
+        applied = migrate(conn, verbose=True)
+        if not applied:
+            print("schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
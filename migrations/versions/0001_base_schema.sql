@@ -0,0 +1,34 @@
+-- Tables the app already expects. IF NOT EXISTS so existing Supabase
+-- databases are left untouched and only get the version recorded.
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS words (
+    id SERIAL PRIMARY KEY,
+    word TEXT NOT NULL,
+    phonetic TEXT,
+    example TEXT,
+    ranking INTEGER,
+    syllables INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS user_vocab (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    word_id INTEGER NOT NULL,
+    repetition_count INTEGER DEFAULT 0,
+    next_due DATE,
+    appearances INTEGER DEFAULT 0,
+    learned INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS chunks (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    chunk TEXT NOT NULL,
+    topic TEXT,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
@@ -0,0 +1,22 @@
+-- Indexes behind the hot queries in utils/vocab_utils.py and app.py.
+
+-- add_user_vocab: ON CONFLICT needs a unique index to detect the duplicate.
+-- Fails loudly if user_vocab already holds duplicate (user_id, word_id) rows.
+CREATE UNIQUE INDEX IF NOT EXISTS user_vocab_user_word_uidx
+    ON user_vocab (user_id, word_id);
+
+-- get_due_for_user / "Spaced Review": filter by user + learned, order by next_due.
+CREATE INDEX IF NOT EXISTS user_vocab_user_learned_due_idx
+    ON user_vocab (user_id, learned, next_due);
+
+-- Study only ever looks at unlearned words: smaller partial index for that case.
+CREATE INDEX IF NOT EXISTS user_vocab_unlearned_due_idx
+    ON user_vocab (user_id, next_due) WHERE learned = 0;
+
+-- Browse ordering (ranking, id is also a stable keyset for paging).
+CREATE INDEX IF NOT EXISTS words_ranking_idx
+    ON words (ranking, id);
+
+-- "LLM Chunks": DISTINCT topic per user and chunks per topic, newest first.
+CREATE INDEX IF NOT EXISTS chunks_user_topic_created_idx
+    ON chunks (user_id, topic, created_at DESC);
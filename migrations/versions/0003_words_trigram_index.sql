@@ -0,0 +1,19 @@
+-- Trigram index so `word ILIKE '%q%'` (the SQL fallback of Browse search) can
+-- use an index. pg_trgm ships with Supabase; on a bare local Postgres without
+-- contrib the extension is missing and this step is skipped with a NOTICE.
+DO $$
+DECLARE
+    trgm_schema TEXT;
+BEGIN
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE NOTICE 'pg_trgm not available (%), skipping words.word trigram index', SQLERRM;
+        RETURN;
+    END;
+    -- Supabase installs extensions into the "extensions" schema: qualify the opclass
+    SELECT extnamespace::regnamespace::text INTO trgm_schema FROM pg_extension WHERE extname = 'pg_trgm';
+    EXECUTE format('CREATE INDEX IF NOT EXISTS words_word_trgm_idx ON words USING gin (word %I.gin_trgm_ops)',
+                   trgm_schema);
+END
+$$;
@@ -0,0 +1,11 @@
+-- Shared tier of the LLM response cache (utils/llm_utils.py LLMCache).
+-- One row per (key, variant); key = sha256 of (model, prompt, generation_config).
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT NOT NULL,
+    variant INTEGER NOT NULL DEFAULT 0,
+    response TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (key, variant)
+);
+
+CREATE INDEX IF NOT EXISTS llm_cache_created_idx ON llm_cache (created_at);
@@ -0,0 +1,8 @@
+-- Per-word state for the pluggable scheduler (utils/scheduler.py).
+-- NULL means "not yet reviewed under that algorithm"; the ladder only needs
+-- repetition_count, SM-2 adds ease/interval, FSRS adds stability/difficulty.
+ALTER TABLE user_vocab ADD COLUMN IF NOT EXISTS interval_days REAL;
+ALTER TABLE user_vocab ADD COLUMN IF NOT EXISTS ease REAL;
+ALTER TABLE user_vocab ADD COLUMN IF NOT EXISTS stability REAL;
+ALTER TABLE user_vocab ADD COLUMN IF NOT EXISTS difficulty REAL;
+ALTER TABLE user_vocab ADD COLUMN IF NOT EXISTS last_reviewed DATE;
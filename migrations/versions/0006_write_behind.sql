@@ -0,0 +1,8 @@
+-- Highest op sequence number applied from each write-behind log
+-- (utils/write_behind.py). Updated in the same transaction as the ops, so
+-- replay after a crash never applies an op twice.
+CREATE TABLE IF NOT EXISTS write_behind_applied (
+    queue_id TEXT PRIMARY KEY,
+    seq BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,14 @@
+-- register_user relies on INSERT ... ON CONFLICT (username), which needs a
+-- unique index on users(username). 0001 declares it, but databases created
+-- before the migrations may not have it.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = 'users'::regclass AND i.indisunique
+          AND i.indnatts = 1 AND a.attname = 'username'
+    ) THEN
+        CREATE UNIQUE INDEX users_username_uidx ON users (username);
+    END IF;
+END $$;
@@ -0,0 +1,50 @@
+-- Saved chunks, deduplicated: one shared lexicon row per chunk text
+-- (case-insensitive, whitespace collapsed) and one link per (user, topic,
+-- chunk). Saving the same chunks again inserts nothing. See
+-- save_chunks_for_user in utils/llm_utils.py.
+
+CREATE TABLE IF NOT EXISTS chunk_lexicon (
+    id SERIAL PRIMARY KEY,
+    chunk TEXT NOT NULL,                     -- first spelling seen
+    frequency INTEGER NOT NULL DEFAULT 0,    -- number of user_chunks links
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS chunk_lexicon_lower_chunk_uidx
+    ON chunk_lexicon (lower(chunk));
+
+CREATE TABLE IF NOT EXISTS user_chunks (
+    user_id INTEGER NOT NULL,
+    topic TEXT NOT NULL DEFAULT '',
+    chunk_id INTEGER NOT NULL REFERENCES chunk_lexicon (id),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, topic, chunk_id)
+);
+
+-- "LLM Chunks": topics per user, and chunks per topic newest first.
+CREATE INDEX IF NOT EXISTS user_chunks_user_topic_created_idx
+    ON user_chunks (user_id, topic, created_at DESC);
+
+-- Move what is in the old per-save `chunks` table. The table itself is left
+-- in place (nothing writes to it any more) and can be dropped later.
+INSERT INTO chunk_lexicon (chunk, created_at)
+SELECT DISTINCT ON (lower(c.text)) c.text, c.created_at
+FROM (
+    SELECT btrim(regexp_replace(chunk, '\s+', ' ', 'g')) AS text, coalesce(created_at, now()) AS created_at
+    FROM chunks
+) c
+WHERE c.text <> ''
+ORDER BY lower(c.text), c.created_at
+ON CONFLICT ((lower(chunk))) DO NOTHING;
+
+INSERT INTO user_chunks (user_id, topic, chunk_id, created_at)
+SELECT c.user_id, coalesce(c.topic, ''), l.id, min(coalesce(c.created_at, now()))
+FROM chunks c
+JOIN chunk_lexicon l ON lower(l.chunk) = lower(btrim(regexp_replace(c.chunk, '\s+', ' ', 'g')))
+GROUP BY c.user_id, coalesce(c.topic, ''), l.id
+ON CONFLICT DO NOTHING;
+
+UPDATE chunk_lexicon l
+SET frequency = s.links
+FROM (SELECT chunk_id, count(*) AS links FROM user_chunks GROUP BY chunk_id) s
+WHERE s.chunk_id = l.id;
@@ -0,0 +1,33 @@
+-- Search over saved chunks and topics (search_chunks_for_user in
+-- utils/llm_utils.py): full-text matches go through a stored tsvector and
+-- GIN indexes, substring / typo matches through trigram indexes when pg_trgm
+-- is available. Without contrib the trigram step is skipped with a NOTICE and
+-- substring matches fall back to filtering the user's own links.
+
+ALTER TABLE chunk_lexicon
+    ADD COLUMN IF NOT EXISTS search tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', chunk)) STORED;
+
+CREATE INDEX IF NOT EXISTS chunk_lexicon_search_idx
+    ON chunk_lexicon USING gin (search);
+
+CREATE INDEX IF NOT EXISTS user_chunks_topic_search_idx
+    ON user_chunks USING gin (to_tsvector('english', topic));
+
+DO $$
+DECLARE
+    trgm_schema TEXT;
+BEGIN
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE NOTICE 'pg_trgm not available (%), skipping chunk trigram indexes', SQLERRM;
+        RETURN;
+    END;
+    SELECT extnamespace::regnamespace::text INTO trgm_schema FROM pg_extension WHERE extname = 'pg_trgm';
+    EXECUTE format('CREATE INDEX IF NOT EXISTS chunk_lexicon_chunk_trgm_idx ON chunk_lexicon USING gin (chunk %I.gin_trgm_ops)',
+                   trgm_schema);
+    EXECUTE format('CREATE INDEX IF NOT EXISTS user_chunks_topic_trgm_idx ON user_chunks USING gin (topic %I.gin_trgm_ops)',
+                   trgm_schema);
+END
+$$;
@@ -0,0 +1,7 @@
+-- Lookups behind the local fallbacks in utils/llm_utils.py, which have to fit
+-- in a few milliseconds of the latency budget:
+-- local_passage finds the target words' examples by lower(word) ...
+CREATE INDEX IF NOT EXISTS words_lower_word_idx ON words (lower(word));
+
+-- ... and local_chunk_passage takes the most often saved chunks.
+CREATE INDEX IF NOT EXISTS chunk_lexicon_frequency_idx ON chunk_lexicon (frequency DESC, id);
@@ -0,0 +1,3 @@
+-- Session tokens (utils/auth_utils.py) carry the user's session_version; logout
+-- bumps it, which revokes every token issued before, including copied URLs.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS session_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,4 @@
+-- Bumped by save_chunks_for_user in the same transaction as the new links; the
+-- cached topic list (get_chunk_topics in utils/llm_utils.py) is keyed on it, so
+-- a save on one machine invalidates the cache on every machine.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS chunk_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,8 @@
+-- Per-user deck versions, bumped in the same transaction as every deck change
+-- (utils/vocab_utils.py, utils/write_behind.py): deck_version on any add, review
+-- or mark-learned, membership_version only on add / mark-learned. The cached
+-- word lists and the pre-generated passages are keyed on them, so a change on
+-- one machine invalidates the caches of every machine.
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS deck_version INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS membership_version INTEGER NOT NULL DEFAULT 0;
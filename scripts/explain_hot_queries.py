@@ -0,0 +1,118 @@
+"""
+Capture EXPLAIN ANALYZE for the app's hot queries.
+
+Run it after a migration or a query change and diff the output against the
+previous capture: a plan that flips from an Index Scan to a Seq Scan shows up
+immediately (and is flagged in the summary).
+
+    python scripts/explain_hot_queries.py --user-id 1 --out explain/$(date +%F).txt
+
+Write statements are explained inside a transaction that is rolled back.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import pg_conn  # noqa: E402
+from utils.vocab_utils import _USER_WORDS_SQL, _USER_WORD_ORDERS  # noqa: E402
+
+# (name, where it lives, sql, params) — %(user_id)s is filled from --user-id
+HOT_QUERIES = [
+    ("browse_top_by_rank", "vocab_utils._search_vocab_sql", """
+        SELECT w.id, w.word, w.phonetic, w.example, w.ranking, w.syllables
+        FROM words w LEFT JOIN user_vocab uv ON w.id = uv.word_id AND uv.user_id = %(user_id)s
+        WHERE w.ranking >= 1 AND w.ranking <= 100 AND uv.word_id IS NULL
+        ORDER BY w.ranking ASC LIMIT 30"""),
+    ("browse_search_ilike", "vocab_utils._search_vocab_sql", """
+        SELECT w.id, w.word, w.phonetic, w.example, w.ranking, w.syllables
+        FROM words w LEFT JOIN user_vocab uv ON w.id = uv.word_id AND uv.user_id = %(user_id)s
+        WHERE w.word ILIKE '%%tion%%' AND uv.word_id IS NULL
+        ORDER BY w.ranking ASC LIMIT 30"""),
+    ("browse_keyset_page", "vocab_utils._search_vocab_sql", """
+        SELECT w.id, w.word, w.phonetic, w.example, w.ranking, w.syllables
+        FROM words w LEFT JOIN user_vocab uv ON w.id = uv.word_id AND uv.user_id = %(user_id)s
+        WHERE w.ranking >= 1 AND w.ranking <= 5000 AND uv.word_id IS NULL AND (w.ranking, w.id) > (4000, 0)
+        ORDER BY w.ranking ASC, w.id ASC LIMIT 31"""),
+    ("user_word_ids", "vocab_index.get_user_word_ids", """
+        SELECT word_id FROM user_vocab WHERE user_id = %(user_id)s"""),
+    ("due_for_user", "vocab_utils.get_due_for_user", """
+        SELECT uv.id, v.id, v.word, v.phonetic, v.example, uv.repetition_count, uv.appearances
+        FROM user_vocab uv JOIN words v ON uv.word_id = v.id
+        WHERE uv.user_id = %(user_id)s AND (uv.next_due IS NULL OR DATE(uv.next_due) <= DATE('now')) AND uv.learned = 0
+        ORDER BY uv.next_due LIMIT 10"""),
+    # the exact statements of vocab_utils.get_user_words, not a copy
+    ("spaced_review", "vocab_utils.get_user_words(order='next_due')",
+     _USER_WORDS_SQL.format(order=_USER_WORD_ORDERS["next_due"])),
+    ("my_words", "vocab_utils.get_user_words(order='appearances')",
+     _USER_WORDS_SQL.format(order=_USER_WORD_ORDERS["appearances"])),
+    ("random_unlearned_words", "llm_utils.get_random_words_from_db", """
+        WITH bounds AS (SELECT min(id) AS lo, max(id) AS hi FROM words),
+        probes AS (
+            SELECT DISTINCT lo + floor(random() * (hi - lo + 1))::int AS id
+            FROM bounds, generate_series(1, 16) WHERE lo IS NOT NULL
+        )
+        SELECT w.word FROM probes p JOIN words w ON w.id = p.id
+        WHERE NOT EXISTS (SELECT 1 FROM user_vocab uv WHERE uv.user_id = %(user_id)s AND uv.word_id = w.id)
+        ORDER BY random() LIMIT 3"""),
+    ("add_user_vocab", "vocab_utils.add_user_vocab", """
+        INSERT INTO user_vocab (user_id, word_id, repetition_count, next_due, appearances)
+        VALUES (%(user_id)s, (SELECT min(id) FROM words), 0, DATE('now'), 0)
+        ON CONFLICT DO NOTHING"""),
+    ("chunk_topics", "app.py LLM Chunks", """
+        SELECT DISTINCT topic FROM user_chunks WHERE user_id = %(user_id)s ORDER BY topic"""),
+    ("chunks_for_topic", "llm_utils.search_chunks_for_user", """
+        SELECT l.chunk, uc.topic, count(*) OVER () AS total
+        FROM user_chunks uc JOIN chunk_lexicon l ON l.id = uc.chunk_id
+        WHERE uc.user_id = %(user_id)s AND uc.topic = 'Daily life'
+        ORDER BY uc.created_at DESC, l.id LIMIT 20 OFFSET 0"""),
+    ("chunk_search", "llm_utils.search_chunks_for_user", """
+        SELECT l.chunk, uc.topic, count(*) OVER () AS total
+        FROM user_chunks uc JOIN chunk_lexicon l ON l.id = uc.chunk_id
+        WHERE uc.user_id = %(user_id)s AND (
+            l.search @@ websearch_to_tsquery('english', 'decision')
+            OR to_tsvector('english', uc.topic) @@ websearch_to_tsquery('english', 'decision')
+            OR l.chunk ILIKE '%%decision%%' OR uc.topic ILIKE '%%decision%%')
+        ORDER BY ts_rank(l.search, websearch_to_tsquery('english', 'decision')) DESC, uc.created_at DESC, l.id
+        LIMIT 20 OFFSET 0"""),
+]
+
+BIG_TABLES = ("words", "user_vocab", "user_chunks", "chunk_lexicon")
+
+
+def explain_all(conn, user_id: int):
+    """Yield (name, source, plan_text, seq_scanned_tables)."""
+    cur = conn.cursor()
+    for name, source, sql in HOT_QUERIES:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, {"user_id": user_id})
+        plan = "\n".join(r[0] for r in cur.fetchall())
+        conn.rollback()   # undo write statements, keep the connection clean
+        seq = [t for t in BIG_TABLES if f"Seq Scan on {t}" in plan]
+        yield name, source, plan, seq
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--user-id", type=int, required=True, help="a real user with a typical deck")
+    ap.add_argument("--out", help="write the capture to this file instead of stdout")
+    args = ap.parse_args()
+
+    lines, summary = [], []
+    with pg_conn() as conn:
+        for name, source, plan, seq in explain_all(conn, args.user_id):
+            lines += [f"=== {name}  ({source})", plan, ""]
+            flag = f"SEQ SCAN on {', '.join(seq)}" if seq else "ok"
+            summary.append(f"{name:<24} {flag}")
+    text = "\n".join(lines + ["=== summary"] + summary) + "\n"
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            f.write(text)
+        print("\n".join(summary))
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
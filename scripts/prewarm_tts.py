@@ -0,0 +1,62 @@
+"""
+Pre-render pronunciation audio into the on-disk TTS cache.
+
+Renders the top-N words by ranking (and, with --chunks, every distinct saved
+chunk) so the first learner to open a word doesn't wait for synthesis.
+Already-cached entries are skipped, so the job is safe to re-run.
+
+    python scripts/prewarm_tts.py --top 5000 --chunks --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import pg_conn  # noqa: E402
+from utils.tts_utils import pronunciation_audio, audio_cache, TTS_ENGINE  # noqa: E402
+
+
+def texts_to_render(conn, top: int, chunks: bool):
+    cur = conn.cursor()
+    cur.execute("SELECT word FROM words WHERE ranking IS NOT NULL ORDER BY ranking, id LIMIT %s", (top,))
+    texts = [r[0] for r in cur.fetchall()]
+    if chunks:
+        cur.execute("SELECT chunk FROM chunk_lexicon")
+        texts += [r[0] for r in cur.fetchall()]
+    return texts
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--top", type=int, default=5000, help="number of top-ranked words")
+    ap.add_argument("--chunks", action="store_true", help="also render saved chunks")
+    ap.add_argument("--engine", default=TTS_ENGINE)
+    ap.add_argument("--workers", type=int, default=4)
+    args = ap.parse_args()
+
+    with pg_conn() as conn:
+        texts = texts_to_render(conn, args.top, args.chunks)
+
+    failed = 0
+
+    def render(text):
+        nonlocal failed
+        try:
+            pronunciation_audio(text, engine=args.engine)
+        except Exception as e:
+            failed += 1
+            print(f"  {text!r}: {e}", file=sys.stderr)
+
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(render, texts))
+    s = audio_cache.stats
+    print(f"{len(texts)} texts in {time.perf_counter() - t:.1f}s: {s['hits']} already cached, "
+          f"{s['misses'] - failed} rendered, {failed} failed, {s['evicted']} evicted")
+
+
+if __name__ == "__main__":
+    main()
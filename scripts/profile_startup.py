@@ -0,0 +1,95 @@
+"""
+Report what a cold start spends on imports.
+
+Runs `python -X importtime` on a fresh interpreter that imports streamlit
+(already loaded by `streamlit run` before app.py executes) and then the
+target module, and lists the modules imported on behalf of the target by
+cumulative and by self time, plus a total per top-level package.
+
+    python scripts/profile_startup.py                  # app.py
+    python scripts/profile_startup.py --module utils.llm_utils --top 15
+    python scripts/profile_startup.py --first-run      # also time the login screen's first run
+
+--first-run renders app.py once with Streamlit's AppTest in a new process,
+which is what the first learner waits for after a scale-to-zero boot.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(module: str, preload: str = "streamlit"):
+    """[(module, self_us, cumulative_us, depth)] for imports triggered by `module` after `preload`."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault("GOOGLE_API_KEY", "startup-profile")     # llm_utils reads it at import
+    code = f"import {preload}; import {module}" if preload else f"import {module}"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(proc.stderr[-2000:])
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2))
+    if preload:
+        # children are printed before their parent; everything up to the preload's own line is its tree
+        done = next(i for i, r in enumerate(rows) if r[0] == preload and r[3] == 0)
+        rows = rows[done + 1:]
+    return rows
+
+
+def first_run_seconds() -> float:
+    code = (
+        "import time, streamlit\n"
+        "from streamlit.testing.v1 import AppTest\n"
+        "t = time.perf_counter()\n"
+        "at = AppTest.from_file('app.py', default_timeout=120).run()\n"
+        "assert not at.exception, at.exception\n"
+        "print(time.perf_counter() - t)\n"
+    )
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault("GOOGLE_API_KEY", "startup-profile")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(proc.stderr[-2000:])
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", default="app", help="module to import (default: app)")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--no-preload", action="store_true", help="count streamlit's own imports too")
+    ap.add_argument("--first-run", action="store_true", help="also time the first script run of app.py")
+    args = ap.parse_args()
+
+    rows = import_times(args.module, preload=None if args.no_preload else "streamlit")
+    total = next((cum for name, _, cum, depth in rows if name == args.module and depth == 0), 0)
+    print(f"import {args.module}: {total / 1000:.1f} ms"
+          + ("" if args.no_preload else " (after streamlit)") + f", {len(rows)} modules\n")
+
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for name, self_us, cum_us, depth in sorted(rows, key=lambda r: -r[2])[:args.top]:
+        print(f"{cum_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {'  ' * depth}{name}")
+
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    print(f"\n{'self ms':>10}  package")
+    for pkg, us in sorted(by_package.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"{us / 1000:>10.1f}  {pkg}")
+
+    if args.first_run:
+        print(f"\nfirst run of app.py (login screen, cold process): {first_run_seconds() * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+from utils.llm_utils import blank_stream, create_fill_in_blank
+
+TEXT = ("Yesterday I ran to the park. On the other hand, my sister was running late, "
+        "so she ran home on the other hand street.")
+TARGETS = ["run", "on the other hand"]
+
+
+def test_streamed_blanks_match_whole_text():
+    expected = create_fill_in_blank(TEXT, TARGETS, blanks=3)
+    for size in (1, 3, 7, 11):
+        pieces = [TEXT[i:i + size] for i in range(0, len(TEXT), size)]
+        answers = []
+        out = "".join(blank_stream(iter(pieces), TARGETS, 3, answers))
+        assert (out, answers) == expected
+    assert "On the other hand" in expected[1]
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from utils import llm_utils
+from utils.llm_utils import LLMProvider, correct_sentences_with_llm
+
+ITEMS = [("run", "i run every day"), ("eat", "She eat apples.")]
+
+
+class StubProvider(LLMProvider):
+    name = "stub"
+
+    def __init__(self, text):
+        self.text = text
+
+    def generate_text(self, prompt, generation_config, variants=1, use_cache=True, timeout=None):
+        return self.text
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    def install(text):
+        monkeypatch.setattr(llm_utils, "provider", StubProvider(text))
+    return install
+
+
+@pytest.mark.parametrize("text", ["42", "null", "true", '"fine"', '{"results": "none"}', "{}", "not json"])
+def test_malformed_batch_falls_back_for_every_item(stub, text):
+    stub(text)
+    results = correct_sentences_with_llm(ITEMS)
+    assert [r["original"] for r in results] == [s for _, s in ITEMS]
+    assert results[0]["corrected"] == "I run every day."
+    assert all(r["explanation"].startswith("Fallback") for r in results)
+
+
+def test_results_are_matched_by_index(stub):
+    stub(json.dumps({"results": [
+        {"index": 2, "corrected": "She eats apples.", "explanation": "Third person -s."},
+        {"index": 9, "corrected": "stray", "explanation": ""},
+    ]}))
+    first, second = correct_sentences_with_llm(ITEMS)
+    assert second == {"original": "She eat apples.", "corrected": "She eats apples.",
+                      "explanation": "Third person -s."}
+    assert first["explanation"].startswith("Fallback")
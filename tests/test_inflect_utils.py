@@ -0,0 +1,38 @@
+from utils.inflect_utils import inflections
+
+
+def test_irregular_and_function_words_get_no_suffix_forms():
+    assert not {"bed", "best", "bing", "ber"} & inflections("be")
+    assert not {"seed", "seer"} & inflections("see")
+    assert "thing" not in inflections("the")
+    assert not {"used", "user", "using"} & inflections("us")
+
+
+def test_regular_forms_still_match():
+    assert {"stops", "stopped", "stopping"} <= inflections("stop")
+    assert {"studies", "studied", "studying"} <= inflections("study")
+    assert "saw" in inflections("see")
+
+
+def test_short_words_get_regular_forms():
+    assert {"runs", "ran", "running"} <= inflections("run")
+    assert {"goes", "went", "going"} <= inflections("go")
+    assert {"eats", "ate", "eating"} <= inflections("eat")
+    assert {"cuts", "cutting"} <= inflections("cut")
+    assert {"fits", "fitted", "fitting"} <= inflections("fit")
+    assert {"asks", "asked", "asking"} <= inflections("ask")
+    assert {"uses", "used", "using"} <= inflections("use")
+    assert {"tries", "tried", "trying"} <= inflections("try")
+    assert {"fixes", "fixed", "fixing"} <= inflections("fix")
+    assert {"dies", "died", "dying"} <= inflections("die")
+
+
+def test_degrees_only_on_request():
+    assert "faster" not in inflections("fast")
+    assert {"faster", "fastest"} <= inflections("fast", degrees=True)
+
+
+def test_fill_in_blank_does_not_blank_lookalikes():
+    from utils.llm_utils import create_fill_in_blank
+    _, answers = create_fill_in_blank("I saw a seed in the best bed. To be or not.", ["be", "see"])
+    assert answers == ["saw", "be"]
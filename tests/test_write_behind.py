@@ -0,0 +1,27 @@
+import time
+
+import psycopg2
+
+import utils.write_behind as wb
+
+
+def test_flusher_backs_off_while_postgres_is_down(tmp_path, monkeypatch):
+    attempts = []
+
+    def down(timeout=None):
+        attempts.append(time.monotonic())
+        raise psycopg2.OperationalError("connection refused")
+
+    monkeypatch.setattr(wb, "pg_conn", down)
+    monkeypatch.setattr(wb.WriteBehindQueue, "_applied_seq", lambda self: 0)
+    q = wb.WriteBehindQueue(path=str(tmp_path / "log"), queue_id="test", interval=0.05, batch_size=2, fsync=False)
+    q.start()
+    for word_id in range(5):                 # more than a full batch queued
+        q.enqueue("add", 1, word_id)
+    time.sleep(0.8)
+    q.close(timeout=1)
+
+    # backoff 0.1, 0.2, 0.4, ... -> a handful of tries, not a busy loop
+    assert 1 <= len(attempts) <= 5
+    assert q.depth() == 5
+    assert not q._thread.is_alive()
@@ -1,8 +1,52 @@
 # utils/auth_utils.py
 # import sqlite3
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+import secrets
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
 # from database import get_pg_conn
 
+logger = logging.getLogger("vocab.auth")
+
+# bcrypt cost factor for new hashes (existing hashes keep the cost they were made with)
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+# At most this many hashes run at once per process; a burst of logins queues here
+# instead of taking every core away from the other sessions.
+AUTH_MAX_CONCURRENCY = int(os.environ.get("AUTH_MAX_CONCURRENCY", 2))
+AUTH_HASH_TIMEOUT = float(os.environ.get("AUTH_HASH_TIMEOUT", 30))
+
+# Signed session tokens let a returning browser skip bcrypt. The token is kept in
+# the SESSION_COOKIE cookie (never in the URL), is short-lived, and logging out
+# revokes every token of the user (see revoke_sessions).
+# SESSION_SECRET must be the same on every machine and across deploys
+# (`fly secrets set SESSION_SECRET=...`); on Fly the app refuses to start without
+# it, elsewhere a per-process secret is used and tokens die with the process.
+SESSION_SECRET = os.environ.get("SESSION_SECRET", "").encode()
+if not SESSION_SECRET:
+    if os.environ.get("FLY_APP_NAME"):
+        raise RuntimeError("SESSION_SECRET is not set: every restart or other machine would log all users out")
+    logger.warning("SESSION_SECRET is not set; session tokens stop working when this process restarts")
+    SESSION_SECRET = secrets.token_hex(32).encode()
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 12 * 3600))
+SESSION_COOKIE = "session"
+
+_hash_pool = ThreadPoolExecutor(max_workers=AUTH_MAX_CONCURRENCY, thread_name_prefix="bcrypt")
+
+
+def hash_password(password: str) -> str:
+    fut = _hash_pool.submit(bcrypt.hashpw, password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    return fut.result(timeout=AUTH_HASH_TIMEOUT).decode()
+
+
+def check_password(password: str, pw_hash: str) -> bool:
+    fut = _hash_pool.submit(bcrypt.checkpw, password.encode(), pw_hash.encode())
+    return fut.result(timeout=AUTH_HASH_TIMEOUT)
 
 
 def get_user_by_username(conn, username: str):
@@ -13,24 +57,86 @@ def get_user_by_username(conn, username: str):
         return {"id": row[0], "username": row[1]}
     return None
 
-def login_user(conn, username: str, password: str) -> bool:
+def get_password_hash(conn, username: str):
     cur = conn.cursor()
     cur.execute("SELECT password_hash FROM users WHERE username = %s", (username,))
     r = cur.fetchone()
+    return r[0] if r else None
+
+def login_user(conn, username: str, password: str) -> bool:
+    pw_hash = get_password_hash(conn, username)
     # print(r, type(r))
 
-    if not r:
+    if not pw_hash:
         return False
-    pw_hash = r[0].encode()
-    return bcrypt.checkpw(password.encode(), pw_hash)
+    return check_password(password, pw_hash)
 
 def register_user(conn, username: str, password: str) -> bool:
+    """Hash, then create_user(). Holds `conn` during bcrypt: pages hash first and borrow a conn for create_user only."""
+    return create_user(conn, username, hash_password(password))
+
+def create_user(conn, username: str, pw_hash: str) -> bool:
+    """One statement: INSERT ... ON CONFLICT (username) DO NOTHING. False if the name is taken."""
     cur = conn.cursor()
-    cur.execute("SELECT id FROM users WHERE username = %s", (username,))
+    cur.execute("""
+        INSERT INTO users (username, password_hash) VALUES (%s, %s)
+        ON CONFLICT (username) DO NOTHING
+        RETURNING id
+    """, (username, pw_hash))
+    created = cur.fetchone() is not None
+    conn.commit()
+    return created
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def get_session_version(conn, username: str) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT session_version FROM users WHERE username = %s", (username,))
     r = cur.fetchone()
-    if r:
-        return False
-    pw_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-    cur.execute("INSERT INTO users (username, password_hash) VALUES (%s, %s)", (username, pw_hash))
+    return r[0] if r else 0
+
+def revoke_sessions(conn, username: str):
+    """Invalidate every token issued to `username` so far (logout signs out every device)."""
+    cur = conn.cursor()
+    cur.execute("UPDATE users SET session_version = session_version + 1 WHERE username = %s", (username,))
     conn.commit()
-    return True
+
+def issue_session_token(username: str, version: int = 0, ttl: int = SESSION_TTL) -> str:
+    """`payload.signature`, HMAC-SHA256 signed, expiring after `ttl` seconds; `version` is the user's session_version."""
+    payload = _b64(json.dumps({"u": username, "v": version, "exp": int(time.time()) + ttl}).encode())
+    sig = _b64(hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{sig}"
+
+def _token_payload(token: str):
+    try:
+        payload, sig = token.split(".", 1)
+        expected = _b64(hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).digest())
+        if not hmac.compare_digest(sig, expected):
+            return None
+        data = json.loads(_unb64(payload))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(data, dict) or data.get("exp", 0) < time.time():
+        return None
+    return data
+
+def resume_session(conn, token: str):
+    """
+    Username for a token that is validly signed, unexpired and not revoked:
+    its version must still be the user's session_version, and the user must
+    still exist. One indexed lookup, no bcrypt.
+    """
+    data = _token_payload(token)
+    if not data:
+        return None
+    cur = conn.cursor()
+    cur.execute("SELECT session_version FROM users WHERE username = %s", (data.get("u"),))
+    r = cur.fetchone()
+    if r is None or r[0] != data.get("v", 0):
+        return None
+    return data["u"]
@@ -0,0 +1,126 @@
+# utils/inflect_utils.py
+"""
+Rule-based English inflections, so "run" also matches "runs", "running" and
+"ran" when blanks are created. No dictionary dependency: regular suffix rules
+plus a small table of common irregular verbs.
+"""
+import re
+from functools import lru_cache
+from typing import Iterable, Set
+
+IRREGULAR = {
+    "be": ["am", "is", "are", "was", "were", "been", "being"],
+    "have": ["has", "had", "having"],
+    "do": ["does", "did", "done", "doing"],
+    "go": ["goes", "went", "gone", "going"],
+    "get": ["gets", "got", "gotten", "getting"],
+    "make": ["makes", "made", "making"],
+    "take": ["takes", "took", "taken", "taking"],
+    "come": ["comes", "came", "coming"],
+    "see": ["sees", "saw", "seen", "seeing"],
+    "know": ["knows", "knew", "known", "knowing"],
+    "think": ["thinks", "thought", "thinking"],
+    "give": ["gives", "gave", "given", "giving"],
+    "find": ["finds", "found", "finding"],
+    "tell": ["tells", "told", "telling"],
+    "say": ["says", "said", "saying"],
+    "run": ["runs", "ran", "running"],
+    "eat": ["eats", "ate", "eaten", "eating"],
+    "write": ["writes", "wrote", "written", "writing"],
+    "speak": ["speaks", "spoke", "spoken", "speaking"],
+    "buy": ["buys", "bought", "buying"],
+    "bring": ["brings", "brought", "bringing"],
+    "teach": ["teaches", "taught", "teaching"],
+    "catch": ["catches", "caught", "catching"],
+    "leave": ["leaves", "left", "leaving"],
+    "feel": ["feels", "felt", "feeling"],
+    "keep": ["keeps", "kept", "keeping"],
+    "begin": ["begins", "began", "begun", "beginning"],
+    "drive": ["drives", "drove", "driven", "driving"],
+    "choose": ["chooses", "chose", "chosen", "choosing"],
+    "grow": ["grows", "grew", "grown", "growing"],
+    "child": ["children"],
+    "person": ["people"],
+    "man": ["men"],
+    "woman": ["women"],
+    "foot": ["feet"],
+    "tooth": ["teeth"],
+    "mouse": ["mice"],
+    "good": ["better", "best"],
+    "bad": ["worse", "worst"],
+}
+
+# Articles, pronouns, prepositions and conjunctions never inflect, and suffix
+# rules on them mostly make unrelated words ("the" -> "thing", "us" -> "used").
+FUNCTION_WORDS = frozenset("""
+    a an the i me my we us our you your he him his she her it its they them their
+    this that these those who whom what which in on at to of by for from with as
+    into onto upon off out up over than then and or but nor so if not no yes
+""".split())
+
+_VOWELS = "aeiou"
+_WORD_RE = re.compile(r"^[a-z]+$")
+
+
+def _is_cvc(w: str) -> bool:
+    """One-syllable consonant-vowel-consonant ending (stop -> stopped)."""
+    if len(w) < 3 or w[-1] in _VOWELS + "wxy":
+        return False
+    if not (w[-2] in _VOWELS and w[-3] not in _VOWELS):
+        return False
+    return len(re.findall(r"[aeiou]+", w)) == 1
+
+
+@lru_cache(maxsize=65536)
+def inflections(word: str, degrees: bool = False) -> frozenset:
+    """
+    All forms of `word` (lower-cased, including the word itself). Cached, so
+    the variant table for the words in play is built once per process.
+    Irregular words get only their table forms ("be" must not match "bed"),
+    function words get none, and every other word gets the regular suffix
+    rules whatever its length ("cut" -> "cutting"). -er / -est only with
+    degrees=True, since they turn many verbs into nouns ("see" -> "seer").
+    """
+    w = word.strip().lower()
+    forms = {w}
+    if not _WORD_RE.match(w) or len(w) < 2 or w in FUNCTION_WORDS:
+        return frozenset(forms)   # multi-word chunks / odd tokens: exact match only
+    if w in IRREGULAR:
+        forms.update(IRREGULAR[w])
+        return frozenset(forms)
+
+    consonant_y = w.endswith("y") and w[-2] not in _VOWELS
+    # plural / 3rd person
+    if w.endswith(("s", "x", "z", "ch", "sh")):
+        forms.add(w + "es")
+    elif consonant_y:
+        forms.add(w[:-1] + "ies")
+    else:
+        forms.add(w + "s")
+    # -ed / -ing (and -er / -est)
+    if w.endswith("e"):
+        forms.add(w + "d")
+        forms.add(w[:-2] + "ying" if w.endswith("ie") else (w + "ing" if w.endswith(("ee", "ye", "oe")) else w[:-1] + "ing"))
+        if degrees:
+            forms.update((w + "r", w + "st"))
+    elif consonant_y:
+        forms.update((w[:-1] + "ied", w + "ing"))
+        if degrees:
+            forms.update((w[:-1] + "ier", w[:-1] + "iest"))
+    elif _is_cvc(w):
+        d = w + w[-1]
+        forms.update((d + "ed", d + "ing"))
+        if degrees:
+            forms.update((d + "er", d + "est"))
+    else:
+        forms.update((w + "ed", w + "ing"))
+        if degrees:
+            forms.update((w + "er", w + "est"))
+    return frozenset(forms)
+
+
+def variants_for(words: Iterable[str], inflect: bool = True) -> Set[str]:
+    out = set()
+    for w in words:
+        out.update(inflections(w) if inflect else {w.strip().lower()})
+    return out
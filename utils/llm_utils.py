@@ -1,8 +1,20 @@
 import os, random, re
-from typing import List, Tuple
-import google.generativeai as genai
+import hashlib
+import queue
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+from typing import List, Optional, Tuple
 import json
+import streamlit as st
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv, dotenv_values
+from database import pg_conn
+from .inflect_utils import variants_for
+from .tracing import record, register_stats
 
 # # Build absolute path to .env
 # dotenv_path = os.path.join(os.getcwd(), ".env")
@@ -10,15 +22,387 @@ from dotenv import load_dotenv, dotenv_values
 # # Load .env into a dictionary
 # config = dotenv_values(dotenv_path)
 
-class GeminiWrapper:
-    def __init__(self, api_key, model_name ="gemini-2.5-flash-lite"):
-        genai.configure(api_key=api_key)
+class GeminiTimeout(TimeoutError):
+    """The call (including queueing and retries) did not finish within its deadline."""
+
+
+@lru_cache(maxsize=1)
+def retryable_errors() -> tuple:
+    """429 / 5xx / server-side deadline -> worth another try."""
+    from google.api_core import exceptions as gexc
+    return (
+        gexc.TooManyRequests, gexc.ResourceExhausted, gexc.InternalServerError,
+        gexc.BadGateway, gexc.ServiceUnavailable, gexc.GatewayTimeout, gexc.DeadlineExceeded,
+    )
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram (Prometheus-style buckets, in seconds)."""
+
+    BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.buckets) + 1)   # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative, running = {}, 0
+            for le, c in zip(list(self.buckets) + ["+Inf"], self.counts):
+                running += c
+                cumulative[str(le)] = running
+            return {"buckets": cumulative, "count": self.count, "sum": self.sum}
+
+
+class LLMProvider:
+    """
+    What the feature functions need from a text model. Both methods raise on
+    failure (GeminiTimeout when a deadline is missed) so the caller can serve
+    its local fallback. GeminiWrapper is the one in use; another backend only
+    has to implement these and be installed with set_provider().
+    """
+    name = "llm"
+
+    def generate_text(self, prompt, generation_config, variants: int = 1, use_cache: bool = True,
+                      timeout: float = None) -> str:
+        raise NotImplementedError
+
+    def generate_text_stream(self, prompt, generation_config, variants: int = 1, first_timeout: float = None):
+        raise NotImplementedError
+
+
+class GeminiWrapper(LLMProvider):
+    """
+    Process-wide Gemini client.
+    - GenerativeModel objects are built once per generation config and reused
+    - at most `max_concurrency` requests are in flight; extra callers queue
+      in the worker pool, and that wait counts against their deadline
+    - each call has a deadline (`timeout` seconds) covering queueing and all
+      retries; 429/5xx are retried with full-jitter exponential backoff
+    - google.generativeai (about half a second of imports) is only loaded and
+      configured by the first call, not when the app starts
+    """
+    name = "gemini"
+
+    def __init__(self, api_key, model_name ="gemini-2.5-flash-lite", max_concurrency: int = 8,
+                 timeout: float = 30.0, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, endpoint: str = None):
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self._genai = None
         self.model_name = model_name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._models = {}
+        self._models_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini")
+        self.latency = LatencyHistogram()
+        self.ttft = LatencyHistogram()     # time to first streamed token
+        self.stats = {"calls": 0, "ok": 0, "retries": 0, "timeouts": 0, "errors": 0}
+
+    def _client(self):
+        """Import and configure google.generativeai on first use (caller holds _models_lock)."""
+        if self._genai is None:
+            import google.generativeai as genai
+            if self.endpoint:
+                # e.g. a local fake server (benchmarks/fake_gemini.py) — REST is the only transport it speaks
+                genai.configure(api_key=self.api_key, transport="rest", client_options={"api_endpoint": self.endpoint})
+            else:
+                genai.configure(api_key=self.api_key)
+            self._genai = genai
+        return self._genai
+
+    def _model(self, generation_config):
+        key = json.dumps(generation_config, sort_keys=True, default=str)
+        model = self._models.get(key)
+        if model is None:
+            with self._models_lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = self._models[key] = self._client().GenerativeModel(
+                        self.model_name, generation_config=generation_config)
+        return model
+
+    def warm_up(self):
+        """Load the client library now instead of in the first learner's request."""
+        with self._models_lock:
+            self._client()
+        retryable_errors()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def generate(self, prompt, generation_config, timeout: float = None):
+        model = self._model(generation_config)
+        start = time.monotonic()
+        deadline = start + (timeout or self.timeout)
+        self.stats["calls"] += 1
+        attempt, error = 0, None
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise GeminiTimeout(f"Gemini call exceeded {timeout or self.timeout}s")
+                # retry=None: this loop owns retries. The HTTP timeout gets a small grace so
+                # the deadline below always fires first and surfaces as GeminiTimeout.
+                future = self._executor.submit(model.generate_content, prompt,
+                                               request_options={"timeout": remaining + 1, "retry": None})
+                try:
+                    response = future.result(timeout=remaining)
+                    self.stats["ok"] += 1
+                    return response
+                except FutureTimeout:
+                    future.cancel()   # drops it if still queued; a running call ends at its HTTP timeout
+                    raise GeminiTimeout(f"Gemini call exceeded {timeout or self.timeout}s")
+                except retryable_errors():
+                    if attempt >= self.max_retries:
+                        raise
+                    pause = self._backoff(attempt)
+                    if time.monotonic() + pause >= deadline:
+                        raise
+                    attempt += 1
+                    self.stats["retries"] += 1
+                    time.sleep(pause)
+        except GeminiTimeout as e:
+            self.stats["timeouts"] += 1
+            error = type(e).__name__
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            error = type(e).__name__
+            raise
+        finally:
+            self.latency.observe(time.monotonic() - start)
+            record("llm generate", time.monotonic() - start, error, attempts=attempt + 1)
+
+    def generate_text(self, prompt, generation_config, variants: int = 1, use_cache: bool = True,
+                      timeout: float = None) -> str:
+        """
+        Like generate() but returns the stripped text and goes through llm_cache.
+        variants > 1 keeps a pool of that many different answers per prompt
+        (for sampling configs) and serves a random one once the pool is full.
+        """
+        if not use_cache:
+            return self.generate(prompt, generation_config, timeout=timeout).text.strip()
+        key = llm_cache.make_key(self.model_name, prompt, generation_config)
+        text = llm_cache.get(key, variants)
+        if text is None:
+            text = self.generate(prompt, generation_config, timeout=timeout).text.strip()
+            llm_cache.put(key, text, variants)
+        return text
+
+    def generate_stream(self, prompt, generation_config, timeout: float = None, first_timeout: float = None):
+        """
+        Yield text pieces as Gemini produces them (stream=True).
+        The HTTP stream is read on the bounded worker pool and handed over
+        through a queue, so the concurrency bound and the deadline still
+        apply. Retries only happen before the first piece arrives.
+        first_timeout, when set, is a shorter deadline for that first piece:
+        once text is flowing the stream may run until `timeout`.
+        """
+        model = self._model(generation_config)
+        start = time.monotonic()
+        limit = timeout or self.timeout
+        deadline = start + limit
+        first_deadline = start + min(first_timeout or limit, limit)
+        stop = threading.Event()
+        self.stats["calls"] += 1
+        attempt, first, error = 0, True, None
+
+        def pump(out, remaining):
+            try:
+                for chunk in model.generate_content(prompt, stream=True,
+                                                    request_options={"timeout": remaining + 1, "retry": None}):
+                    if stop.is_set():
+                        return
+                    try:
+                        piece = chunk.text
+                    except ValueError:    # safety-filtered / empty chunk
+                        continue
+                    out.put(("text", piece))
+                out.put(("done", None))
+            except Exception as e:
+                out.put(("error", e))
+
+        try:
+            while True:
+                out = queue.Queue()
+                self._executor.submit(pump, out, deadline - time.monotonic())
+                while True:
+                    remaining = (first_deadline if first else deadline) - time.monotonic()
+                    try:
+                        kind, value = out.get(timeout=max(remaining, 0))
+                    except queue.Empty:
+                        if first:
+                            raise GeminiTimeout(f"no Gemini output within {first_deadline - start:.1f}s")
+                        raise GeminiTimeout(f"Gemini stream exceeded {limit}s")
+                    if kind == "text":
+                        if first:
+                            self.ttft.observe(time.monotonic() - start)
+                            record("llm stream ttft", time.monotonic() - start)
+                            first = False
+                        yield value
+                    elif kind == "done":
+                        self.stats["ok"] += 1
+                        return
+                    else:
+                        break
+                # error: retry only if nothing was shown yet
+                if not first or not isinstance(value, retryable_errors()) or attempt >= self.max_retries:
+                    raise value
+                pause = self._backoff(attempt)
+                if time.monotonic() + pause >= first_deadline:
+                    raise value
+                attempt += 1
+                self.stats["retries"] += 1
+                time.sleep(pause)
+        except GeminiTimeout as e:
+            self.stats["timeouts"] += 1
+            error = type(e).__name__
+            raise
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            self.stats["errors"] += 1
+            error = type(e).__name__
+            raise
+        finally:
+            stop.set()
+            self.latency.observe(time.monotonic() - start)
+            record("llm stream", time.monotonic() - start, error, attempts=attempt + 1)
+
+    def generate_text_stream(self, prompt, generation_config, variants: int = 1, first_timeout: float = None):
+        """Streaming counterpart of generate_text(): a cache hit is yielded in one piece."""
+        key = llm_cache.make_key(self.model_name, prompt, generation_config)
+        text = llm_cache.get(key, variants)
+        if text is not None:
+            yield text
+            return
+        pieces = []
+        for piece in self.generate_stream(prompt, generation_config, first_timeout=first_timeout):
+            pieces.append(piece)
+            yield piece
+        llm_cache.put(key, "".join(pieces).strip(), variants)
+
+
+class LLMCache:
+    """
+    Two-tier response cache keyed on (model, prompt, generation_config).
+    - in-process tier: LRU (OrderedDict) with TTL, shared by all sessions of the process
+    - shared tier: the `llm_cache` table, shared by every Fly machine; errors there
+      are counted and ignored so a DB hiccup never breaks generation. It waits at
+      most `pool_wait` seconds for a pooled connection (the caller's rerun already
+      holds one), so a saturated pool skips the tier instead of stalling the call
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 7 * 24 * 3600, shared: bool = True,
+                 pool_wait: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.pool_wait = pool_wait
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()      # key -> (stored_at, [texts])
+        self.stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "shared_errors": 0}
+
+    @staticmethod
+    def make_key(model: str, prompt: str, generation_config: dict) -> str:
+        raw = json.dumps([model, prompt, generation_config], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
 
-    def generate(self, prompt, generation_config):
-        model = genai.GenerativeModel(self.model_name, generation_config=generation_config)
-        response= model.generate_content(prompt)
-        return response
+    def _mem_get(self, key) -> Optional[list]:
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._mem[key]
+                return None
+            self._mem.move_to_end(key)
+            return entry[1]
+
+    def _mem_set(self, key, texts, stored_at=None):
+        with self._lock:
+            self._mem[key] = (stored_at or time.time(), texts)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def _shared_get(self, key) -> list:
+        with pg_conn(self.pool_wait) as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT response FROM llm_cache WHERE key = %s AND created_at > now() - %s * interval '1 second' "
+                "ORDER BY variant",
+                (key, self.ttl),
+            )
+            return [r[0] for r in cur.fetchall() if r[0]]   # skip empty answers stored by older versions
+
+    def _shared_put(self, key, variant, text):
+        with pg_conn(self.pool_wait) as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO llm_cache (key, variant, response) VALUES (%s, %s, %s)
+                ON CONFLICT (key, variant) DO UPDATE SET response = EXCLUDED.response, created_at = now()
+            """, (key, variant, text))
+            conn.commit()
+
+    def get(self, key: str, variants: int = 1) -> Optional[str]:
+        """Return a cached text, or None when the caller should generate (and put) one."""
+        texts = self._mem_get(key)
+        tier = "memory_hits"
+        if (texts is None or len(texts) < variants) and self.shared:
+            try:
+                shared = self._shared_get(key)
+            except Exception:
+                self.stats["shared_errors"] += 1
+                shared = []
+            if shared and len(shared) >= len(texts or []):
+                texts, tier = shared, "shared_hits"
+                self._mem_set(key, list(shared))
+        if not texts or len(texts) < variants:
+            self.stats["misses"] += 1   # variant pool not full yet -> generate a fresh one
+            return None
+        self.stats[tier] += 1
+        return texts[0] if variants == 1 else random.choice(texts[:variants])
+
+    def put(self, key: str, text: str, variants: int = 1):
+        if not text:
+            return   # an empty answer (failed or empty stream) would be served on every later call
+        texts = list(self._mem_get(key) or [])
+        if variants == 1:
+            texts = [text]
+        elif len(texts) < variants:
+            texts.append(text)
+        else:
+            return
+        self._mem_set(key, texts)
+        if self.shared:
+            try:
+                self._shared_put(key, len(texts) - 1, text)
+            except Exception:
+                self.stats["shared_errors"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["shared_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
 
 config_for_passage = {
     "temperature": 0.8,
@@ -37,60 +421,209 @@ config_for_chunk = {
 
 api_key = os.environ.get("GOOGLE_API_KEY")
 
-gemini = GeminiWrapper(api_key)
+gemini = GeminiWrapper(
+    api_key,
+    max_concurrency=int(os.environ.get("GEMINI_MAX_CONCURRENCY", 8)),
+    timeout=float(os.environ.get("GEMINI_TIMEOUT", 30)),
+    max_retries=int(os.environ.get("GEMINI_MAX_RETRIES", 3)),
+    endpoint=os.environ.get("GEMINI_ENDPOINT"),
+)
+
+# LLM_CACHE_SHARED=0 keeps the cache in-process only (no llm_cache table needed)
+llm_cache = LLMCache(
+    max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 256)),
+    ttl=float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600)),
+    shared=os.environ.get("LLM_CACHE_SHARED", "1") != "0",
+    pool_wait=float(os.environ.get("LLM_CACHE_POOL_WAIT", 0)),
+)
+register_stats("gemini", lambda: gemini.stats)
+register_stats("llm_cache", lambda: dict(llm_cache.stats, hit_rate=llm_cache.hit_rate()))
 
+# The provider the feature functions call (see LLMProvider)
+provider: LLMProvider = gemini
+
+def set_provider(new_provider: LLMProvider):
+    global provider
+    provider = new_provider
+
+# Per-feature latency budgets (seconds). A streamed feature must show its first
+# text within the budget, a non-streamed one must finish within it; otherwise
+# the local fallback is served. Background work (passage_pool) has no budget.
+LLM_BUDGETS = {
+    "passage": float(os.environ.get("LLM_BUDGET_PASSAGE", 6)),
+    "chunks": float(os.environ.get("LLM_BUDGET_CHUNKS", 6)),
+    "correction": float(os.environ.get("LLM_BUDGET_CORRECTION", 4)),
+    "corrections": float(os.environ.get("LLM_BUDGET_CORRECTIONS", 10)),   # "Correct all" batch
+}
+
+# Which source served each feature: "<feature>_<provider name>" or "<feature>_local"
+llm_sources = {}
+_sources_lock = threading.Lock()
+
+def served(feature: str, source: str, seconds: float, error: Exception = None):
+    """Count and time (span "llm <feature> <source>") one answer of `feature`."""
+    key = f"{feature}_{source}"
+    with _sources_lock:
+        llm_sources[key] = llm_sources.get(key, 0) + 1
+    record(f"llm {feature} {source}", seconds, error=type(error).__name__ if error else None)
+
+register_stats("llm_source", lambda: dict(llm_sources))
+
+# Last resort when even the local fallback fails (e.g. the database is unreachable)
+STATIC_FALLBACK = "The passage writer is busy right now. Please try again in a moment."
+
+def safe_fallback(fallback, conn=None) -> str:
+    """fallback(), or STATIC_FALLBACK if it raises: the local path never fails the page."""
+    try:
+        return fallback()
+    except Exception:
+        if conn is not None:
+            try:
+                conn.rollback()   # keep the rerun's connection usable
+            except Exception:
+                pass
+        return STATIC_FALLBACK
+
+def hedged_stream(feature: str, pieces, fallback, conn=None):
+    """
+    Yield the provider stream `pieces`, or fallback() as one piece when the
+    stream fails before its first piece (budget missed, provider down). Once
+    text has been shown, errors propagate as before. The time recorded is the
+    wait until the first text. `conn` is the connection fallback() uses, if any.
+    """
+    start = time.monotonic()
+    try:
+        first = next(pieces, "")
+    except Exception as e:
+        text = safe_fallback(fallback, conn)
+        served(feature, "local", time.monotonic() - start, e)
+        yield text
+        return
+    served(feature, provider.name, time.monotonic() - start)
+    yield first
+    yield from pieces
+
+# How many different passages to keep per identical request (temperature 0.8 prompts)
+PASSAGE_VARIANTS = int(os.environ.get("LLM_CACHE_PASSAGE_VARIANTS", 3))
+
+
+# Oversampling used when probing random ids: each probe can miss (id gap) or hit
+# a word already in the user's deck, so ask for a few more than needed.
+SAMPLE_OVERSAMPLE = 4
+SAMPLE_MIN_PROBES = 16
 
 def get_random_words_from_db(conn, user_id: int, n: int) -> List[str]:
-    """Fetch n random words from vocab.db where learned=0."""
-    cursor = conn.cursor()
-    cursor.execute("SELECT word FROM words w LEFT JOIN user_vocab uv ON w.id = uv.word_id AND uv.user_id =%s WHERE uv.word_id IS NULL",(user_id,))
-    words = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    if not words:
+    """
+    Fetch n random words the user has not added yet.
+    Samples on the database side: probe random ids in [min(id), max(id)] (two
+    primary-key lookups), join them to `words` and anti-join `user_vocab`
+    with NOT EXISTS, so cost grows with n — not with the words table or the
+    user's deck. Falls back to ORDER BY random() only when the deck covers
+    almost the whole table.
+    """
+    if n <= 0:
         return []
-    return random.sample(words, min(n, len(words)))
+    cursor = conn.cursor()
+    probes = max(SAMPLE_MIN_PROBES, n * SAMPLE_OVERSAMPLE)
+    words = []
+    for _ in range(2):
+        cursor.execute("""
+            WITH bounds AS (SELECT min(id) AS lo, max(id) AS hi FROM words),
+            probes AS (
+                SELECT DISTINCT lo + floor(random() * (hi - lo + 1))::int AS id
+                FROM bounds, generate_series(1, %s)
+                WHERE lo IS NOT NULL
+            )
+            SELECT w.word FROM probes p JOIN words w ON w.id = p.id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM user_vocab uv WHERE uv.user_id = %s AND uv.word_id = w.id
+            )
+            ORDER BY random()   -- only over the few probed rows; avoids low-id bias
+            LIMIT %s
+        """, (probes, user_id, n))
+        words = [row[0] for row in cursor.fetchall()]
+        if len(words) >= n:
+            return words
+        probes *= 4
+    # Dense deck / sparse ids: let Postgres pick, still without shipping every row to Python
+    cursor.execute("""
+        SELECT w.word FROM words w
+        WHERE NOT EXISTS (
+            SELECT 1 FROM user_vocab uv WHERE uv.user_id = %s AND uv.word_id = w.id
+        )
+        ORDER BY random()
+        LIMIT %s
+    """, (user_id, n))
+    return [row[0] for row in cursor.fetchall()]
 
-def create_fill_in_blank(passage: str, target_words: List[str], blanks: int = 3) -> Tuple[str, List[str]]:
-    """Replace target words in passage with blanks."""
-    candidates = []
+def _trie_regex(forms) -> str:
+    """
+    Prefix-factored alternation: {"run", "runs", "running"} -> run(?:s|ning)?
+    The regex engine then walks the forms like a trie instead of retrying
+    every alternative at every position. Optional groups are greedy, so the
+    longest form wins.
+    """
+    trie = {}
+    for form in forms:
+        node = trie
+        for ch in form:
+            node = node.setdefault(ch, {})
+        node[""] = {}
 
+    def walk(node):
+        end = "" in node
+        alts = [re.escape(ch) + walk(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        if len(alts) == 1 and not end:
+            return alts[0]
+        group = "(?:" + "|".join(alts) + ")"
+        return group + "?" if end else group
+
+    return walk(trie)
+
+@lru_cache(maxsize=512)
+def _blank_pattern(targets: frozenset, inflect: bool):
+    """One compiled pattern over every target form."""
+    forms = variants_for(targets, inflect)
+    if not forms:
+        return None
+    return re.compile(r"\b" + _trie_regex(forms) + r"\b", flags=re.IGNORECASE)
+
+def create_fill_in_blank(passage: str, target_words: List[str], blanks: int = 3, inflect: bool = True) -> Tuple[str, List[str]]:
+    """
+    Replace target words in passage with blanks.
+    With inflect=True, inflected forms count too ("run" blanks "running"); the
+    answer is the form found in the passage. The passage is scanned once by a
+    single compiled (trie-shaped) pattern: finditer returns leftmost, non-overlapping
+    matches in order, so the first `blanks` matches are the chosen intervals.
+    """
     if target_words:
         # Use provided target words
-        for w in set(target_words):
-            pattern = re.compile(r"\b" + re.escape(w) + r"\b", flags=re.IGNORECASE)
-            for m in pattern.finditer(passage):
-                candidates.append((m.start(), m.end(), passage[m.start():m.end()], w))
+        pattern = _blank_pattern(frozenset(w for w in target_words if w.strip()), inflect)
     else:
         # Fallback — choose random words from passage itself
         words = re.findall(r"\b\w{4,}\b", passage)
         sampled = random.sample(words, min(blanks, len(words)))
-        for w in sampled:
-            pattern = re.compile(r"\b" + re.escape(w) + r"\b", flags=re.IGNORECASE)
-            for m in pattern.finditer(passage):
-                candidates.append((m.start(), m.end(), passage[m.start():m.end()], w))
+        pattern = _blank_pattern(frozenset(sampled), False)
 
-    if not candidates:
+    if pattern is None or blanks <= 0:
         return passage, []
 
-    # Pick non-overlapping blanks
-    chosen, occupied = [], [False] * len(passage)
-    for start, end, found, canonical in sorted(candidates, key=lambda x: x[0]):
-        if len(chosen) >= blanks:
+    # Stitch unchanged slices and blanks together once
+    parts, answers, prev = [], [], 0
+    for m in pattern.finditer(passage):
+        parts.append(passage[prev:m.start()])
+        parts.append("____")
+        answers.append(m.group())
+        prev = m.end()
+        if len(answers) >= blanks:
             break
-        if any(occupied[start:end]):
-            continue
-        chosen.append((start, end, found, canonical))
-        for i in range(start, end):
-            occupied[i] = True
-
-    # Replace chosen words with blanks
-    masked_chars, answers = list(passage), []
-    for start, end, found, canonical in reversed(chosen):
-        masked_chars[start:end] = list("____")
-        answers.append(found)
-    answers.reverse()
+    if not answers:
+        return passage, []
+    parts.append(passage[prev:])
 
-    return ''.join(masked_chars), answers
+    return ''.join(parts), answers
 
 def generate_passage_with_blanks(conn,user_id: int,words: List[str] = None, length: int = 200, blanks: int = 3, level: str = "B1 (Easy)") -> Tuple[str, List[str]]:
     """
@@ -102,7 +635,54 @@ def generate_passage_with_blanks(conn,user_id: int,words: List[str] = None, leng
         # Fetch words from database
         words = get_random_words_from_db(conn, user_id, blanks)
 
+    start = time.monotonic()
+    try:
+        passage = generate_passage(words, length=length, level=level, timeout=LLM_BUDGETS["passage"])
+        served("passage", provider.name, time.monotonic() - start)
+    except Exception as e:
+        passage = safe_fallback(lambda: local_passage(conn, user_id, words, length), conn)
+        served("passage", "local", time.monotonic() - start, e)
+
+    # Create blanks (fallback to random words in passage if needed)
+    passage_with_blanks, answers = create_fill_in_blank(passage, words, blanks=blanks)
+    return passage_with_blanks, answers
 
+def generate_passage(words: List[str], length: int = 200, level: str = "B1 (Easy)", timeout: float = None) -> str:
+    """Ask the LLM for a passage containing `words` (no blanks yet)."""
+    return provider.generate_text(passage_prompt(words, length, level), config_for_passage,
+                                  variants=PASSAGE_VARIANTS, timeout=timeout)
+
+# Average length of a words.example sentence, to size the local passage
+EXAMPLE_WORDS = 12
+
+def _with_conn(conn, fn, *args):
+    """fn(conn, *args), on a pooled connection borrowed just for the call when conn is None."""
+    if conn is not None:
+        return fn(conn, *args)
+    with pg_conn() as conn:
+        return fn(conn, *args)
+
+def local_passage(conn, user_id: int, words: List[str], length: int = 200) -> str:
+    """
+    Fallback passage without the LLM: the `words.example` sentences of the
+    target words, padded with examples of other unlearned words up to about
+    `length` words, in random order. A target without an example gets a
+    one-line template so it can still be blanked.
+    """
+    extra = max(0, min(length // EXAMPLE_WORDS, 12) - len(words))
+    others = get_random_words_from_db(conn, user_id, extra) if extra else []
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT lower(word), example FROM words WHERE lower(word) = ANY(%s) AND coalesce(example, '') <> ''",
+        ([w.lower() for w in list(words) + others],)
+    )
+    examples = dict(cursor.fetchall())
+    sentences = [examples.get(w.lower()) or f"Today's word is {w}." for w in words]
+    sentences += [examples[w.lower()] for w in others if w.lower() in examples]
+    random.shuffle(sentences)
+    return " ".join(s.strip() for s in sentences)
+
+def passage_prompt(words: List[str], length: int = 200, level: str = "B1 (Easy)") -> str:
     if words:
         prompt = (
             f"Write a short educational passage in English, about {length} words. "
@@ -117,13 +697,106 @@ def generate_passage_with_blanks(conn,user_id: int,words: List[str] = None, leng
     #         f"Write a {length}-word educational passage in clear English. "
     #         "Make it cohesive and natural, one short paragraph."
     #     )
+    return prompt
+
+def stream_passage_with_blanks(conn, user_id: int, words: List[str] = None, length: int = 200, blanks: int = 3,
+                               level: str = "B1 (Easy)", answers: List[str] = None):
+    """
+    Streaming version of generate_passage_with_blanks, for st.write_stream.
+    Yields the passage with blanks already applied; `answers` (a list owned by
+    the caller) is filled as blanks are created. With conn=None a pooled
+    connection is borrowed only for the word sample and the local fallback,
+    never while Gemini streams.
+    """
+    if not words:
+        words = _with_conn(conn, get_random_words_from_db, user_id, blanks)
+    pieces = provider.generate_text_stream(passage_prompt(words, length, level), config_for_passage,
+                                           variants=PASSAGE_VARIANTS, first_timeout=LLM_BUDGETS["passage"])
+    pieces = hedged_stream("passage", pieces, lambda: _with_conn(conn, local_passage, user_id, words, length), conn)
+    yield from blank_stream(pieces, words, blanks, answers if answers is not None else [])
 
-    resp = gemini.generate(prompt, config_for_passage)
-    passage = resp.text.strip()
+def blank_stream(pieces, target_words: List[str], blanks: int, answers: List[str]):
+    """
+    Apply create_fill_in_blank incrementally, with the same result as on the
+    whole text. Text is released up to a whitespace at least one longest
+    target form back from the end, and never inside a match, so a target
+    (multi-word chunks included) is never shown or split before it is masked.
+    Without target words (random fallback) the whole text is needed first.
+    """
+    def mask(text):
+        if len(answers) >= blanks or not text:
+            return text
+        masked, found = create_fill_in_blank(text, target_words, blanks=blanks - len(answers))
+        answers.extend(found)
+        return masked
 
-    # Create blanks (fallback to random words in passage if needed)
-    passage_with_blanks, answers = create_fill_in_blank(passage, words, blanks=blanks)
-    return passage_with_blanks, answers
+    pattern = _blank_pattern(frozenset(w for w in target_words or () if w.strip()), True)
+    hold = max((len(f) for f in variants_for(target_words or ())), default=0)
+    buf, started = "", False
+    for piece in pieces:
+        if not started:
+            piece = piece.lstrip()
+            started = bool(piece)
+        buf += piece
+        if pattern is None:
+            continue
+        end = max(0, len(buf) - hold)
+        cut = max(buf.rfind(" ", 0, end), buf.rfind("\n", 0, end))
+        if cut <= 0:
+            continue
+        # a match starting before `cut` ends inside buf (hold); don't split it
+        for m in pattern.finditer(buf, 0, cut + hold + 1):
+            if m.start() < cut < m.end():
+                cut = m.start()
+                break
+        if cut > 0:
+            head, buf = buf[:cut], buf[cut:]
+            yield mask(head)
+    yield mask(buf.rstrip())
+
+# Schema-constrained output for corrections: Gemini must return exactly this JSON shape
+CORRECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "original": {"type": "string"},
+        "corrected": {"type": "string"},
+        "explanation": {"type": "string"},
+    },
+    "required": ["corrected", "explanation"],
+}
+
+BATCH_CORRECTION_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "index": {"type": "integer"},
+            "corrected": {"type": "string"},
+            "explanation": {"type": "string"},
+        },
+        "required": ["index", "corrected", "explanation"],
+    },
+}
+
+def correction_config(max_tokens: int, schema: dict) -> dict:
+    return {
+        **config_for_passage,
+        "max_output_tokens": max_tokens,
+        "response_mime_type": "application/json",
+        "response_schema": schema,
+    }
+
+def fallback_correction(sentence: str, error: Exception = None) -> dict:
+    """Minimal correction (capitalize + punctuation) used when the LLM is unavailable."""
+    corrected = sentence.strip()
+    if corrected and corrected[0].islower():
+        corrected = corrected[0].upper() + corrected[1:]
+    if corrected and corrected[-1] not in '.!?':
+        corrected = corrected + '.'
+    explanation = "Fallback: capitalized first letter and ensured punctuation."
+    if error is not None:
+        explanation += f" Error: {repr(error)}"
+    return {'original': sentence, 'corrected': corrected, 'explanation': explanation}
 
 def correct_sentence_with_llm(sentence: str, max_tokens: int = 200) -> dict:
     """
@@ -147,40 +820,129 @@ def correct_sentence_with_llm(sentence: str, max_tokens: int = 200) -> dict:
         f"User sentence:\n{sentence}"
     )
 
+    start = time.monotonic()
     try:
-        resp = gemini.generate(prompt, config_for_passage)
-        text = resp.text.strip()
+        text = provider.generate_text(prompt, correction_config(max_tokens, CORRECTION_SCHEMA),
+                                      timeout=LLM_BUDGETS["correction"])
+    except Exception as e:
+        # If the LLM call fails or misses its budget -> fallback correction
+        served("correction", "local", time.monotonic() - start, e)
+        return fallback_correction(sentence, e)
 
-        # Try parsing as JSON
-        try:
-            data = json.loads(text)
-            return {
-                'original': data.get('original', sentence),
-                'corrected': data.get('corrected', data.get('correction', sentence)),
-                'explanation': data.get('explanation', '')
-            }
-        except Exception:
-            # Fallback: if not valid JSON, take first line as correction
-            lines = text.splitlines()
-            corrected = lines[0].strip() if lines else sentence
-            explanation = "\n".join(lines[1:]).strip() if len(lines) > 1 else ""
-            return {'original': sentence, 'corrected': corrected, 'explanation': explanation}
+    try:
+        data = json.loads(text)
+        result = {
+            'original': sentence,
+            'corrected': data.get('corrected', data.get('correction', sentence)),
+            'explanation': data.get('explanation', '')
+        }
+    except Exception as e:
+        # schema-constrained output should always parse; if it doesn't, don't guess from free text
+        served("correction", "local", time.monotonic() - start, e)
+        return fallback_correction(sentence, e)
+    served("correction", provider.name, time.monotonic() - start)
+    return result
 
+def correct_sentences_with_llm(items: List[Tuple[str, str]], max_tokens: int = 200) -> List[dict]:
+    """
+    Correct many sentences in ONE Gemini request (Study page "Correct all").
+    items: [(word, sentence)]. Returns one dict per item, in the same order,
+    shaped like correct_sentence_with_llm's result. Results are matched back
+    by their index; anything missing or malformed gets the local fallback.
+    """
+    if not items:
+        return []
+    numbered = "\n".join(f"{i}. [word: {word}] {sentence.strip()}" for i, (word, sentence) in enumerate(items, 1))
+    prompt = (
+        "You are an English tutor. Each numbered line below is a learner's sentence "
+        "written to practice the word in brackets. Correct every sentence for grammar, "
+        "spelling, and natural phrasing, keeping the practiced word. Return a JSON array "
+        "with one object per sentence: 'index' (the line number), 'corrected', and "
+        "'explanation' (1-2 concise sentences about the main changes).\n\n"
+        f"Sentences:\n{numbered}"
+    )
+    start = time.monotonic()
+    try:
+        text = provider.generate_text(prompt, correction_config(max_tokens * len(items), BATCH_CORRECTION_SCHEMA),
+                                      timeout=LLM_BUDGETS["corrections"])
+        data = json.loads(text)
+        if isinstance(data, dict):    # tolerate {"results": [...]}
+            data = next((v for v in data.values() if isinstance(v, list)), None)
+        if not isinstance(data, list):
+            raise ValueError(f"expected a JSON array of corrections, got {type(data).__name__}")
     except Exception as e:
-        # If Gemini call fails -> fallback correction
-        corrected = sentence.strip()
-        if corrected and corrected[0].islower():
-            corrected = corrected[0].upper() + corrected[1:]
-        if corrected and corrected[-1] not in '.!%s':
-            corrected = corrected + '.'
-        explanation = f"Fallback: capitalized first letter and ensured punctuation. Error: {repr(e)}"
-        return {'original': sentence, 'corrected': corrected, 'explanation': explanation}
-   
-
-def generate_passage_with_chunks(topic="daily life", length=150):
+        served("corrections", "local", time.monotonic() - start, e)
+        return [fallback_correction(sentence, e) for _, sentence in items]
+    served("corrections", provider.name, time.monotonic() - start)
+
+    by_index = {}
+    for obj in data:
+        if isinstance(obj, dict) and isinstance(obj.get("index"), int) and obj.get("corrected"):
+            by_index[obj["index"]] = obj
+    results = []
+    for i, (_, sentence) in enumerate(items, 1):
+        obj = by_index.get(i)
+        if obj is None:
+            results.append(fallback_correction(sentence))
+        else:
+            results.append({'original': sentence, 'corrected': obj["corrected"],
+                            'explanation': obj.get("explanation", "")})
+    return results
+
+def generate_passage_with_chunks(topic="daily life", length=150, conn=None):
     """
     Generate a passage and highlight common English chunks with ** **.
+    `conn` (the caller's connection) is only used by the local fallback.
     """
+    start = time.monotonic()
+    try:
+        text = provider.generate_text(chunk_prompt(topic, length), config_for_chunk, variants=PASSAGE_VARIANTS,
+                                      timeout=LLM_BUDGETS["chunks"])
+        served("chunks", provider.name, time.monotonic() - start)
+    except Exception as e:
+        text = safe_fallback(lambda: local_chunk_passage(topic, conn=conn), conn)
+        served("chunks", "local", time.monotonic() - start, e)
+    return text, extract_chunks(text)
+
+def stream_passage_with_chunks(topic="daily life", length=150, conn=None):
+    """
+    Streaming version for st.write_stream; run extract_chunks() on the full text at the end.
+    Without `conn` the local fallback borrows a pooled connection only while it runs.
+    """
+    pieces = provider.generate_text_stream(chunk_prompt(topic, length), config_for_chunk, variants=PASSAGE_VARIANTS,
+                                           first_timeout=LLM_BUDGETS["chunks"])
+    return hedged_stream("chunks", pieces, lambda: local_chunk_passage(topic, conn=conn), conn)
+
+def local_chunk_passage(topic="daily life", n: int = 8, conn=None) -> str:
+    """
+    Fallback for the chunk passage without the LLM: the most often saved
+    chunks of the shared lexicon under a matching topic (topped up with the
+    most often saved overall), in **bold** so extract_chunks() finds them.
+    Without `conn` a pooled connection is borrowed.
+    """
+    if conn is None:
+        with pg_conn() as conn:
+            return local_chunk_passage(topic, n, conn)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT l.chunk FROM chunk_lexicon l
+        WHERE l.id IN (
+            SELECT uc.chunk_id FROM user_chunks uc
+            WHERE to_tsvector('english', uc.topic) @@ plainto_tsquery('english', %s)
+        )
+        ORDER BY l.frequency DESC, l.id LIMIT %s
+    """, (topic, n))
+    chunks = [row[0] for row in cursor.fetchall()]
+    if len(chunks) < n:
+        cursor.execute("SELECT chunk FROM chunk_lexicon WHERE NOT (chunk = ANY(%s)) "
+                       "ORDER BY frequency DESC, id LIMIT %s", (chunks, n - len(chunks)))
+        chunks += [row[0] for row in cursor.fetchall()]
+    if not chunks:
+        return STATIC_FALLBACK
+    return (f"The passage writer is busy right now, so here are chunks learners often save about {topic}: "
+            + ", ".join(f"**{chunk}**" for chunk in chunks) + ".")
+
+def chunk_prompt(topic="daily life", length=150) -> str:
     prompt = (
         # f"Write a short natural and common passage of about {length} words about {topic}. "
         # f"Highlight common English chunks (multi-word expressions, collocations, idioms) in **bold**."
@@ -191,24 +953,130 @@ def generate_passage_with_chunks(topic="daily life", length=150):
         "Highlight common English chunks (multi-word expressions, collocations, idioms) by putting them in bold. "
         "The passage should read smoothly, without sounding artificial or overly formal."
     )
+    return prompt
 
-    resp = gemini.generate(prompt, config_for_chunk)
-
-    text = resp.text.strip()
-
+def extract_chunks(text: str) -> List[str]:
     # Extract chunks inside ** **
     # chunks = re.findall(r"\*\*(.*%s)\*\*", text)
-    chunks = re.findall(r"\*\*(.*?)\*\*", text)
-    return text, chunks
+    return re.findall(r"\*\*(.*?)\*\*", text)
+
+def normalize_chunk(chunk: str) -> str:
+    return " ".join(chunk.split())
 
-def save_chunks_for_user(conn, user_id:int, topic, chunks):
+def save_chunks_for_user(conn, user_id:int, topic, chunks) -> int:
     """
     Save extracted chunks for a user into the database.
+    Two set-based statements whatever the number of chunks: add unseen texts
+    to the shared chunk_lexicon (case-insensitive), then link them to
+    (user, topic) and bump the frequency of each chunk that got a new link.
+    Saving the same chunks again changes nothing. Returns the new links.
     """
+    unique = {}
+    for chunk in chunks:
+        text = normalize_chunk(chunk)
+        if text:
+            unique.setdefault(text.lower(), text)
+    if not unique:
+        return 0
     cursor = conn.cursor()
-    data = [(user_id, chunk, topic) for chunk in chunks]
-    cursor.executemany(
-        "INSERT INTO chunks (user_id, chunk, topic) VALUES (%s,%s,%s)",
-        data
-    )
-    conn.commit() 
+    try:
+        execute_values(
+            cursor,
+            "INSERT INTO chunk_lexicon (chunk) VALUES %s ON CONFLICT ((lower(chunk))) DO NOTHING",
+            [(text,) for text in unique.values()],
+        )
+        cursor.execute("""
+            WITH linked AS (
+                INSERT INTO user_chunks (user_id, topic, chunk_id)
+                SELECT %s, %s, id FROM chunk_lexicon WHERE lower(chunk) = ANY(%s)
+                ON CONFLICT DO NOTHING
+                RETURNING chunk_id
+            )
+            UPDATE chunk_lexicon l SET frequency = l.frequency + 1
+            FROM linked WHERE l.id = linked.chunk_id
+        """, (user_id, topic or "", list(unique)))
+        added = cursor.rowcount
+        if added:
+            cursor.execute("UPDATE users SET chunk_version = chunk_version + 1 WHERE id = %s", (user_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return added
+
+# users.chunk_version is bumped by save_chunks_for_user, in the same transaction,
+# only when something was actually added. The cached topic list is keyed on it,
+# so it is reloaded after a save on any machine (one primary-key lookup per read).
+def get_chunk_version(conn, user_id: int) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT chunk_version FROM users WHERE id = %s", (user_id,))
+    r = cur.fetchone()
+    return r[0] if r else 0
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def _load_chunk_topics(_conn, user_id: int, version: int) -> List[str]:
+    cur = _conn.cursor()
+    cur.execute("SELECT DISTINCT topic FROM user_chunks WHERE user_id = %s ORDER BY topic", (user_id,))
+    return [row[0] for row in cur.fetchall()]
+
+def get_chunk_topics(conn, user_id: int) -> List[str]:
+    """The user's chunk topics, cached per (user, chunk version): reruns only read the version."""
+    return _load_chunk_topics(conn, user_id, get_chunk_version(conn, user_id))
+
+_has_trigram = None
+
+def _trigram_available(cur) -> bool:
+    """pg_trgm's word_similarity() is callable (checked once per process)."""
+    global _has_trigram
+    if _has_trigram is None:
+        cur.execute("SELECT to_regproc('word_similarity') IS NOT NULL")
+        _has_trigram = cur.fetchone()[0]
+    return _has_trigram
+
+def _like_pattern(text: str) -> str:
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def search_chunks_for_user(conn, user_id: int, query: str = None, topic: str = None,
+                           limit: int = 20, offset: int = 0) -> Tuple[List[Tuple[str, str]], int]:
+    """
+    One page of the user's saved chunks as [(chunk, topic)], plus the total
+    number of matches. `query` matches chunks and topics by full text (stemmed:
+    "make decisions" finds "make a decision"), by substring and, with pg_trgm,
+    by word similarity so small typos still hit. Best matches come first, then
+    newest. `topic` restricts to one exact topic.
+    """
+    cur = conn.cursor()
+    conditions = ["uc.user_id = %(user_id)s"]
+    order = ["uc.created_at DESC", "l.id"]
+    params = {"user_id": user_id, "limit": limit, "offset": offset}
+    if topic is not None:
+        conditions.append("uc.topic = %(topic)s")
+        params["topic"] = topic
+    query = normalize_chunk(query or "")
+    if query:
+        params["q"] = query
+        params["like"] = _like_pattern(query)
+        tsquery = "websearch_to_tsquery('english', %(q)s)"
+        matches = [
+            f"l.search @@ {tsquery}",
+            f"to_tsvector('english', uc.topic) @@ {tsquery}",
+            "l.chunk ILIKE %(like)s",
+            "uc.topic ILIKE %(like)s",
+        ]
+        rank = f"ts_rank(l.search, {tsquery}) + ts_rank(to_tsvector('english', uc.topic), {tsquery})"
+        if _trigram_available(cur):
+            matches += ["%(q)s <%% l.chunk", "%(q)s <%% uc.topic"]
+            rank += " + word_similarity(%(q)s, l.chunk)"
+        conditions.append("(" + " OR ".join(matches) + ")")
+        order.insert(0, f"{rank} DESC")
+    cur.execute(f"""
+        SELECT l.chunk, uc.topic, count(*) OVER () AS total
+        FROM user_chunks uc JOIN chunk_lexicon l ON l.id = uc.chunk_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {", ".join(order)}
+        LIMIT %(limit)s OFFSET %(offset)s
+    """, params)
+    rows = cur.fetchall()
+    total = rows[0][2] if rows else 0
+    return [(chunk, chunk_topic) for chunk, chunk_topic, _ in rows], total
+
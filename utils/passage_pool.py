@@ -0,0 +1,116 @@
+# utils/passage_pool.py
+"""
+Background pre-generation of "LLM Passage" exercises.
+
+A few ready-made passages are kept per (user, level, length, blanks), built
+from the user's sampled unlearned words. The page pops one instantly and a
+worker thread refills the queue after each pop; the first visit of the page in
+a session primes the queue for its default settings, so the first click only
+misses when it comes before those passages are written. Entries expire after
+a TTL, and as soon as words are added to or learned in the user's deck
+(reviews don't change which words a passage should use).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from database import pg_conn
+from .llm_utils import generate_passage, get_random_words_from_db
+from .vocab_utils import get_membership_version
+from .tracing import register_stats
+
+
+class PassagePool:
+    def __init__(self, per_key: int = 2, max_keys: int = 200, ttl: float = 3600, workers: int = 2):
+        self.per_key = per_key
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._queues = OrderedDict()   # key -> deque[(created_at, membership_version, passage, words)]
+        self._inflight = {}            # key -> number of producers running
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="passage-pool")
+        self.stats = {"hits": 0, "misses": 0, "produced": 0, "expired": 0, "errors": 0}
+
+    @staticmethod
+    def key(user_id: int, level: str, length: int, blanks: int):
+        return (user_id, level, length, blanks)
+
+    def _fresh(self, entry, version) -> bool:
+        created_at, entry_version = entry[0], entry[1]
+        return time.time() - created_at < self.ttl and entry_version == version
+
+    def pop(self, user_id: int, level: str, length: int, blanks: int) -> Optional[Tuple[str, List[str]]]:
+        """Ready-made (passage, target_words) or None."""
+        key = self.key(user_id, level, length, blanks)
+        with pg_conn() as conn:
+            version = get_membership_version(conn, user_id)   # moves on any machine's add / mark-learned
+        with self._lock:
+            q = self._queues.get(key)
+            while q:
+                entry = q.popleft()
+                if self._fresh(entry, version):
+                    self.stats["hits"] += 1
+                    return entry[2], entry[3]
+                self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+
+    def refill(self, user_id: int, level: str, length: int, blanks: int):
+        """Top the queue up to `per_key` in the background (no-op when already full)."""
+        key = self.key(user_id, level, length, blanks)
+        with self._lock:
+            q = self._queues.setdefault(key, deque())
+            self._queues.move_to_end(key)
+            while len(self._queues) > self.max_keys:
+                old_key, _ = self._queues.popitem(last=False)
+                self._inflight.pop(old_key, None)
+            missing = self.per_key - len(q) - self._inflight.get(key, 0)
+            if missing <= 0:
+                return
+            self._inflight[key] = self._inflight.get(key, 0) + missing
+        for _ in range(missing):
+            self._executor.submit(self._produce, key)
+
+    def _produce(self, key):
+        user_id, level, length, blanks = key
+        try:
+            with pg_conn() as conn:
+                version = get_membership_version(conn, user_id)
+                words = get_random_words_from_db(conn, user_id, blanks)
+            passage = generate_passage(words, length=length, level=level)
+            with self._lock:
+                q = self._queues.get(key)
+                if q is not None and len(q) < self.per_key:
+                    q.append((time.time(), version, passage, words))
+                    self.stats["produced"] += 1
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+        finally:
+            with self._lock:
+                if key in self._inflight:
+                    self._inflight[key] = max(0, self._inflight[key] - 1)
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return self.stats["hits"] / total if total else 0.0
+
+    def metrics(self) -> dict:
+        with self._lock:
+            out = dict(self.stats)
+        total = out["hits"] + out["misses"]
+        out["hit_rate"] = out["hits"] / total if total else 0.0
+        return out
+
+
+passage_pool = PassagePool(
+    per_key=int(os.environ.get("PASSAGE_POOL_PER_KEY", 2)),
+    max_keys=int(os.environ.get("PASSAGE_POOL_MAX_KEYS", 200)),
+    ttl=float(os.environ.get("PASSAGE_POOL_TTL", 3600)),
+    workers=int(os.environ.get("PASSAGE_POOL_WORKERS", 2)),
+)
+register_stats("passage_pool", passage_pool.metrics)
@@ -0,0 +1,255 @@
+# utils/scheduler.py
+"""
+Spaced-repetition scheduling engine.
+
+Each algorithm works on whole arrays at once (one NumPy pass per batch), so
+the same code serves a single Study click, a review session, bulk
+rescheduling of a deck and due-date forecasts. State per word:
+
+    reps        successful reviews in a row (repetition_count)
+    interval    last interval in days
+    ease        SM-2 ease factor
+    stability   FSRS memory stability (days)
+    difficulty  FSRS difficulty (1..10)
+
+Pick the live algorithm with SRS_ALGORITHM=ladder|sm2|fsrs (default ladder,
+which matches the original 1/3/7/14-day schedule).
+"""
+import os
+from datetime import date, datetime, timezone
+from typing import Dict
+
+import numpy as np
+
+State = Dict[str, np.ndarray]
+
+
+def new_state(n: int) -> State:
+    return {
+        "reps": np.zeros(n, dtype=np.int32),
+        "interval": np.zeros(n, dtype=np.float64),
+        "ease": np.full(n, 2.5),
+        "stability": np.full(n, np.nan),     # NaN = never reviewed by FSRS
+        "difficulty": np.full(n, np.nan),
+    }
+
+
+class Scheduler:
+    """Interface: review() returns (new_state, interval_days) for a batch of outcomes."""
+
+    name = "base"
+
+    def review(self, state: State, success: np.ndarray, elapsed: np.ndarray) -> (State, np.ndarray):
+        """
+        state: arrays of equal length; success: bool array; elapsed: days since
+        the previous review (ignored by algorithms that don't model forgetting).
+        """
+        raise NotImplementedError
+
+
+class LadderScheduler(Scheduler):
+    """The original ladder: 1st/2nd/3rd success -> 1/3/7 days, then 14; failure -> tomorrow."""
+
+    name = "ladder"
+    STEPS = np.array([1, 1, 3, 7, 14], dtype=np.float64)   # indexed by reps after the review
+
+    def review(self, state, success, elapsed):
+        reps = state["reps"] + success.astype(np.int32)
+        interval = np.where(success, self.STEPS[np.minimum(reps, 4)], 1.0)
+        return {**state, "reps": reps, "interval": interval}, interval
+
+
+class SM2Scheduler(Scheduler):
+    """SuperMemo-2 with binary grading (success -> quality 4, failure -> 1)."""
+
+    name = "sm2"
+
+    def __init__(self, pass_quality: int = 4, fail_quality: int = 1):
+        self.pass_quality = pass_quality
+        self.fail_quality = fail_quality
+
+    def review(self, state, success, elapsed):
+        q = np.where(success, self.pass_quality, self.fail_quality).astype(np.float64)
+        reps = np.where(success, state["reps"] + 1, 0).astype(np.int32)
+        ease = np.maximum(1.3, state["ease"] + 0.1 - (5 - q) * (0.08 + (5 - q) * 0.02))
+        interval = np.select(
+            [~success, reps == 1, reps == 2],
+            [1.0, 1.0, 6.0],
+            np.round(np.maximum(state["interval"], 1.0) * ease),
+        )
+        return {**state, "reps": reps, "ease": ease, "interval": interval}, interval
+
+
+class FSRSScheduler(Scheduler):
+    """
+    FSRS-4.5-style model: power-law forgetting curve, stability/difficulty
+    updates, and intervals chosen to hit `retention` (probability of recall
+    on the due date). Grades are binary: again (1) or good (3).
+    """
+
+    name = "fsrs"
+    DECAY = -0.5
+    FACTOR = 19 / 81
+    W = np.array([0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+                  0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755])
+
+    def __init__(self, retention: float = 0.9, max_interval: float = 365.0):
+        self.retention = retention
+        self.max_interval = max_interval
+
+    def retrievability(self, stability, elapsed):
+        return (1 + self.FACTOR * elapsed / stability) ** self.DECAY
+
+    def review(self, state, success, elapsed):
+        w = self.W
+        grade = np.where(success, 3.0, 1.0)
+        s, d = state["stability"], state["difficulty"]
+        first = np.isnan(s)
+
+        # first review: initial stability/difficulty from the grade
+        s0 = np.where(success, w[2], w[0])
+        d0 = np.clip(w[4] - (grade - 3) * w[5], 1, 10)
+
+        s_prev = np.where(first, 1.0, s)
+        d_prev = np.where(first, d0, d)
+        r = self.retrievability(s_prev, np.maximum(elapsed, 0))
+        s_success = s_prev * (np.exp(w[8]) * (11 - d_prev) * s_prev ** -w[9]
+                              * (np.exp(w[10] * (1 - r)) - 1) + 1)
+        s_fail = w[11] * d_prev ** -w[12] * ((s_prev + 1) ** w[13] - 1) * np.exp(w[14] * (1 - r))
+        s_new = np.where(first, s0, np.where(success, s_success, np.minimum(s_fail, s_prev)))
+
+        d_new = d_prev - w[6] * (grade - 3)
+        d_new = np.clip(w[7] * (w[4]) + (1 - w[7]) * d_new, 1, 10)   # mean reversion towards D0(good)
+        d_new = np.where(first, d0, d_new)
+
+        interval = s_new / self.FACTOR * (self.retention ** (1 / self.DECAY) - 1)
+        interval = np.clip(np.round(interval), 1, self.max_interval)
+        reps = np.where(success, state["reps"] + 1, 0).astype(np.int32)
+        return {**state, "reps": reps, "stability": s_new, "difficulty": d_new, "interval": interval}, interval
+
+
+SCHEDULERS = {cls.name: cls for cls in (LadderScheduler, SM2Scheduler, FSRSScheduler)}
+
+
+def get_scheduler(name: str = None) -> Scheduler:
+    name = name or os.environ.get("SRS_ALGORITHM", "ladder")
+    try:
+        return SCHEDULERS[name]()
+    except KeyError:
+        raise ValueError(f"unknown SRS algorithm {name!r}; choose one of {sorted(SCHEDULERS)}")
+
+
+# --- Postgres glue -----------------------------------------------------------
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()   # same day boundary as the ladder SQL
+
+_STATE_COLUMNS = "uv.word_id, uv.repetition_count, uv.interval_days, uv.ease, uv.stability, uv.difficulty, uv.last_reviewed"
+
+
+def _state_from_rows(rows) -> (np.ndarray, State, np.ndarray):
+    """rows: (word_id, reps, interval, ease, stability, difficulty, last_reviewed)."""
+    n = len(rows)
+    state = new_state(n)
+    word_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+    state["reps"] = np.fromiter((r[1] or 0 for r in rows), dtype=np.int32, count=n)
+    state["interval"] = np.fromiter((r[2] or 0 for r in rows), dtype=np.float64, count=n)
+    state["ease"] = np.fromiter((2.5 if r[3] is None else r[3] for r in rows), dtype=np.float64, count=n)
+    state["stability"] = np.fromiter((np.nan if r[4] is None else r[4] for r in rows), dtype=np.float64, count=n)
+    state["difficulty"] = np.fromiter((np.nan if r[5] is None else r[5] for r in rows), dtype=np.float64, count=n)
+    last = np.array([r[6] or _today() for r in rows], dtype="datetime64[D]")
+    return word_ids, state, last
+
+
+_SAVE_SQL = """
+    INSERT INTO user_vocab AS uv (user_id, word_id, repetition_count, interval_days, ease, stability,
+                                  difficulty, next_due, last_reviewed, appearances)
+    SELECT %(user_id)s, s.word_id, s.reps, s.interval_days, s.ease, s.stability, s.difficulty,
+           s.next_due, %(today)s, 1
+    FROM unnest(%(word_ids)s::int[], %(reps)s::int[], %(interval)s::real[], %(ease)s::real[],
+                %(stability)s::real[], %(difficulty)s::real[], %(next_due)s::date[])
+         AS s(word_id, reps, interval_days, ease, stability, difficulty, next_due)
+    ON CONFLICT (user_id, word_id) DO UPDATE SET
+        repetition_count = EXCLUDED.repetition_count, interval_days = EXCLUDED.interval_days,
+        ease = EXCLUDED.ease, stability = EXCLUDED.stability, difficulty = EXCLUDED.difficulty,
+        next_due = EXCLUDED.next_due, last_reviewed = EXCLUDED.last_reviewed,
+        appearances = COALESCE(uv.appearances, 0) + 1
+    RETURNING word_id, repetition_count, next_due, appearances
+"""
+
+
+def _nullable(a: np.ndarray):
+    return [None if np.isnan(x) else float(x) for x in a]
+
+
+def apply_reviews(conn, user_id: int, results, scheduler: Scheduler):
+    """
+    Apply (word_id, success) results for distinct words with `scheduler`:
+    lock the rows, compute the new state for all of them in one pass, write
+    back with one upsert. Caller commits. Returns the RETURNING rows.
+    """
+    ids = [int(w) for w, _ in results]
+    cur = conn.cursor()
+    cur.execute(f"SELECT {_STATE_COLUMNS} FROM user_vocab uv WHERE uv.user_id = %s AND uv.word_id = ANY(%s) FOR UPDATE",
+                (user_id, ids))
+    known = {r[0]: r for r in cur.fetchall()}
+    rows = [known.get(w, (w, 0, 0, None, None, None, None)) for w in ids]
+    word_ids, state, last = _state_from_rows(rows)
+    today = np.datetime64(_today(), "D")
+    elapsed = (today - last).astype(np.float64)
+    success = np.array([bool(s) for _, s in results])
+    state, interval = scheduler.review(state, success, elapsed)
+    next_due = today + interval.astype("timedelta64[D]")
+    cur.execute(_SAVE_SQL, {
+        "user_id": user_id, "today": _today(), "word_ids": ids,
+        "reps": state["reps"].tolist(), "interval": state["interval"].tolist(),
+        "ease": _nullable(state["ease"]), "stability": _nullable(state["stability"]),
+        "difficulty": _nullable(state["difficulty"]), "next_due": next_due.astype(object).tolist(),
+    })
+    return cur.fetchall()
+
+
+def reschedule_deck(conn, user_id: int, scheduler: Scheduler) -> int:
+    """
+    Recompute next_due for every unlearned word of the user from its stored
+    state (e.g. after switching algorithm): next_due = last review + the
+    interval the algorithm assigns for a successful review at that point.
+    One SELECT, one vectorized pass, one UPDATE. Returns rows updated.
+    """
+    cur = conn.cursor()
+    cur.execute(f"SELECT {_STATE_COLUMNS} FROM user_vocab uv WHERE uv.user_id = %s AND uv.learned = 0",
+                (user_id,))
+    rows = cur.fetchall()
+    if not rows:
+        return 0
+    word_ids, state, last = _state_from_rows(rows)
+    # replay the last review as a success without counting it twice
+    prev = {**state, "reps": np.maximum(state["reps"] - 1, 0)}
+    _, interval = scheduler.review(prev, state["reps"] > 0, np.zeros(len(rows)))
+    next_due = last + interval.astype("timedelta64[D]")
+    cur.execute("""
+        UPDATE user_vocab uv SET next_due = s.next_due
+        FROM unnest(%s::int[], %s::date[]) AS s(word_id, next_due)
+        WHERE uv.user_id = %s AND uv.word_id = s.word_id
+    """, (word_ids.tolist(), next_due.astype(object).tolist(), user_id))
+    conn.commit()
+    return cur.rowcount
+
+
+def forecast_due(next_due: np.ndarray, today=None, days: int = 7) -> np.ndarray:
+    """
+    Count of words due on each of the next `days` days (index 0 = today,
+    overdue words included). next_due: datetime64[D] array, NaT = due now.
+    """
+    today = np.datetime64(today or _today(), "D")
+    offset = (next_due - today).astype("timedelta64[D]").astype(np.float64)
+    offset = np.where(np.isnan(offset), 0, np.maximum(offset, 0))
+    offset = offset[offset < days].astype(np.int64)
+    return np.bincount(offset, minlength=days)
+
+
+def forecast_for_user(conn, user_id: int, days: int = 7) -> np.ndarray:
+    cur = conn.cursor()
+    cur.execute("SELECT next_due FROM user_vocab WHERE user_id = %s AND learned = 0", (user_id,))
+    due = np.array([r[0] for r in cur.fetchall()], dtype="datetime64[D]")
+    return forecast_due(due, days=days)
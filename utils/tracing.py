@@ -0,0 +1,263 @@
+# utils/tracing.py
+"""
+Lightweight per-rerun tracing.
+
+`span(name)` times a block and feeds a rolling window of durations per
+(span, page); the page and user come from `tagged(page=..., user=...)`,
+which app.py sets around each menu branch (contextvars, so concurrent
+sessions don't mix). Database queries are traced by `TracedCursor` (the
+pool's cursor_factory), LLM calls by GeminiWrapper.
+
+Export:
+- structured logs: one JSON line per slow span (>= TRACE_SLOW_MS) and a
+  p50/p95/p99 summary per span every TRACE_SUMMARY_SECONDS
+- Prometheus text format on http://0.0.0.0:METRICS_PORT/metrics, together
+  with the counters other modules register via `register_stats()`
+
+Recording is a perf_counter pair and a ring-buffer write; quantiles are only
+computed when exported. TRACING=0 turns spans into no-ops.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+import psycopg2.extensions
+
+TRACING = os.environ.get("TRACING", "1") != "0"
+TRACE_WINDOW = int(os.environ.get("TRACE_WINDOW", 1024))          # samples kept per span for quantiles
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", 500))
+TRACE_SUMMARY_SECONDS = float(os.environ.get("TRACE_SUMMARY_SECONDS", 60))
+METRICS_PORT = os.environ.get("METRICS_PORT")                      # unset: no HTTP endpoint
+
+logger = logging.getLogger("vocab.trace")
+
+_tags: ContextVar[dict] = ContextVar("trace_tags", default={})
+
+
+class RollingStats:
+    """Last `window` durations in a ring buffer, plus lifetime count/sum/max."""
+
+    __slots__ = ("window", "_buf", "_i", "count", "sum", "max", "_lock")
+
+    def __init__(self, window: int = TRACE_WINDOW):
+        self.window = window
+        self._buf = array("d")
+        self._i = 0
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            if len(self._buf) < self.window:
+                self._buf.append(seconds)
+            else:
+                self._buf[self._i] = seconds
+                self._i = (self._i + 1) % self.window
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._buf)
+            count, total, peak = self.count, self.sum, self.max
+        def q(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))] if samples else 0.0
+        return {"count": count, "sum": total, "max": peak, "p50": q(0.50), "p95": q(0.95), "p99": q(0.99)}
+
+
+_series: Dict[Tuple[str, str], RollingStats] = {}
+_series_lock = threading.Lock()
+
+
+@contextmanager
+def tagged(**tags):
+    """Attach tags (page, user, ...) to every span recorded inside the block."""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def record(name: str, seconds: float, error: str = None, **attrs):
+    if not TRACING:
+        return
+    tags = _tags.get()
+    key = (name, str(tags.get("page", "-")))
+    series = _series.get(key)
+    if series is None:
+        with _series_lock:
+            series = _series.setdefault(key, RollingStats())
+    series.observe(seconds)
+    if seconds * 1000 >= TRACE_SLOW_MS or error:
+        logger.warning(json.dumps({"event": "span", "span": name, "ms": round(seconds * 1000, 2),
+                                   "error": error, **tags, **attrs}, default=str))
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as `name`; exceptions are recorded (and re-raised)."""
+    if not TRACING:
+        yield
+        return
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:          # not Streamlit's rerun/stop control flow
+        error = type(e).__name__
+        raise
+    finally:
+        record(name, time.perf_counter() - start, error, **attrs)
+
+
+_TABLE_RE = re.compile(r"\b(?:from|into|update|join)\s+([a-z_][a-z0-9_.]*)", re.I)
+
+
+@lru_cache(maxsize=1024)
+def query_label(query) -> str:
+    """Low-cardinality name for a statement: "db select user_vocab"."""
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    text = str(query).strip()
+    verb = text.split(None, 1)[0].lower() if text else "?"
+    m = _TABLE_RE.search(text)
+    return f"db {verb} {m.group(1).lower()}" if m else f"db {verb}"
+
+
+class TracedCursor(psycopg2.extensions.cursor):
+    """psycopg2 cursor that records a span per execute()."""
+
+    def execute(self, query, vars=None):
+        if not TRACING:
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        error = None
+        try:
+            return super().execute(query, vars)
+        except Exception as e:          # not Streamlit's rerun/stop control flow
+            error = type(e).__name__
+            raise
+        finally:
+            record(query_label(query), time.perf_counter() - start, error)
+
+    def executemany(self, query, vars_list):
+        with span(query_label(query) + " (many)"):
+            return super().executemany(query, vars_list)
+
+
+# --- export ------------------------------------------------------------------
+
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+def register_stats(name: str, fn: Callable[[], dict]):
+    """Expose a module's counters (numeric values of fn()) as app_<name>_<key> gauges."""
+    _collectors[name] = fn
+
+
+def snapshot() -> List[dict]:
+    with _series_lock:
+        items = list(_series.items())
+    return [{"span": name, "page": page, **s.snapshot()} for (name, page), s in sorted(items)]
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _metric_name(text: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", text)
+
+
+def prometheus_text() -> str:
+    lines = ["# HELP app_span_seconds Span durations (quantiles over the last TRACE_WINDOW samples).",
+             "# TYPE app_span_seconds summary"]
+    for s in snapshot():
+        labels = f'span="{_label(s["span"])}",page="{_label(s["page"])}"'
+        for q in ("p50", "p95", "p99"):
+            lines.append(f'app_span_seconds{{{labels},quantile="0.{q[1:]}"}} {s[q]:.6f}')
+        lines.append(f"app_span_seconds_sum{{{labels}}} {s['sum']:.6f}")
+        lines.append(f"app_span_seconds_count{{{labels}}} {s['count']}")
+    for name, fn in sorted(_collectors.items()):
+        try:
+            values = fn() or {}
+        except Exception:
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric = _metric_name(f"app_{name}_{key}")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def log_summary():
+    for s in snapshot():
+        logger.info(json.dumps({"event": "span_summary", **{k: round(v, 6) if isinstance(v, float) else v
+                                                             for k, v in s.items()}}))
+    for name, fn in sorted(_collectors.items()):
+        try:
+            logger.info(json.dumps({"event": "stats", "name": name, **(fn() or {})}, default=str))
+        except Exception:
+            pass
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_exporters(port=METRICS_PORT):
+    """Start the /metrics server and the periodic log summary once per process."""
+    global _started
+    if _started or not TRACING:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(message)s"))   # the message is already JSON
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        if port:
+            server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        if TRACE_SUMMARY_SECONDS > 0:
+            def loop():
+                while True:
+                    time.sleep(TRACE_SUMMARY_SECONDS)
+                    log_summary()
+            threading.Thread(target=loop, name="trace-summary", daemon=True).start()
@@ -1,7 +1,20 @@
-from gtts import gTTS
 import streamlit as st
 import streamlit.components.v1 as components
 import re
+import io
+import os
+import json
+import math
+import wave
+import shutil
+import struct
+import hashlib
+import time
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from .tracing import register_stats
 
 # def tts_button(word: str, wid: int):
 #     components.html(
@@ -26,41 +39,104 @@ def clean_text(text: str) -> str:
     text = re.sub(r"<[^>]+>", "", text)
     return text
 
-def tts_button(word: str, wid: int):
-    components.html(
-        f"""
-        <button onclick="speak{wid}()" style="border:none;background:none;cursor:pointer;font-size:18px;">
-            🔊
-        </button>
-        <script>
-        var bestVoice{wid} = null;
+# Voice selection shared by every speaker button inside one component iframe.
+_VOICE_JS = """
+var bestVoice = null;
+function pickBestVoice() {
+    var voices = speechSynthesis.getVoices();
+    // Ưu tiên en-US, nếu không có thì chọn voice bất kỳ có "en"
+    bestVoice = voices.find(v => v.lang === "en-US")
+             || voices.find(v => v.lang.startsWith("en"))
+             || null;
+}
+speechSynthesis.onvoiceschanged = pickBestVoice;
+pickBestVoice();
 
-        function pickBestVoice{wid}() {{
-            var voices = speechSynthesis.getVoices();
-            // Ưu tiên en-US, nếu không có thì chọn voice bất kỳ có "en"
-            bestVoice{wid} = voices.find(v => v.lang === "en-US") 
-                          || voices.find(v => v.lang.startsWith("en")) 
-                          || null;
-        }}
+function speak(text) {
+    var utterance = new SpeechSynthesisUtterance(text);
+    if (bestVoice) {
+        utterance.voice = bestVoice;
+        utterance.lang = bestVoice.lang;
+    } else {
+        utterance.lang = "en-US";
+    }
+    speechSynthesis.cancel();
+    speechSynthesis.speak(utterance);
+}
+"""
+
+_LIST_STYLE = """
+body { margin: 0; font-family: sans-serif; font-size: 14px; }
+.tts-list { display: flex; flex-wrap: wrap; gap: 6px; }
+.tts-list.rows { flex-direction: column; }
+.tts-list button { padding: 4px 10px; border: 1px solid #ccc; border-radius: 4px;
+                   background: #f5f5f5; cursor: pointer; }
+.tts-list .row { display: flex; align-items: center; gap: 8px; }
+"""
 
-        speechSynthesis.onvoiceschanged = pickBestVoice{wid};
-        pickBestVoice{wid}(); // gọi ngay lần đầu
 
-        function speak{wid}() {{
-            var utterance = new SpeechSynthesisUtterance("{word}");
-            if (bestVoice{wid}) {{
-                utterance.voice = bestVoice{wid};
-                utterance.lang = bestVoice{wid}.lang;
+def _js_literal(value) -> str:
+    """JSON for embedding in a <script> block."""
+    return json.dumps(value).replace("</", "<\\/")
+
+
+def tts_buttons(items: List[str], rows: bool = False, height: int = None):
+    """
+    Speaker buttons for a whole list of words/chunks in ONE component iframe.
+    The texts are passed once as a JSON array; one delegated click handler and
+    one shared voice picker serve every button, so a page mounts a single
+    iframe however many results it shows. rows=True lists one text per line
+    with a "Read" button (chunks); otherwise compact 🔊 chips (words).
+    """
+    texts = [clean_text(t).replace("\n", " ") for t in items if t]
+    if not texts:
+        return
+    if height is None:
+        height = min(400, 44 * len(texts) + 10) if rows else min(200, 40 * (len(texts) // 6 + 1) + 10)
+    components.html(
+        f"""
+        <style>{_LIST_STYLE}</style>
+        <div id="tts" class="tts-list{' rows' if rows else ''}"></div>
+        <script>
+        {_VOICE_JS}
+        var texts = {_js_literal(texts)};
+        var rows = {'true' if rows else 'false'};
+        var box = document.getElementById("tts");
+        var frag = document.createDocumentFragment();
+        texts.forEach(function (t, i) {{
+            var b = document.createElement("button");
+            b.dataset.i = i;
+            if (rows) {{
+                var row = document.createElement("div");
+                row.className = "row";
+                b.textContent = "🔊 Read";
+                var label = document.createElement("b");
+                label.textContent = t;
+                row.appendChild(b);
+                row.appendChild(label);
+                frag.appendChild(row);
             }} else {{
-                utterance.lang = "en-US"; // fallback cuối cùng
+                b.textContent = "🔊 " + t;
+                frag.appendChild(b);
             }}
-            speechSynthesis.speak(utterance);
-        }}
+        }});
+        box.appendChild(frag);
+        box.addEventListener("click", function (e) {{
+            var b = e.target.closest("button");
+            if (b) speak(texts[+b.dataset.i]);
+        }});
         </script>
         """,
-        height=40,
+        height=height,
+        scrolling=True,
     )
 
+
+def tts_button(word: str, wid: int):
+    """Single speaker button; prefer tts_buttons() for lists."""
+    tts_buttons([word], height=40)
+
+
 def tts_passage_button(text: str, key: str):
     safe_text = clean_text(text).replace('"', '\\"').replace("\n", " ")
     components.html(
@@ -112,41 +188,293 @@ def tts_passage_button(text: str, key: str):
     )
 
 def tts_chunk_button(text: str, key: str):
-    safe_text = text.replace('"', '\\"').replace("\n", " ")
-    components.html(
-        f"""
-        <button onclick="speak{key}()" 
-                style="margin-right:6px;padding:6px 12px;
-                       border:1px solid #ccc;border-radius:4px;
-                       background:#f5f5f5;cursor:pointer;">
-            🔊 Read
-        </button>
-        <script>
-        var bestVoice{key} = null;
+    """Single "Read" button for one chunk; prefer tts_buttons(chunks, rows=True) for lists."""
+    tts_buttons([text], rows=True, height=50)
 
-        function pickBestVoice{key}() {{
-            var voices = speechSynthesis.getVoices();
-            bestVoice{key} = voices.find(v => v.lang === "en-US") 
-                          || voices.find(v => v.lang.startsWith("en")) 
-                          || null;
-        }}
-        speechSynthesis.onvoiceschanged = pickBestVoice{key};
-        pickBestVoice{key}();
 
-        function speak{key}() {{
-            var utterance = new SpeechSynthesisUtterance("{safe_text}");
-            utterance.rate = 1;
-            utterance.pitch = 1;
-            if (bestVoice{key}) {{
-                utterance.voice = bestVoice{key};
-                utterance.lang = bestVoice{key}.lang;
-            }} else {{
-                utterance.lang = "en-US";
-            }}
-            speechSynthesis.speak(utterance);
-        }}
-        </script>
-        """,
-        height=50,
-    )
+# --- Server-side pronunciation audio -----------------------------------------
+#
+# Audio is rendered once per (engine, lang, format, text) and stored in a
+# content-addressed directory, so every session reuses it. Rendering happens on
+# a small background pool (prefetch_pronunciations); pages only read files that
+# are already there, so a slow TTS endpoint never stalls a rerun. The directory
+# survives restarts only if TTS_CACHE_DIR is on a volume (see fly.toml);
+# otherwise the cache starts empty after every deploy.
+# TTS_ENGINE picks the synthesizer (gtts, espeak, tone); "tone" is an offline
+# stand-in that needs nothing installed and is meant for tests.
+
+TTS_ENGINE = os.environ.get("TTS_ENGINE", "gtts")
+TTS_LANG = os.environ.get("TTS_LANG", "en")
+TTS_FORMAT = os.environ.get("TTS_FORMAT", "mp3")          # mp3 or opus (opus needs ffmpeg)
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join(".cache", "tts"))
+TTS_CACHE_MAX_MB = float(os.environ.get("TTS_CACHE_MAX_MB", 512))
+TTS_RETRY_AFTER = float(os.environ.get("TTS_RETRY_AFTER", 60))   # seconds before retrying a failed render
+TTS_TIMEOUT = float(os.environ.get("TTS_TIMEOUT", 10))            # per request to the gTTS endpoint
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", 2))               # background renders at a time
+
+MIME = {"mp3": "audio/mpeg", "opus": "audio/ogg", "wav": "audio/wav"}
+
+
+class Synthesizer:
+    """Turns text into audio bytes in `self.format`."""
+
+    name = "base"
+    format = "mp3"
+
+    def synthesize(self, text: str, lang: str = "en") -> bytes:
+        raise NotImplementedError
+
+
+class GTTSSynthesizer(Synthesizer):
+    name = "gtts"
+    format = "mp3"
+
+    def synthesize(self, text, lang="en"):
+        from gtts import gTTS      # ~40 ms of imports, only paid by the gtts engine on first use
+        buf = io.BytesIO()
+        gTTS(text=text, lang=lang, timeout=TTS_TIMEOUT).write_to_fp(buf)
+        return buf.getvalue()
+
+
+class EspeakSynthesizer(Synthesizer):
+    """Local espeak-ng / espeak binary; WAV output."""
+
+    name = "espeak"
+    format = "wav"
+
+    def __init__(self):
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.binary:
+            raise RuntimeError("espeak-ng is not installed")
+
+    def synthesize(self, text, lang="en"):
+        return subprocess.run([self.binary, "-v", lang, "--stdout", text],
+                              check=True, capture_output=True, timeout=30).stdout
+
+
+class ToneSynthesizer(Synthesizer):
+    """Offline, deterministic stand-in: one short tone per character (WAV)."""
+
+    name = "tone"
+    format = "wav"
+    RATE = 8000
+
+    def synthesize(self, text, lang="en"):
+        frames = bytearray()
+        for ch in text:
+            freq = 220 + (ord(ch) % 32) * 20
+            for i in range(self.RATE // 20):        # 50 ms per character
+                frames += struct.pack("<h", int(8000 * math.sin(2 * math.pi * freq * i / self.RATE)))
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.RATE)
+            w.writeframes(bytes(frames))
+        return buf.getvalue()
+
+
+SYNTHESIZERS = {cls.name: cls for cls in (GTTSSynthesizer, EspeakSynthesizer, ToneSynthesizer)}
+
+
+def transcode(data: bytes, src: str, dst: str) -> bytes:
+    """Convert between audio formats with pydub (needs ffmpeg)."""
+    from pydub import AudioSegment
+    out = io.BytesIO()
+    AudioSegment.from_file(io.BytesIO(data), format=src).export(
+        out, format="ogg" if dst == "opus" else dst, codec="libopus" if dst == "opus" else None)
+    return out.getvalue()
+
+
+class AudioCache:
+    """
+    Content-addressed audio files under `root` (root/ab/abcdef....ext).
+    Reads refresh the file's mtime; when the total size passes `max_bytes`
+    the least recently used files are removed until it is back under 90%.
+    """
+
+    def __init__(self, root: str = TTS_CACHE_DIR, max_bytes: int = int(TTS_CACHE_MAX_MB * 1024 * 1024)):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None          # computed lazily on first write
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    @staticmethod
+    def make_key(engine: str, lang: str, fmt: str, text: str) -> str:
+        return hashlib.sha256(f"{engine}\0{lang}\0{fmt}\0{text}".encode()).hexdigest()
+
+    def path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{fmt}")
+
+    def get(self, key: str, fmt: str):
+        p = self.path(key, fmt)
+        try:
+            with open(p, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            return None
+        try:
+            os.utime(p)
+        except OSError:
+            pass
+        self.stats["hits"] += 1
+        return data
+
+    def put(self, key: str, fmt: str, data: bytes):
+        p = self.path(key, fmt)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, p)          # atomic: readers never see a partial file
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        for dirpath, _, names in os.walk(self.root):
+            for n in names:
+                if not n.endswith(".tmp"):
+                    yield os.path.join(dirpath, n)
+
+    def _scan_size(self) -> int:
+        total = 0
+        for p in self._files():
+            try:
+                total += os.path.getsize(p)
+            except OSError:
+                pass
+        return total
+
+    def _evict(self):
+        entries = []
+        for p in self._files():
+            try:
+                st_ = os.stat(p)
+            except OSError:
+                continue
+            entries.append((st_.st_mtime, st_.st_size, p))
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        target = self.max_bytes * 0.9
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(p)
+                total -= size
+                self.stats["evicted"] += 1
+            except OSError:
+                pass
+        self._size = total
+
+
+audio_cache = AudioCache()
+register_stats("tts_cache", lambda: audio_cache.stats)
+_synthesizers = {}
+
+
+def get_synthesizer(name: str = None) -> Synthesizer:
+    name = name or TTS_ENGINE
+    if name not in _synthesizers:
+        _synthesizers[name] = SYNTHESIZERS[name]()
+    return _synthesizers[name]
+
+
+def _audio_key(text: str, engine: str, lang: str, fmt: str):
+    """(synthesizer, output format, cache key) for `text`."""
+    synth = get_synthesizer(engine)
+    if fmt not in MIME or (fmt != synth.format and not shutil.which("ffmpeg")):
+        fmt = synth.format          # can't transcode: keep the engine's own format
+    return synth, fmt, AudioCache.make_key(synth.name, lang, fmt, text)
+
+
+def pronunciation_audio(text: str, engine: str = None, lang: str = TTS_LANG, fmt: str = TTS_FORMAT):
+    """
+    Audio bytes for `text`, rendered on first use and then served from the
+    disk cache. Returns (bytes, format). Blocks while rendering: pages use
+    cached_pronunciation() instead.
+    """
+    text = clean_text(text).strip()
+    synth, fmt, key = _audio_key(text, engine, lang, fmt)
+    data = audio_cache.get(key, fmt)
+    if data is None:
+        data = synth.synthesize(text, lang)
+        if fmt != synth.format:
+            data = transcode(data, synth.format, fmt)
+        audio_cache.put(key, fmt, data)
+    return data, fmt
+
+
+def cached_pronunciation(text: str, engine: str = None, lang: str = TTS_LANG,
+                         fmt: str = TTS_FORMAT) -> Optional[tuple]:
+    """(bytes, format) if `text` is already rendered, else None. Never synthesizes."""
+    try:
+        _, fmt, key = _audio_key(clean_text(text).strip(), engine, lang, fmt)
+    except Exception:
+        return None                 # engine not available here
+    data = audio_cache.get(key, fmt)
+    return (data, fmt) if data is not None else None
+
+
+_render_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts")
+_render_lock = threading.Lock()
+_rendering = set()  # texts queued or being rendered
+_failed_at = {}     # text -> monotonic time of the last failed render
+
+
+def _render(text: str, engine: str, lang: str, fmt: str):
+    try:
+        pronunciation_audio(text, engine, lang, fmt)
+        failed = None
+    except Exception:
+        failed = time.monotonic()   # offline / engine missing: retried after TTS_RETRY_AFTER
+    with _render_lock:
+        _rendering.discard(text)
+        if failed is None:
+            _failed_at.pop(text, None)
+        else:
+            _failed_at[text] = failed
+
+
+def prefetch_pronunciations(texts: List[str], engine: str = None, lang: str = TTS_LANG, fmt: str = TTS_FORMAT):
+    """Render the not-yet-cached texts in the background; returns right away."""
+    now = time.monotonic()
+    for text in texts:
+        text = clean_text(text).strip()
+        if not text or cached_pronunciation(text, engine, lang, fmt) is not None:
+            continue
+        with _render_lock:
+            failed = _failed_at.get(text)
+            if text in _rendering or (failed is not None and now - failed < TTS_RETRY_AFTER):
+                continue
+            _rendering.add(text)
+        _render_executor.submit(_render, text, engine, lang, fmt)
+
 
+def tts_player(texts: List[str], key: str):
+    """
+    Server-rendered pronunciation for a list of words or chunks: one picker for
+    the whole list and a single st.audio for the text being played. Audio is
+    prefetched in the background; a text that is not rendered yet says so.
+    """
+    texts = list(dict.fromkeys(clean_text(t).strip() for t in texts if t))
+    if not texts:
+        return
+    prefetch_pronunciations(texts)
+    choice = st.selectbox("🔊 Pronunciation", texts, index=None, key=key,
+                          placeholder="Pick one to hear it", label_visibility="collapsed")
+    if choice is None:
+        return
+    res = cached_pronunciation(choice)
+    if res is None:
+        st.caption("Audio is still being prepared, pick it again in a moment.")
+        return
+    data, fmt = res
+    st.audio(data, format=MIME[fmt], autoplay=True)
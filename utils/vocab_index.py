@@ -0,0 +1,257 @@
+# utils/vocab_index.py
+"""
+In-memory index over the read-mostly `words` table.
+
+Loaded once per process and shared by every session. Rows are kept sorted by
+(ranking, id) in parallel arrays, so rank filters are a bisect and results
+come out already in Browse order. Substring search uses a trigram index
+(trigram -> sorted row positions); queries shorter than 3 chars scan the
+lower-cased word list, which is still a tight in-memory loop.
+"""
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+NO_RANK = 2 ** 31 - 1          # NULL ranking sorts last, like ORDER BY ranking ASC in Postgres
+CHECK_EVERY = float(os.environ.get("VOCAB_INDEX_CHECK_SECONDS", 300))
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# Keyset cursor: (ranking, id) of a row; ranking None sorts last.
+Cursor = Tuple[Optional[int], int]
+
+
+class VocabPage(NamedTuple):
+    rows: List[tuple]
+    next_cursor: Optional[Cursor]     # pass as after= for the following page
+    prev_cursor: Optional[Cursor]     # pass as before= for the preceding page
+    total_estimate: int
+
+
+def cursor_of(row) -> Cursor:
+    return (row[4], row[0])
+
+
+def make_page(rows: List[tuple], limit: int, after: Cursor = None, before: Cursor = None,
+              total_estimate: int = 0) -> VocabPage:
+    """
+    rows: up to limit+1 rows in scan order (descending when paging back with
+    `before`); the extra row only tells whether another page exists.
+    """
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None and after is None:
+        rows.reverse()
+        prev_c = cursor_of(rows[0]) if more and rows else None
+        next_c = cursor_of(rows[-1]) if rows else before
+    else:
+        next_c = cursor_of(rows[-1]) if more and rows else None
+        prev_c = cursor_of(rows[0]) if after is not None and rows else None
+    return VocabPage(rows, next_c, prev_c, total_estimate)
+
+
+class VocabIndex:
+    def __init__(self, rows: Iterable[tuple], signature=None):
+        """rows: (id, word, phonetic, example, ranking, syllables) as in the words table."""
+        rows = sorted(rows, key=lambda r: (NO_RANK if r[4] is None else r[4], r[0]))
+        self.signature = signature
+        self.loaded_at = time.time()
+        self.ids = array("i", (r[0] for r in rows))
+        self.rankings = array("i", (NO_RANK if r[4] is None else r[4] for r in rows))
+        self.syllables = array("b", (int(r[5] or 0) for r in rows))   # 0 == unknown
+        self.words: List[str] = [r[1] for r in rows]
+        self.phonetics: List[Optional[str]] = [r[2] for r in rows]
+        self.examples: List[Optional[str]] = [r[3] for r in rows]
+        self._lower: List[str] = [w if w.islower() else w.lower() for w in self.words]   # share already-lower strings
+        self._n_ranked = bisect_left(self.rankings, NO_RANK)
+        self._syll_counts = Counter(self.syllables)
+
+        postings: Dict[str, array] = {}
+        for pos, w in enumerate(self._lower):
+            for g in trigrams(w):
+                p = postings.get(g)
+                if p is None:
+                    p = postings[g] = array("i")
+                p.append(pos)    # positions are appended in order -> each posting list is sorted
+        self._trigrams = postings
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, pos: int) -> tuple:
+        rank = self.rankings[pos]
+        return (self.ids[pos], self.words[pos], self.phonetics[pos], self.examples[pos],
+                None if rank == NO_RANK else rank, self.syllables[pos] or None)
+
+    def _rank_range(self, min_rank, max_rank):
+        lo, hi = 0, len(self.ids)
+        if min_rank is not None or max_rank is not None:
+            hi = self._n_ranked              # NULL rankings never satisfy a rank filter
+        if min_rank is not None:
+            lo = bisect_left(self.rankings, min_rank, 0, hi)
+        if max_rank is not None:
+            hi = bisect_right(self.rankings, max_rank, lo, hi)
+        return lo, hi
+
+    def _cursor_pos(self, cursor: Cursor) -> Tuple[int, int]:
+        """(first position >= cursor, first position > cursor) in (ranking, id) order."""
+        rank, wid = cursor
+        rank = NO_RANK if rank is None else rank
+        lo = bisect_left(self.rankings, rank)
+        hi = bisect_right(self.rankings, rank, lo)
+        return bisect_left(self.ids, wid, lo, hi), bisect_right(self.ids, wid, lo, hi)
+
+    def _candidates(self, q: str, lo: int, hi: int, reverse: bool = False) -> Iterable[int]:
+        if len(q) < 3:
+            span = range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)
+            return (pos for pos in span if q in self._lower[pos])
+        lists = []
+        for g in trigrams(q):
+            p = self._trigrams.get(g)
+            if p is None:
+                return ()
+            lists.append(p)
+        lists.sort(key=len)
+        # walk the rarest trigram's postings, check the rest by substring test
+        first = lists[0]
+        start, end = bisect_left(first, lo), bisect_left(first, hi)
+        lower = self._lower
+        span = reversed(first[start:end]) if reverse else first[start:end]
+        return (pos for pos in span if q in lower[pos])
+
+    def _estimate(self, q: Optional[str], lo: int, hi: int, syll_filter, n_excluded: int) -> int:
+        if q and len(q) >= 3:
+            lists = [self._trigrams.get(g, ()) for g in trigrams(q)]
+            first = min(lists, key=len)
+            n = bisect_left(first, hi) - bisect_left(first, lo) if first else 0
+        else:
+            n = hi - lo
+            if q and n:
+                # short substrings: test an evenly spaced sample of at most ~2000 rows
+                step = max(1, n // 2000)
+                sample = range(lo, hi, step)
+                n = sum(1 for pos in sample if q in self._lower[pos]) * n // len(sample)
+        if not len(self):
+            return 0
+        if syll_filter is not None:
+            n = n * self._syll_counts.get(syll_filter, 0) // len(self)
+        return n * max(0, len(self) - n_excluded) // len(self)   # assume the user's words are spread evenly
+
+    def search(self, query: str = None, limit: int = 25, min_rank: int = None, max_rank: int = None,
+               syll_filter: int = None, exclude_ids: Set[int] = frozenset()) -> List[tuple]:
+        return self.page(query, limit, min_rank, max_rank, syll_filter, exclude_ids).rows
+
+    def page(self, query: str = None, limit: int = 25, min_rank: int = None, max_rank: int = None,
+             syll_filter: int = None, exclude_ids: Set[int] = frozenset(),
+             after: Cursor = None, before: Cursor = None) -> VocabPage:
+        """
+        One page in (ranking, id) order. `after` / `before` are keyset cursors
+        from a previous VocabPage; the scan starts at the cursor by bisection,
+        so deep pages cost the same as the first one.
+        """
+        lo, hi = self._rank_range(min_rank, max_rank)
+        q = query.lower() if query else None
+        estimate = self._estimate(q, lo, hi, syll_filter, len(exclude_ids))
+        if after is not None:
+            lo = max(lo, self._cursor_pos(after)[1])
+        if before is not None:
+            hi = min(hi, self._cursor_pos(before)[0])
+        backward = before is not None and after is None
+        if q:
+            positions = self._candidates(q, lo, hi, reverse=backward)
+        else:
+            positions = range(hi - 1, lo - 1, -1) if backward else range(lo, hi)
+        out = []
+        for pos in positions:
+            if syll_filter is not None and self.syllables[pos] != syll_filter:
+                continue
+            if self.ids[pos] in exclude_ids:
+                continue
+            out.append(self.row(pos))
+            if len(out) > limit:
+                break
+        return make_page(out, limit, after, before, estimate)
+
+    def footprint(self) -> Dict[str, int]:
+        """Approximate memory use in bytes, per component."""
+        def strings(xs):
+            return sys.getsizeof(xs) + sum(sys.getsizeof(x) for x in xs if x is not None)
+        report = {
+            "rows": len(self.ids),
+            "ids": sys.getsizeof(self.ids),
+            "rankings": sys.getsizeof(self.rankings),
+            "syllables": sys.getsizeof(self.syllables),
+            "words": strings(self.words),
+            "words_lower": strings(self._lower),
+            "phonetics": strings(self.phonetics),
+            "examples": strings(self.examples),
+            "trigram_keys": sys.getsizeof(self._trigrams) + sum(sys.getsizeof(k) for k in self._trigrams),
+            "trigram_postings": sum(sys.getsizeof(p) for p in self._trigrams.values()),
+        }
+        report["total"] = sum(v for k, v in report.items() if k != "rows")
+        return report
+
+
+def load_vocab_index(conn) -> VocabIndex:
+    sig = words_signature(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT id, word, phonetic, example, ranking, syllables FROM words")
+    return VocabIndex(cur.fetchall(), signature=sig)
+
+
+def words_signature(conn):
+    """
+    Cheap change detector for the words table: row count, max id and the
+    insert/update/delete counters from pg_stat_user_tables.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT (SELECT count(*) FROM words), (SELECT max(id) FROM words),
+               (SELECT n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables
+                WHERE relid = 'words'::regclass)
+    """)
+    return tuple(cur.fetchone())
+
+
+_index: Optional[VocabIndex] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_vocab_index(conn) -> VocabIndex:
+    """
+    Process-wide index. Re-checks the words signature at most every
+    VOCAB_INDEX_CHECK_SECONDS and reloads when the table changed.
+    """
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < CHECK_EVERY:
+        return _index
+    with _lock:
+        if _index is not None and time.monotonic() - _checked_at < CHECK_EVERY:
+            return _index
+        if _index is None or words_signature(conn) != _index.signature:
+            _index = load_vocab_index(conn)
+        _checked_at = time.monotonic()
+        return _index
+
+
+def invalidate_vocab_index():
+    """Force a reload on next use (call after bulk-editing the words table)."""
+    global _index
+    with _lock:
+        _index = None
+
+
+def get_user_word_ids(conn, user_id: int) -> Set[int]:
+    cur = conn.cursor()
+    cur.execute("SELECT word_id FROM user_vocab WHERE user_id = %s", (user_id,))
+    return {r[0] for r in cur.fetchall()}
@@ -1,7 +1,10 @@
 # utils/vocab_utils.py
-from datetime import datetime, timedelta
+import os
+import json
 from typing import List
 import streamlit as st
+from .vocab_index import get_vocab_index, get_user_word_ids, make_page, Cursor, VocabPage
+from .write_behind import get_write_behind
 # from .state_utils import now_str
 
 # dic = pyphen.Pyphen(lang='en')
@@ -9,8 +12,48 @@ import streamlit as st
 def normalize_word(w: str) -> str:
     return w.strip().lower()
 
+# Serve Browse from the in-memory words index (utils/vocab_index.py); set VOCAB_INDEX=0 to query Postgres directly
+USE_VOCAB_INDEX = os.environ.get("VOCAB_INDEX", "1") != "0"
+
+def _pending(user_id: int, *ops):
+    """Write-behind ops of this user not yet in Postgres (empty when the queue is off)."""
+    queue = get_write_behind()
+    if queue is None:
+        return []
+    return [o for o in queue.pending(user_id) if not ops or o["op"] in ops]
+
 def search_vocab_for_user(conn, user_id: int, query: str = None, limit: int = 25,
-                          min_rank: int = None, max_rank: int = None, syll_filter: int = None):
+                          min_rank: int = None, max_rank: int = None, syll_filter: int = None,
+                          after: Cursor = None, before: Cursor = None) -> VocabPage:
+    """
+    One page of words the user hasn't added yet, in (ranking, id) order.
+    Pass page.next_cursor as `after` (or page.prev_cursor as `before`) to move
+    between pages; every filter is applied here, never by the caller.
+    """
+    if USE_VOCAB_INDEX:
+        try:
+            index = get_vocab_index(conn)
+            exclude = get_user_word_ids(conn, user_id)   # only the per-user part hits Postgres
+            queued = {o["word_id"] for o in _pending(user_id, "add")}
+            if queued:
+                exclude = exclude | queued
+            return index.page(query, limit=limit, min_rank=min_rank, max_rank=max_rank,
+                              syll_filter=syll_filter, exclude_ids=exclude, after=after, before=before)
+        except Exception:
+            conn.rollback()   # fall back to the SQL search below
+    return _search_vocab_sql(conn, user_id, query, limit, min_rank, max_rank, syll_filter, after, before)
+
+def _estimate_rows(cur, sql, params) -> int:
+    """Planner row estimate for `sql` (cheap stand-in for count(*))."""
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def _search_vocab_sql(conn, user_id: int, query: str = None, limit: int = 25,
+                      min_rank: int = None, max_rank: int = None, syll_filter: int = None,
+                      after: Cursor = None, before: Cursor = None) -> VocabPage:
     cur = conn.cursor()
     conditions = []
     params = [user_id]   # cho uv.user_id = %s
@@ -35,23 +78,58 @@ def search_vocab_for_user(conn, user_id: int, query: str = None, limit: int = 25
     
     conditions.append("uv.word_id IS NULL")
 
-    where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
-    sql = f"""SELECT w.id, w.word, w.phonetic, w.example, w.ranking, w.syllables
+    queued = [o["word_id"] for o in _pending(user_id, "add")]
+    if queued:
+        conditions.append("NOT (w.id = ANY(%s))")
+        params.append(queued)
+
+    base_sql = """SELECT w.id, w.word, w.phonetic, w.example, w.ranking, w.syllables
               FROM words w 
-              LEFT JOIN user_vocab uv ON w.id = uv.word_id AND uv.user_id = %s
-              {where_clause}
-              ORDER BY w.ranking ASC 
+              LEFT JOIN user_vocab uv ON w.id = uv.word_id AND uv.user_id = %s"""
+    estimate_params = tuple(params)
+    estimate_sql = f"{base_sql} WHERE {' AND '.join(conditions)}"
+
+    # Keyset condition on (ranking, id); NULL rankings come last (ASC NULLS LAST)
+    ranked_only = min_rank is not None or max_rank is not None
+    order = "w.ranking ASC, w.id ASC"
+    if after is not None:
+        rank, wid = after
+        if rank is None:
+            conditions.append("w.ranking IS NULL AND w.id > %s")
+            params.append(wid)
+        elif ranked_only:
+            conditions.append("(w.ranking, w.id) > (%s, %s)")
+            params += [rank, wid]
+        else:
+            conditions.append("((w.ranking, w.id) > (%s, %s) OR w.ranking IS NULL)")
+            params += [rank, wid]
+    elif before is not None:
+        rank, wid = before
+        if rank is None:
+            conditions.append("(w.ranking IS NOT NULL OR w.id < %s)")
+            params.append(wid)
+        else:
+            conditions.append("(w.ranking, w.id) < (%s, %s)")
+            params += [rank, wid]
+        order = "w.ranking DESC, w.id DESC"
+
+    sql = f"""{base_sql}
+              WHERE {' AND '.join(conditions)}
+              ORDER BY {order}
               LIMIT %s"""
 
-    params.append(limit)   # cuối cùng cho LIMIT %s
+    params.append(limit + 1)   # one extra row tells whether there is another page
 
 
     try:
         cur.execute(sql, tuple(params))
-        return cur.fetchall()
+        rows = cur.fetchall()
+        estimate = _estimate_rows(cur, estimate_sql, estimate_params)
+        return make_page(rows, limit, after, before, estimate)
     except Exception as e:
+        conn.rollback()
         st.error(f"❌ There is no word in your current vocab or you already learned it")
-        return []
+        return VocabPage([], None, None, 0)
     # cur.execute(sql, tuple(params))
     # return cur.fetchall()
 
@@ -62,14 +140,72 @@ def get_vocab_by_id(conn, vid: int):
     r = cur.fetchone()
     return r
 
+# Per-user deck versions in `users`, bumped in the same transaction as the change, so
+# every machine sees them. deck_version moves on any change and keys the cached word
+# lists (get_user_words). membership_version only moves when words are added or
+# learned, not on reviews: the pre-generated passages in passage_pool.py only depend
+# on which words are in the deck. Queued write-behind ops bump them when flushed.
+def get_deck_version(conn, user_id: int) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT deck_version FROM users WHERE id = %s", (user_id,))
+    r = cur.fetchone()
+    return r[0] if r else 0
+
+def get_membership_version(conn, user_id: int) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT membership_version FROM users WHERE id = %s", (user_id,))
+    r = cur.fetchone()
+    return r[0] if r else 0
+
+def _bump_deck_versions(cur, user_ids, membership_ids=()):
+    """Part of the caller's transaction: deck_version of `user_ids`, membership_version of `membership_ids`."""
+    cur.execute("""
+        UPDATE users SET deck_version = deck_version + 1,
+                         membership_version = membership_version + (id = ANY(%s))::int
+        WHERE id = ANY(%s)
+    """, (list(membership_ids), list(user_ids)))
+
 def add_user_vocab(conn, user_id: int, vocab_id: int):
+    queue = get_write_behind()
+    if queue is not None:
+        queue.enqueue("add", user_id, vocab_id)
+        return
     cur = conn.cursor()
+    _insert_user_vocab(cur, user_id, [vocab_id])
+    _bump_deck_versions(cur, [user_id], [user_id])
+    conn.commit()
+
+def _insert_user_vocab(cur, user_id: int, vocab_ids: List[int]):
     cur.execute("""
         INSERT INTO user_vocab (user_id, word_id, repetition_count, next_due, appearances)
-        VALUES (%s, %s, 0, DATE('now'), 0)
+        SELECT %s, w.id, 0, DATE('now'), 0 FROM unnest(%s::int[]) AS w(id)
         ON CONFLICT DO NOTHING;
-    """, (user_id, vocab_id))
-    conn.commit()
+    """, (user_id, list(vocab_ids)))
+
+# Upsert + reschedule in one statement (ladder: 1/3/7/14 days, failure -> tomorrow).
+# EXCLUDED.repetition_count carries the outcome (1 = success, 0 = failure) into
+# the DO UPDATE branch; the CASE there sees the row's values before the update.
+_REVIEW_UPSERT_SQL = """
+    INSERT INTO user_vocab AS uv (user_id, word_id, repetition_count, next_due, appearances, last_reviewed)
+    SELECT %(user_id)s, r.word_id, r.success::int, (now() AT TIME ZONE 'utc')::date + 1, 1,
+           (now() AT TIME ZONE 'utc')::date
+    FROM unnest(%(word_ids)s::int[], %(successes)s::bool[]) AS r(word_id, success)
+    ON CONFLICT (user_id, word_id) DO UPDATE SET
+        repetition_count = COALESCE(uv.repetition_count, 0) + EXCLUDED.repetition_count,
+        next_due = (now() AT TIME ZONE 'utc')::date + CASE
+            WHEN EXCLUDED.repetition_count = 0 THEN 1
+            WHEN COALESCE(uv.repetition_count, 0) + 1 = 1 THEN 1
+            WHEN COALESCE(uv.repetition_count, 0) + 1 = 2 THEN 3
+            WHEN COALESCE(uv.repetition_count, 0) + 1 = 3 THEN 7
+            ELSE 14
+        END,
+        appearances = COALESCE(uv.appearances, 0) + 1,
+        last_reviewed = EXCLUDED.last_reviewed
+    RETURNING word_id, repetition_count, next_due, appearances
+"""
+
+# Scheduling algorithm for reviews: ladder (the SQL above), sm2 or fsrs (utils/scheduler.py)
+SRS_ALGORITHM = os.environ.get("SRS_ALGORITHM", "ladder")
 
 def schedule_next_repetition(conn, user_id: int, vocab_id: int, success: bool):
     """
@@ -80,41 +216,140 @@ def schedule_next_repetition(conn, user_id: int, vocab_id: int, success: bool):
     - else => +14 days
     If failure (success==False), schedule back to tomorrow.
     Also increment appearances.
+    Adds the word to the user's list if needed; one statement, one commit.
+    Returns (repetition_count, next_due, appearances).
+    """
+    return record_review_session(conn, user_id, [(vocab_id, success)])[vocab_id]
+
+def record_review_session(conn, user_id: int, results):
+    """
+    Apply many (word_id, success) review results in one transaction.
+    Each distinct word is one row of a single set-based upsert; a word
+    reviewed several times in the session is applied again in a follow-up
+    statement, in order. Returns {word_id: (repetition_count, next_due, appearances)};
+    in write-behind mode the results are only queued and the values are None.
     """
+    results = list(results)
+    if not results:
+        return {}
+    queue = get_write_behind()
+    if queue is not None:
+        for word_id, success in results:
+            queue.enqueue("review", user_id, word_id, bool(success))
+        return {word_id: None for word_id, _ in results}   # applied later by the flusher
+    try:
+        state = _apply_review_results(conn, user_id, results)
+        _bump_deck_versions(conn.cursor(), [user_id])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return state
+
+def _apply_review_results(conn, user_id: int, results):
+    """The statements of record_review_session, without committing."""
+    rounds = []          # rounds[i] = {word_id: success} for the i-th review of each word
+    seen = {}
+    for word_id, success in results:
+        i = seen.get(word_id, 0)
+        seen[word_id] = i + 1
+        if i == len(rounds):
+            rounds.append({})
+        rounds[i][word_id] = bool(success)
+
+    scheduler = None
+    if rounds and SRS_ALGORITHM != "ladder":
+        from .scheduler import get_scheduler, apply_reviews   # NumPy only loaded when needed
+        scheduler = get_scheduler(SRS_ALGORITHM)
+
     cur = conn.cursor()
-    cur.execute("SELECT repetition_count, appearances FROM user_vocab WHERE user_id=%s AND word_id=%s", (user_id, vocab_id))
-    row = cur.fetchone()
-    if not row:
-        add_user_vocab(conn, user_id, vocab_id)
-        repetition_count = 0
-        appearances = 0
-    else:
-        repetition_count, appearances = row
-    if success:
-        repetition_count += 1
-        if repetition_count == 1:
-            delta = 1
-        elif repetition_count == 2:
-            delta = 3
-        elif repetition_count == 3:
-            delta = 7
+    state = {}
+    for batch in rounds:
+        if scheduler is not None:
+            rows = apply_reviews(conn, user_id, list(batch.items()), scheduler)
         else:
-            delta = 14
-    else:
-        delta = 1  # retry tomorrow
-    next_due = (datetime.utcnow() + timedelta(days=delta)).date().isoformat()
-    appearances += 1
-    cur.execute("""
-        UPDATE user_vocab SET repetition_count=%s, next_due=%s, appearances=%s WHERE user_id=%s AND word_id=%s
-    """, (repetition_count, next_due, appearances, user_id, vocab_id))
-    conn.commit()
+            cur.execute(_REVIEW_UPSERT_SQL, {
+                "user_id": user_id,
+                "word_ids": list(batch.keys()),
+                "successes": list(batch.values()),
+            })
+            rows = cur.fetchall()
+        for word_id, rep, next_due, appearances in rows:
+            state[word_id] = (rep, next_due, appearances)
+    return state
 
 def mark_word_confirmation(conn, user_id: int, vocab_id: int):
+    mark_words_learned(conn, user_id, [vocab_id])
+
+def mark_words_learned(conn, user_id: int, vocab_ids: List[int]):
+    queue = get_write_behind()
+    if queue is not None:
+        for vid in vocab_ids:
+            queue.enqueue("learned", user_id, vid)
+        return
     cur = conn.cursor()
-    cur.execute("UPDATE user_vocab SET learned=1 WHERE user_id=%s AND word_id=%s", (user_id, vocab_id))
+    _mark_learned(cur, user_id, vocab_ids)
+    _bump_deck_versions(cur, [user_id], [user_id])
     conn.commit()
 
+def _mark_learned(cur, user_id: int, vocab_ids: List[int]):
+    cur.execute("UPDATE user_vocab SET learned=1 WHERE user_id=%s AND word_id = ANY(%s)", (user_id, list(vocab_ids)))
+
+# Columns of get_user_words() rows
+USER_WORD_COLUMNS = ["word_id", "word", "phonetic", "example", "repetition_count", "next_due", "appearances", "learned"]
+
+_USER_WORD_ORDERS = {
+    "appearances": "uv.appearances DESC",                              # My Words
+    "next_due": "uv.next_due IS NOT NULL, uv.next_due",                # Spaced Review
+}
+
+# {order} is one of _USER_WORD_ORDERS (scripts/explain_hot_queries.py explains the same SQL)
+_USER_WORDS_SQL = """
+    SELECT v.id, v.word, v.phonetic, v.example, uv.repetition_count, uv.next_due, uv.appearances, uv.learned
+    FROM user_vocab uv JOIN words v ON uv.word_id = v.id
+    WHERE uv.user_id = %(user_id)s
+    ORDER BY {order}
+"""
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def _load_user_words(_conn, user_id: int, version: int, order: str):
+    cur = _conn.cursor()
+    cur.execute(_USER_WORDS_SQL.format(order=_USER_WORD_ORDERS[order]), {"user_id": user_id})
+    return cur.fetchall()
+
+def get_user_words(conn, user_id: int, order: str = "appearances"):
+    """
+    The user's whole list, cached per (user, deck version, order): reruns
+    and paging reuse it until add/review/mark-learned bumps the version.
+    """
+    rows = _load_user_words(conn, user_id, get_deck_version(conn, user_id), order)
+    pending = _pending(user_id)
+    return _overlay_pending(conn, rows, pending) if pending else rows
+
+def _overlay_pending(conn, rows, pending):
+    """Apply queued write-behind ops to get_user_words() rows (best effort: next_due is left as is)."""
+    by_id = {r[0]: list(r) for r in rows}
+    order = [r[0] for r in rows]
+    new_ids = [o["word_id"] for o in pending if o["op"] == "add" and o["word_id"] not in by_id]
+    if new_ids:
+        cur = conn.cursor()
+        cur.execute("SELECT id, word, phonetic, example FROM words WHERE id = ANY(%s)", (new_ids,))
+        for wid, word, phon, ex in cur.fetchall():
+            by_id[wid] = [wid, word, phon, ex, 0, None, 0, 0]
+            order.append(wid)
+    for o in pending:
+        r = by_id.get(o["word_id"])
+        if r is None:
+            continue
+        if o["op"] == "learned":
+            r[7] = 1
+        elif o["op"] == "review":
+            r[4] = (r[4] or 0) + int(o["success"])
+            r[6] = (r[6] or 0) + 1
+    return [tuple(by_id[wid]) for wid in order]
+
 def get_due_for_user(conn, user_id: int, limit: int = 10):
+    handled = {o["word_id"] for o in _pending(user_id, "review", "learned")}   # queued, not yet in Postgres
     cur = conn.cursor()
     cur.execute("""
         SELECT uv.id, v.id, v.word, v.phonetic, v.example, uv.repetition_count, uv.appearances
@@ -122,6 +357,6 @@ def get_due_for_user(conn, user_id: int, limit: int = 10):
         WHERE uv.user_id = %s AND (uv.next_due IS NULL OR DATE(uv.next_due) <= DATE('now')) AND uv.learned = 0
         ORDER BY uv.next_due
         LIMIT %s
-    """, (user_id, limit))
-    rows = cur.fetchall()
-    return rows
+    """, (user_id, limit + len(handled)))
+    rows = [r for r in cur.fetchall() if r[1] not in handled]
+    return rows[:limit]
@@ -0,0 +1,71 @@
+# utils/warmup.py
+"""
+Optional warm-up after boot (WARMUP=1).
+
+Streamlit only executes app.py when the first browser connects, so on a
+scale-to-zero machine the first learner pays for opening Postgres
+connections, loading the vocab index and importing the Gemini client. With
+WARMUP=1 the first script run starts this in a background thread instead:
+the login screen is drawn right away and the work overlaps with typing
+credentials. Each step is recorded as a "warmup ..." span.
+"""
+import logging
+import os
+import threading
+
+from database import get_pool
+from .tracing import span
+
+WARMUP = os.environ.get("WARMUP", "0") == "1"
+WARMUP_CONNECTIONS = int(os.environ.get("WARMUP_CONNECTIONS", 2))   # connections opened ahead of time
+WARMUP_LLM = os.environ.get("WARMUP_LLM", "1") != "0"
+
+logger = logging.getLogger("vocab.warmup")
+
+
+def warm_up(connections: int = WARMUP_CONNECTIONS, llm: bool = WARMUP_LLM):
+    """Open pool connections, load the vocab index and (optionally) the LLM client."""
+    pool = get_pool()
+    with span("warmup pool"):
+        held = []
+        try:
+            for _ in range(min(connections, pool.maxconn)):
+                held.append(pool.getconn())
+        finally:
+            for conn in held:
+                pool.putconn(conn)
+
+    from .vocab_utils import USE_VOCAB_INDEX
+    if USE_VOCAB_INDEX:
+        from .vocab_index import get_vocab_index
+        with span("warmup vocab index"), pool.connection() as conn:
+            get_vocab_index(conn)
+            conn.rollback()
+
+    if llm:
+        from .llm_utils import gemini
+        with span("warmup llm"):
+            gemini.warm_up()
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_warmup():
+    """Run warm_up() once per process in the background when WARMUP=1."""
+    global _started
+    if _started or not WARMUP:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    def run():
+        try:
+            warm_up()
+        except Exception:
+            logger.exception("warm-up failed")   # the app still works, just colder
+
+    threading.Thread(target=run, name="warmup", daemon=True).start()
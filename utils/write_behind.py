@@ -0,0 +1,307 @@
+# utils/write_behind.py
+"""
+Optional write-behind queue for the click-path mutations (add word, review,
+mark learned), enabled with WRITE_BEHIND=1.
+
+A click appends one JSON line to a local append-only log (fsync'd) and
+returns; a background thread drains the log to Postgres in batched
+transactions. Every op carries a sequence number, and the highest applied
+one is stored in `write_behind_applied` in the same transaction as the ops,
+so a restart replays exactly the ops that never reached Postgres - even if
+the process died between COMMIT and trimming the log.
+
+Reads see pending ops through `pending(user_id)` (see vocab_utils).
+
+The log must outlive the process: on Fly it has to be on a mounted volume
+(the root filesystem is replaced on every deploy), otherwise write-behind
+stays off and writes go straight to Postgres. The queue is drained at exit.
+If Postgres is unreachable, ops wait in the log. If one op keeps failing, it
+is moved to `<log>.dead` after WRITE_BEHIND_MAX_ATTEMPTS tries so the ops
+behind it are not blocked.
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+import psycopg2
+
+from database import pg_conn, PoolTimeout
+from .tracing import record, register_stats
+
+WRITE_BEHIND = os.environ.get("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_PATH = os.environ.get("WRITE_BEHIND_PATH", os.path.join(".cache", "write_behind.log"))
+WRITE_BEHIND_ID = os.environ.get("WRITE_BEHIND_ID", socket.gethostname())   # one id per log file
+WRITE_BEHIND_INTERVAL = float(os.environ.get("WRITE_BEHIND_INTERVAL", 0.5))
+WRITE_BEHIND_BATCH = int(os.environ.get("WRITE_BEHIND_BATCH", 500))
+WRITE_BEHIND_FSYNC = os.environ.get("WRITE_BEHIND_FSYNC", "1") != "0"
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.environ.get("WRITE_BEHIND_MAX_ATTEMPTS", 5))   # per op, then dead-letter
+
+# Postgres down / pool exhausted: nothing wrong with the ops, keep retrying them
+_UNAVAILABLE = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout)
+
+logger = logging.getLogger("vocab.write_behind")
+
+OPS = ("add", "review", "learned")
+
+
+class WriteBehindQueue:
+    def __init__(self, path: str = WRITE_BEHIND_PATH, queue_id: str = WRITE_BEHIND_ID,
+                 interval: float = WRITE_BEHIND_INTERVAL, batch_size: int = WRITE_BEHIND_BATCH,
+                 fsync: bool = WRITE_BEHIND_FSYNC, max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS):
+        self.path = path
+        self.dead_path = path + ".dead"
+        self.max_attempts = max_attempts
+        self.queue_id = queue_id
+        self.interval = interval
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._pending: List[dict] = []
+        self._seq = 0
+        self._file = None
+        self._thread = None
+        self._stop = False
+        self._isolate_until = 0        # after a failed batch, apply ops up to this seq one at a time
+        self._attempts = 0             # failed tries of the head op while isolating
+        self.stats = {"enqueued": 0, "flushed": 0, "batches": 0, "errors": 0, "replayed": 0, "dead_lettered": 0,
+                      "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0}
+
+    # --- startup / replay -------------------------------------------------
+
+    def start(self):
+        """Load un-applied ops from the log and start the flusher thread."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        applied = self._applied_seq()
+        ops = []
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        break              # torn last line from a crash mid-write
+                    if op["seq"] > applied:
+                        ops.append(op)
+        with self._lock:
+            self._pending = ops
+            self._seq = max([applied] + [op["seq"] for op in ops])
+            self.stats["replayed"] = len(ops)
+            self._rewrite_log()        # drop applied ops and any torn tail
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        return self
+
+    def _applied_seq(self) -> int:
+        with pg_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT seq FROM write_behind_applied WHERE queue_id = %s", (self.queue_id,))
+            row = cur.fetchone()
+            conn.commit()
+        return row[0] if row else 0
+
+    def _rewrite_log(self):
+        """Replace the log with just the pending ops (caller holds the lock)."""
+        if self._file is not None:
+            self._file.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for op in self._pending:
+                f.write(json.dumps(op) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a")
+
+    # --- producer side ----------------------------------------------------
+
+    def enqueue(self, op: str, user_id: int, word_id: int, success: bool = None):
+        if op not in OPS:
+            raise ValueError(f"unknown op {op!r}")
+        with self._lock:
+            self._seq += 1
+            rec = {"seq": self._seq, "op": op, "user_id": int(user_id), "word_id": int(word_id), "ts": time.time()}
+            if success is not None:
+                rec["success"] = bool(success)
+            self._file.write(json.dumps(rec) + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._pending.append(rec)
+            self.stats["enqueued"] += 1
+            if len(self._pending) >= self.batch_size:
+                self._wake.notify()
+        return rec
+
+    def pending(self, user_id: int) -> List[dict]:
+        """Ops of this user not yet in Postgres, oldest first."""
+        with self._lock:
+            return [op for op in self._pending if op["user_id"] == user_id]
+
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            oldest = self._pending[0]["ts"] if self._pending else None
+            out = dict(self.stats, depth=len(self._pending),
+                       oldest_pending_s=round(time.time() - oldest, 3) if oldest else 0.0)
+        out["avg_flush_ms"] = round(out["total_flush_ms"] / out["batches"], 2) if out["batches"] else 0.0
+        return out
+
+    # --- flusher ----------------------------------------------------------
+
+    def _run(self):
+        backoff = self.interval
+        failed = False
+        while True:
+            with self._lock:
+                if failed:
+                    # wait out the whole backoff, even with a full batch queued (enqueue keeps notifying)
+                    until = time.monotonic() + backoff
+                    while not self._stop and time.monotonic() < until:
+                        self._wake.wait(until - time.monotonic())
+                elif len(self._pending) < self.batch_size and not self._stop:
+                    self._wake.wait(self.interval)
+                if self._stop and not self._pending:
+                    return
+            try:
+                self.flush()
+                backoff, failed = self.interval, False
+                continue
+            except _UNAVAILABLE:
+                with self._lock:
+                    self.stats["errors"] += 1
+                if self._stop:
+                    return                           # Postgres unreachable: keep ops, retry later
+            except Exception as e:
+                with self._lock:
+                    self.stats["errors"] += 1
+                if self._stop:
+                    return                           # stays in the log for the next start
+                self._op_failed(e)
+            backoff = min(backoff * 2, 30.0)
+            failed = True
+
+    def _op_failed(self, error: Exception):
+        """A flush failed on the data: narrow it down to the op, dead-letter it after max_attempts."""
+        with self._lock:
+            if not self._pending:
+                return
+            head = self._pending[0]
+            if head["seq"] > self._isolate_until:
+                # retry the failed batch one op at a time to find the culprit
+                self._isolate_until = self._pending[min(self.batch_size, len(self._pending)) - 1]["seq"]
+                self._attempts = 0
+                return
+            self._attempts += 1
+            if self._attempts < self.max_attempts:
+                return
+            self._pending.pop(0)
+            self._attempts = 0
+            with open(self.dead_path, "a") as f:
+                f.write(json.dumps(dict(head, error=repr(error))) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._rewrite_log()            # so a restart doesn't replay it
+            self.stats["dead_lettered"] += 1
+        logger.error("write-behind op %s failed %d times, moved to %s: %r",
+                     head["seq"], self.max_attempts, self.dead_path, error)
+
+    def flush(self) -> int:
+        """Apply up to batch_size pending ops in one transaction. Returns ops applied."""
+        with self._lock:
+            isolating = self._pending and self._pending[0]["seq"] <= self._isolate_until
+            batch = self._pending[:1 if isolating else self.batch_size]
+        if not batch:
+            return 0
+        from .vocab_utils import _insert_user_vocab, _apply_review_results, _mark_learned, _bump_deck_versions
+
+        t = time.perf_counter()
+        with pg_conn() as conn:
+            cur = conn.cursor()
+            try:
+                # consecutive ops of the same kind and user become one statement, order is kept
+                i = 0
+                while i < len(batch):
+                    op, user_id = batch[i]["op"], batch[i]["user_id"]
+                    j = i
+                    while j < len(batch) and batch[j]["op"] == op and batch[j]["user_id"] == user_id:
+                        j += 1
+                    run = batch[i:j]
+                    if op == "add":
+                        _insert_user_vocab(cur, user_id, [o["word_id"] for o in run])
+                    elif op == "learned":
+                        _mark_learned(cur, user_id, [o["word_id"] for o in run])
+                    else:
+                        _apply_review_results(conn, user_id, [(o["word_id"], o["success"]) for o in run])
+                    i = j
+                _bump_deck_versions(cur, {o["user_id"] for o in batch},
+                                    {o["user_id"] for o in batch if o["op"] != "review"})
+                cur.execute("""
+                    INSERT INTO write_behind_applied (queue_id, seq, updated_at) VALUES (%s, %s, now())
+                    ON CONFLICT (queue_id) DO UPDATE SET seq = EXCLUDED.seq, updated_at = now()
+                """, (self.queue_id, batch[-1]["seq"]))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        ms = (time.perf_counter() - t) * 1000
+        record("write_behind flush", ms / 1000, ops=len(batch))
+
+        with self._lock:
+            del self._pending[:len(batch)]
+            self._attempts = 0
+            if not self._pending:
+                self._rewrite_log()        # everything applied: start a fresh log
+            self.stats["flushed"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["last_flush_ms"] = round(ms, 2)
+            self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], round(ms, 2))
+            self.stats["total_flush_ms"] += ms
+        return len(batch)
+
+    def close(self, timeout: float = 10.0):
+        """Stop the flusher after draining what it can within `timeout`."""
+        with self._lock:
+            self._stop = True
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_queue: Optional[WriteBehindQueue] = None
+_queue_lock = threading.Lock()
+
+
+def _durable(path: str) -> bool:
+    """False on Fly when `path` is not on a mounted volume (it would vanish at the next deploy)."""
+    if not os.environ.get("FLY_APP_NAME"):
+        return True
+    d = os.path.dirname(os.path.abspath(path))
+    while not os.path.ismount(d):
+        d = os.path.dirname(d)
+    return d != "/"
+
+
+def get_write_behind() -> Optional[WriteBehindQueue]:
+    """Process-wide queue when WRITE_BEHIND=1 (replays the log on first use), else None."""
+    global _queue, WRITE_BEHIND
+    if not WRITE_BEHIND:
+        return None
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                if not _durable(WRITE_BEHIND_PATH):
+                    logger.error("WRITE_BEHIND_PATH=%s is not on a volume; write-behind disabled", WRITE_BEHIND_PATH)
+                    WRITE_BEHIND = False
+                    return None
+                _queue = WriteBehindQueue().start()
+                atexit.register(_queue.close)    # drain on shutdown (Fly sends SIGINT; Streamlit exits cleanly)
+                register_stats("write_behind", _queue.metrics)
+    return _queue